@@ -0,0 +1,26 @@
+import io
+
+from mara_singer.targets import SingerTarget
+
+from conftest import singer_messages
+
+
+class _NullTarget(SingerTarget):
+    def prepare_table(self, table):
+        pass
+
+    def load_records(self, table, records):
+        pass
+
+
+def test_target_process(benchmark):
+    """The overhead of parsing, buffering and batching records in the targets of mara_singer"""
+    lines = singer_messages(50000, stream_count=5).decode().splitlines()
+
+    def process():
+        target = _NullTarget({}, output=io.StringIO())
+        target.process(lines)
+        return target
+
+    target = benchmark(process)
+    assert all(batch_sizer.batch_rows > 1000 for batch_sizer in target.batch_sizers.values())
@@ -0,0 +1,68 @@
+import json
+
+from mara_singer.catalog import SingerCatalog, SingerStream
+from mara_singer.singer import catalog as singer_catalog
+
+from conftest import deep_schema, stream_metadata, wide_catalog
+
+
+def test_catalog_load(benchmark, singer_dirs):
+    (singer_dirs / 'tap-benchmark.json').write_text(json.dumps(wide_catalog(stream_count=50, property_count=500)))
+
+    def load():
+        return SingerCatalog('tap-benchmark.json').streams
+
+    streams = benchmark(load)
+    assert len(streams) == 50
+
+
+def test_catalog_select_and_save(benchmark, singer_dirs):
+    (singer_dirs / 'tap-benchmark.json').write_text(json.dumps(wide_catalog(stream_count=50, property_count=500)))
+
+    def select_and_save():
+        catalog = SingerCatalog('tap-benchmark.json')
+        catalog.streams['stream_0'].mark_as_selected()
+        catalog.save(singer_dirs / 'tap-benchmark.json.selected')
+
+    benchmark(select_and_save)
+
+
+def test_stream_mark_as_selected(benchmark):
+    data = wide_catalog(stream_count=1, property_count=5000)['streams'][0]
+    property_names = [f'property_{i}' for i in range(0, 5000, 2)]
+
+    def mark_as_selected(stream):
+        stream.mark_as_selected(properties=property_names)
+
+    benchmark.pedantic(mark_as_selected, rounds=20,
+                       setup=lambda: ((SingerStream('stream_0', singer_catalog.Catalog.from_dict({'streams': [json.loads(json.dumps(data))]}).streams[0]),), {}))
+
+
+def test_stream_to_table_wide(benchmark):
+    catalog = singer_catalog.Catalog.from_dict(wide_catalog(stream_count=1, property_count=5000))
+    stream = SingerStream('stream_0', catalog.streams[0])
+
+    table = benchmark(stream._create_table)
+    assert len(table.columns) == 5000
+
+
+def test_stream_to_table_wide_cached(benchmark):
+    """to_table() for an unchanged schema loaded again, e.g. in a pipeline generator"""
+    data = wide_catalog(stream_count=1, property_count=5000)
+    SingerStream('stream_0', singer_catalog.Catalog.from_dict(data).streams[0]).to_table()
+
+    def to_table():
+        return SingerStream('stream_0', singer_catalog.Catalog.from_dict(data).streams[0]).to_table()
+
+    table = benchmark(to_table)
+    assert len(table.columns) == 5000
+
+
+def test_stream_to_table_deep(benchmark):
+    schema = deep_schema(depth=5, width=6)
+    catalog = singer_catalog.Catalog.from_dict({'streams': [
+        {"tap_stream_id": "deep", "stream": "deep", "schema": schema, "metadata": stream_metadata(schema)}]})
+    stream = SingerStream('deep', catalog.streams[0])
+
+    table = benchmark(stream._create_table)
+    assert len(table.columns) == 6
@@ -0,0 +1,42 @@
+import pytest
+
+from mara_singer.catalog import SingerStream
+from mara_singer.schema.coercion import coerce_records, compile_record_coercer
+
+
+SCHEMA = {
+    "type": ["null", "object"],
+    "properties": {
+        "id": {"type": "integer"},
+        "price": {"type": ["null", "number"]},
+        "active": {"type": ["null", "boolean"]},
+        "name": {"type": ["null", "string"]},
+        "updated_at": {"type": ["null", "string"], "format": "date-time"},
+        "tags": {"type": ["null", "array"], "items": {"type": "string"}},
+        "address": {"type": ["null", "object"], "properties": {
+            "city": {"type": ["null", "string"]},
+            "zip": {"type": ["null", "string"]}}}
+    }
+}
+
+RECORDS = [{"id": i, "price": i * 1.5, "active": i % 2 == 0, "name": f'name {i}', "updated_at": "2020-01-01T12:00:00.000000Z",
+            "tags": ["a", "b"], "address": {"city": "Berlin", "zip": "10115"}} for i in range(10000)]
+
+
+def test_coerce_records(benchmark):
+    coerce = compile_record_coercer(SingerStream.from_schema('users', SCHEMA, key_properties=['id']).to_table())
+
+    rows = benchmark(coerce_records, coerce, RECORDS)
+    assert len(rows) == 10000
+
+
+def test_jsonschema_validation(benchmark):
+    """The per-record validation done by most singer targets, for comparison"""
+    jsonschema = pytest.importorskip('jsonschema')
+    validator = jsonschema.Draft4Validator(SCHEMA, format_checker=jsonschema.FormatChecker())
+
+    def validate():
+        for record in RECORDS:
+            validator.validate(record)
+
+    benchmark(validate)
@@ -0,0 +1,21 @@
+
+from mara_singer import discovery
+
+from conftest import wide_catalog
+
+
+def test_merge_catalog(benchmark):
+    existing_catalog = wide_catalog(stream_count=20, property_count=2500)
+    for stream in existing_catalog['streams']:
+        for md in stream['metadata']:
+            md['metadata']['selected'] = True
+
+    discovered_catalog = wide_catalog(stream_count=20, property_count=2500)
+    for stream in discovered_catalog['streams']:
+        stream['schema']['properties']['property_1'] = {'type': ['null', 'integer']}
+        stream['schema']['properties']['new_property'] = {'type': ['null', 'string']}
+
+    catalog, diffs = benchmark(discovery.merge_catalog, existing_catalog, discovered_catalog)
+    assert diffs['stream_0'].properties == {'property_1': discovery.PropertyChange.RETYPED,
+                                            'new_property': discovery.PropertyChange.ADDED}
+    assert all(md['metadata']['selected'] for md in catalog['streams'][0]['metadata'])
@@ -0,0 +1,55 @@
+import tracemalloc
+
+from mara_singer.schema import jsonschema
+from mara_singer.singer.schema import Schema
+
+from conftest import deep_schema, wide_schema
+
+
+def test_property_definition_to_datatype_wide(benchmark):
+    schema = wide_schema(5000)
+
+    def to_datatype():
+        return jsonschema.property_defintion_to_datatype(schema)
+
+    benchmark(to_datatype)
+
+
+def test_property_definition_to_datatype_deep(benchmark):
+    schema = deep_schema(depth=6, width=5)
+
+    def to_datatype():
+        return jsonschema.property_defintion_to_datatype(schema)
+
+    benchmark(to_datatype)
+
+
+def test_schema_round_trip(benchmark):
+    schema = wide_schema(20000)
+
+    def round_trip():
+        return Schema.from_dict(schema).to_dict()
+
+    assert benchmark(round_trip) == schema
+
+
+def test_schema_round_trip_100k_properties(benchmark):
+    """A catalog stream with 100k properties, every 10th a nested object. The memory of the parsed schema is reported as extra info."""
+    properties = {}
+    for i in range(100000):
+        if i % 10 == 0:
+            properties[f'property_{i}'] = {"type": ["null", "object"], "properties": {
+                "id": {"type": "integer"},
+                "value": {"type": ["null", "number"], "description": "A nested value"}}}
+        else:
+            properties[f'property_{i}'] = {"type": ["null", "string"], "format": "date-time"}
+    schema = {"type": ["null", "object"], "properties": properties}
+
+    tracemalloc.start()
+    try:
+        Schema.from_dict(schema)
+        benchmark.extra_info['memory MiB'] = round(tracemalloc.get_traced_memory()[0] / 1024 / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+    assert benchmark.pedantic(lambda: Schema.from_dict(schema).to_dict(), rounds=3) == schema
@@ -0,0 +1,46 @@
+import io
+
+from mara_singer.logging import SingerTapReadLogThread
+from mara_singer.router import SingerMessageRouter
+from mara_singer.shell import singer_run_shell_command
+
+from conftest import singer_messages
+
+
+def test_router_throughput(benchmark):
+    data = singer_messages(record_count=100000, stream_count=10)
+
+    def pump():
+        router = SingerMessageRouter()
+        router.pump(io.BytesIO(data), io.BytesIO())
+        return router
+
+    router = benchmark(pump)
+    assert sum(router.record_counts.values()) == 100000
+
+
+def test_log_reader_throughput(benchmark):
+    log = ''.join(f'INFO Synced record {i}\n' if i % 100 else f'INFO METRIC: {{"type": "counter", "metric": "record_count", "value": {i}}}\n'
+                  for i in range(20000))
+
+    def read_log():
+        thread = SingerTapReadLogThread(process=None, stream=io.StringIO(log))
+        thread.run()
+        return thread
+
+    assert not benchmark(read_log).has_error
+
+
+def test_stdout_reader_throughput(benchmark, tmp_path):
+    messages_file_path = tmp_path / 'messages.jsonl'
+    messages_file_path.write_bytes(singer_messages(record_count=50000))
+
+    def read_stdout():
+        line_count = 0
+        def count_line(line):
+            nonlocal line_count
+            line_count += 1
+        assert singer_run_shell_command(f'cat {messages_file_path}', log_command=False, stdout_consumer=count_line)
+        return line_count
+
+    assert benchmark.pedantic(read_stdout, rounds=5) > 50000
@@ -0,0 +1,26 @@
+import json
+
+from mara_singer.state import SingerTapState
+
+from conftest import state_with_bookmarks
+
+
+def test_state_load(benchmark, singer_dirs):
+    (singer_dirs / 'tap-benchmark.json').write_text(json.dumps(state_with_bookmarks(5000)))
+
+    def load():
+        return SingerTapState('tap-benchmark').get_bookmark('stream_4999', 'id')
+
+    assert benchmark(load) == 4999
+
+
+def test_state_set_bookmarks_and_save(benchmark, singer_dirs):
+    (singer_dirs / 'tap-benchmark.json').write_text(json.dumps(state_with_bookmarks(5000)))
+    state = SingerTapState('tap-benchmark')
+
+    def set_bookmarks_and_save():
+        for i in range(0, 5000, 50):
+            state.set_stream_bookmarks(f'stream_{i}', {'id': i + 1})
+        state.save()
+
+    benchmark(set_bookmarks_and_save)
@@ -0,0 +1,86 @@
+"""Synthetic data generators for the benchmarks. Run the benchmarks with `make benchmark`."""
+
+import json
+import typing as t
+
+import pytest
+
+from mara_app.monkey_patch import patch
+
+from mara_singer import config
+
+
+def wide_schema(property_count: int) -> dict:
+    """A flat stream schema with many properties of mixed types"""
+    property_definitions = [
+        {"type": ["null", "integer"]},
+        {"type": ["null", "string"]},
+        {"type": ["null", "string"], "format": "date-time"},
+        {"type": ["null", "number"]},
+        {"type": ["null", "boolean"]},
+        {"type": ["null", "array"], "items": {"type": "string"}},
+    ]
+    return {
+        "type": ["null", "object"],
+        "properties": {f'property_{i}': dict(property_definitions[i % len(property_definitions)]) for i in range(property_count)}
+    }
+
+
+def deep_schema(depth: int, width: int) -> dict:
+    """A stream schema with nested objects"""
+    if depth == 0:
+        return {"type": ["null", "string"]}
+    return {
+        "type": ["null", "object"],
+        "properties": {f'level_{depth}_{i}': deep_schema(depth - 1, width) for i in range(width)}
+    }
+
+
+def stream_metadata(schema: dict, key_properties: t.List[str] = None) -> t.List[dict]:
+    metadata = [{"breadcrumb": [], "metadata": {"inclusion": "available", "table-key-properties": key_properties or []}}]
+    for property_name in schema['properties'].keys():
+        metadata.append({"breadcrumb": ["properties", property_name],
+                         "metadata": {"inclusion": "automatic" if property_name in (key_properties or []) else "available",
+                                      "selected-by-default": True}})
+    return metadata
+
+
+def wide_catalog(stream_count: int, property_count: int) -> dict:
+    """A catalog with many wide streams"""
+    streams = []
+    for i in range(stream_count):
+        schema = wide_schema(property_count)
+        streams.append({
+            "tap_stream_id": f'stream_{i}',
+            "stream": f'stream_{i}',
+            "key_properties": ['property_0'],
+            "schema": schema,
+            "metadata": stream_metadata(schema, key_properties=['property_0'])
+        })
+    return {"streams": streams}
+
+
+def state_with_bookmarks(bookmark_count: int) -> dict:
+    """A state with a bookmark for many streams"""
+    return {"bookmarks": {f'stream_{i}': {"updated_at": "2020-01-01T00:00:00.000000Z", "id": i} for i in range(bookmark_count)}}
+
+
+def singer_messages(record_count: int, stream_count: int = 1, state_interval: int = 1000) -> bytes:
+    """A singer message stream as written by a tap"""
+    lines = []
+    for i in range(stream_count):
+        lines.append(json.dumps({"type": "SCHEMA", "stream": f'stream_{i}', "schema": wide_schema(10), "key_properties": ["property_0"]}))
+    for i in range(record_count):
+        lines.append(json.dumps({"type": "RECORD", "stream": f'stream_{i % stream_count}',
+                                 "record": {f'property_{j}': i for j in range(10)}}))
+        if i % state_interval == 0:
+            lines.append(json.dumps({"type": "STATE", "value": {"bookmarks": {f'stream_{i % stream_count}': {"id": i}}}}))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+@pytest.fixture
+def singer_dirs(tmp_path):
+    """Points the catalog and state directories to a temp directory"""
+    patch(config.catalog_dir)(lambda: tmp_path)
+    patch(config.state_dir)(lambda: tmp_path)
+    return tmp_path
@@ -0,0 +1,286 @@
+"""
+Running many singer syncs (tap to target) in one asyncio event loop.
+
+Each sync starts its tap and target with `asyncio.create_subprocess_exec` and routes the messages in-process
+(see mara_singer.router), so no bash and no reader threads are needed per sync. At most `max_concurrency` syncs
+run at the same time. A sync which exceeds its timeout or is cancelled is stopped by killing the process groups
+of its tap and target, including any child processes they started.
+
+Usage from plain python:
+
+    from mara_singer.async_runner import SingerSync, run_syncs
+
+    results = run_syncs([SingerSync('tap-a', tap_command=['tap-a', '--config', 'a.json'],
+                                    target_command=['target-jsonl'], timeout=600),
+                         ...], max_concurrency=20)
+
+Or from within a running event loop: `await sync_all(syncs, max_concurrency=20)`.
+"""
+
+import asyncio
+import codecs
+import concurrent.futures
+import os
+import signal
+import sys
+import threading
+import time
+import typing as t
+
+from mara_pipelines.logging import logger
+
+from . import config
+from .logging import SingerLogHandler
+from .logging.forwarder import SingerLogForwarder
+from .metrics import SingerMetricsCollector
+from .router import SingerMessageRouter
+from .state import SingerStateCheckpointer
+
+
+class SingerSync:
+    def __init__(self, name: str, tap_command: t.List[str], target_command: t.List[str], timeout: float = None,
+                 state_checkpointer: SingerStateCheckpointer = None, metrics: SingerMetricsCollector = None) -> None:
+        """
+        A sync of a tap into a target
+
+        Args:
+            name: The name of the sync, used as log prefix
+            tap_command: The tap command and its arguments
+            target_command: The target command and its arguments
+            timeout: (optional) The maximum number of seconds the sync may take
+            state_checkpointer: (optional) When given, the states emitted by the target are written through the checkpointer
+            metrics: (optional) The collector to which the METRIC messages of the tap are added
+        """
+        self.name = name
+        self.tap_command = tap_command
+        self.target_command = target_command
+        self.timeout = timeout
+        self.state_checkpointer = state_checkpointer
+        self.metrics = metrics
+
+
+class SingerSyncResult:
+    def __init__(self, name: str) -> None:
+        """The outcome of a sync"""
+        self.name = name
+        self.succeeded = False
+        self.timed_out = False
+        self.cancelled = False
+        self.returncodes: t.Dict[str, t.Optional[int]] = {}
+        self.duration: t.Optional[float] = None
+
+        # the router holding the message statistics, None when the processes could not be started
+        self.router: t.Optional[SingerMessageRouter] = None
+
+    def __bool__(self) -> bool:
+        return self.succeeded
+
+
+async def _read_lines(stream: asyncio.StreamReader, line_handler: t.Callable[[str], None], chunk_size: int = 64 * 1024):
+    """Passes each line of a stream to a line handler. Unlike StreamReader.readline, lines of any length are supported."""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+    while True:
+        chunk = await stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + decoder.decode(chunk)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            line_handler(line + '\n')
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        line_handler(pending)
+
+
+async def _pump(source: asyncio.StreamReader, destination: asyncio.StreamWriter, router: SingerMessageRouter,
+                buffer_size: int) -> bool:
+    """Copies the messages from the tap to the target. Returns False when the target closed its input early."""
+    try:
+        while True:
+            chunk = await source.read(buffer_size)
+            if not chunk:
+                break
+            destination.write(chunk)
+            await destination.drain() # waits while the pipe to the target is full
+            router.add_chunk(chunk)
+        router.finish()
+        destination.close()
+        await destination.wait_closed()
+    except (BrokenPipeError, ConnectionResetError):
+        return False
+    return True
+
+
+def _kill_process_group(process: asyncio.subprocess.Process, sig: int):
+    try:
+        os.killpg(process.pid, sig) # the processes are started in a new session: the group id is the process id
+    except (ProcessLookupError, PermissionError):
+        pass # the group already exited
+
+
+async def _stop(processes: t.List[asyncio.subprocess.Process], kill_timeout: float):
+    """Terminates the process groups and kills them when they did not exit after kill_timeout seconds"""
+    for process in processes:
+        _kill_process_group(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(asyncio.gather(*[process.wait() for process in processes]), timeout=kill_timeout)
+    except asyncio.TimeoutError:
+        pass
+    for process in processes:
+        _kill_process_group(process, signal.SIGKILL)
+    await asyncio.gather(*[process.wait() for process in processes])
+
+
+async def _run(sync: SingerSync, result: SingerSyncResult, processes: t.List[asyncio.subprocess.Process],
+               buffer_size: int) -> bool:
+    prefix = f'[{sync.name}] '
+    loop = asyncio.get_event_loop()
+
+    # writing the state file blocks, so the checkpoints run in a thread; a single one keeps them in order
+    checkpoint_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if sync.state_checkpointer else None
+    checkpoint_errors = []
+
+    def checkpoint_done(future: asyncio.Future):
+        if not future.cancelled() and future.exception():
+            checkpoint_errors.append(future.exception())
+
+    def checkpoint(state: dict):
+        loop.run_in_executor(checkpoint_executor, sync.state_checkpointer.checkpoint, state).add_done_callback(checkpoint_done)
+
+    router = SingerMessageRouter(buffer_size=buffer_size, on_target_state=checkpoint if sync.state_checkpointer else None)
+    result.router = router
+
+    tap_process = await asyncio.create_subprocess_exec(
+        *[str(arg) for arg in sync.tap_command],
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, start_new_session=True)
+    processes.append(tap_process)
+    target_process = await asyncio.create_subprocess_exec(
+        *[str(arg) for arg in sync.target_command],
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, start_new_session=True)
+    processes.append(target_process)
+
+    forwarder = SingerLogForwarder()
+    tap_log_handler = SingerLogHandler(metrics=sync.metrics, forwarder=forwarder, prefix=prefix)
+    target_log_handler = SingerLogHandler(forwarder=forwarder, prefix=prefix)
+    readers = [asyncio.ensure_future(_read_lines(target_process.stdout, router.handle_target_output)),
+               asyncio.ensure_future(_read_lines(tap_process.stderr, tap_log_handler.handle_line)),
+               asyncio.ensure_future(_read_lines(target_process.stderr, target_log_handler.handle_line))]
+    try:
+        target_accepted_all = await _pump(tap_process.stdout, target_process.stdin, router, buffer_size)
+        if not target_accepted_all:
+            logger.log(prefix + 'The target closed its input before all messages were passed', is_error=True, format=logger.Format.ITALICS)
+            _kill_process_group(tap_process, signal.SIGTERM)
+
+        result.returncodes = {'tap': await tap_process.wait(), 'target': await target_process.wait()}
+        await asyncio.gather(*readers)
+
+        if sync.state_checkpointer:
+            # runs after all pending checkpoints
+            await loop.run_in_executor(checkpoint_executor, sync.state_checkpointer.flush)
+            if checkpoint_errors:
+                raise checkpoint_errors[0]
+    finally:
+        for reader in readers:
+            reader.cancel()
+        forwarder.close()
+        if checkpoint_executor:
+            checkpoint_executor.shutdown(wait=False)
+
+    for stream, record_count in router.record_counts.items():
+        logger.log(f'{prefix}{record_count} records routed for stream {stream}', format=logger.Format.ITALICS)
+
+    if tap_log_handler.has_error or target_log_handler.has_error:
+        logger.log(prefix + 'Singer tap error occured', is_error=True, format=logger.Format.ITALICS)
+        return False
+
+    for name, returncode in result.returncodes.items():
+        if returncode != 0:
+            logger.log(f'{prefix}{name} exit code {returncode}', is_error=True, format=logger.Format.ITALICS)
+            return False
+
+    return target_accepted_all
+
+
+async def sync_tap_to_target(sync: SingerSync, semaphore: asyncio.Semaphore = None, buffer_size: int = 1024 * 1024,
+                             kill_timeout: float = 5.0) -> SingerSyncResult:
+    """
+    Runs a sync of a tap into a target
+
+    Args:
+        sync: The sync
+        semaphore: (optional) A semaphore limiting the number of syncs running at the same time
+        buffer_size: The maximum number of bytes read from the tap at once
+        kill_timeout: The number of seconds the processes get to exit after SIGTERM on timeout or cancellation
+            before they are killed
+
+    Returns:
+        The result of the sync. Cancelling the coroutine stops the processes and re-raises the CancelledError.
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+
+    result = SingerSyncResult(sync.name)
+    async with semaphore:
+        logger.log(f'[{sync.name}] ' + ' '.join(str(arg) for arg in sync.tap_command) + ' | '
+                   + ' '.join(str(arg) for arg in sync.target_command), format=logger.Format.ITALICS)
+        start = time.monotonic()
+        processes: t.List[asyncio.subprocess.Process] = []
+        stopped = False
+        try:
+            result.succeeded = await asyncio.wait_for(_run(sync, result, processes, buffer_size), timeout=sync.timeout)
+            stopped = True
+        except asyncio.TimeoutError:
+            result.timed_out = True
+            logger.log(f'[{sync.name}] Timeout after {sync.timeout} seconds', is_error=True, format=logger.Format.ITALICS)
+        except asyncio.CancelledError:
+            result.cancelled = True
+            logger.log(f'[{sync.name}] Cancelled', is_error=True, format=logger.Format.ITALICS)
+            raise
+        except OSError as e:
+            logger.log(f'[{sync.name}] Could not start the sync: {e}', is_error=True, format=logger.Format.ITALICS)
+        except Exception as e: # a failing sync must not stop the others
+            logger.log(f'[{sync.name}] Sync failed: {e!r}', is_error=True, format=logger.Format.ITALICS)
+        finally:
+            if processes and not stopped:
+                await _stop(processes, kill_timeout)
+            result.duration = time.monotonic() - start
+    return result
+
+
+async def sync_all(syncs: t.List[SingerSync], max_concurrency: int = None, **kwargs) -> t.List[SingerSyncResult]:
+    """
+    Runs several syncs, at most max_concurrency at the same time. A failing sync does not stop the others.
+
+    Args:
+        syncs: The syncs
+        max_concurrency: (default: config.async_max_concurrency()) The maximum number of syncs running at the same time
+        **kwargs: Passed to sync_tap_to_target
+
+    Returns:
+        The results in the order of the syncs
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or config.async_max_concurrency())
+    return await asyncio.gather(*[sync_tap_to_target(sync, semaphore=semaphore, **kwargs) for sync in syncs])
+
+
+def _run_in_new_event_loop(coroutine: t.Awaitable):
+    """Runs a coroutine in a new event loop which is the current loop of the thread while it runs"""
+    loop = asyncio.new_event_loop()
+    # the child watcher of Python < 3.8 needs a current loop to which it is attached to get the exit codes of subprocesses
+    asyncio.set_event_loop(loop)
+    try:
+        if sys.version_info < (3, 8) and threading.current_thread() is threading.main_thread():
+            asyncio.get_child_watcher().attach_loop(loop)
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def run_syncs(syncs: t.List[SingerSync], max_concurrency: int = None, **kwargs) -> t.List[SingerSyncResult]:
+    """
+    Runs several syncs in a new event loop and blocks until all finished, see sync_all.
+    With Python < 3.8, it has to be called from the main thread (asyncio subprocesses need its child watcher).
+    """
+    return _run_in_new_event_loop(sync_all(syncs, max_concurrency=max_concurrency, **kwargs))
@@ -0,0 +1,128 @@
+"""
+Adaptive batch sizing for the record path from a tap to a target.
+
+The targets in mara_singer.targets use a `BatchSizer` per stream which adapts the number of records loaded at
+once to the observed row width and load latency: a batch should take about `batch_load_seconds` to load and the
+buffered records should not exceed `max_batch_bytes`.
+
+For external targets, the load latency can not be observed. `tuned_batch_config` derives `batch_size_rows` /
+`max_batch_rows` from the record rate and row width of previous runs recorded in the run ledger instead, see
+mara_singer.ledger. This is a heuristic based on the tap throughput, not on the load latency of the target.
+"""
+
+import statistics
+import typing as t
+
+from . import config
+
+
+class BatchSizer:
+    def __init__(self, max_rows: int = 100000, min_rows: int = 1000, max_bytes: int = 64 * 1024 * 1024,
+                 load_seconds: float = 5.0, smoothing: float = 0.3) -> None:
+        """
+        Adapts the batch size of a stream to the observed row width and load latency
+
+        Args:
+            max_rows: The maximum number of rows of a batch
+            min_rows: The number of rows of the first batch and the minimum number of rows of a batch
+            max_bytes: The maximum (serialized) size of a batch in bytes
+            load_seconds: The targeted number of seconds a batch takes to load
+            smoothing: The weight of the last observation in the moving averages of the row width and load rate
+        """
+        self.max_rows = max(1, max_rows)
+        self.min_rows = max(1, min(min_rows, self.max_rows))
+        self.max_bytes = max_bytes
+        self.load_seconds = load_seconds
+        self.smoothing = smoothing
+
+        self.row_width: t.Optional[float] = None # bytes per row
+        self.rows_per_second: t.Optional[float] = None # load rate
+        self.batch_rows = self.min_rows
+
+    def observe_load(self, rows: int, size: int, seconds: float):
+        """
+        Adds a loaded batch to the moving averages of the row width and load rate and adapts the batch size
+
+        Args:
+            rows: The number of rows of the batch
+            size: The serialized size of the batch in bytes
+            seconds: The duration of the load
+        """
+        if rows <= 0:
+            return
+        row_width = size / rows
+        rows_per_second = rows / max(seconds, 1e-3)
+        if self.rows_per_second is None:
+            self.row_width, self.rows_per_second = row_width, rows_per_second
+        else:
+            self.row_width += (row_width - self.row_width) * self.smoothing
+            self.rows_per_second += (rows_per_second - self.rows_per_second) * self.smoothing
+
+        # grow at most by factor 2 per batch: the fixed costs of a load make small batches look slow
+        batch_rows = min(int(self.rows_per_second * self.load_seconds), rows * 2)
+
+        max_rows = self.max_rows
+        if self.max_bytes and self.row_width:
+            max_rows = min(max_rows, max(1, int(self.max_bytes / self.row_width)))
+        self.batch_rows = max(min(batch_rows, max_rows), min(self.min_rows, max_rows))
+
+    def is_full(self, rows: int, size: int) -> bool:
+        """
+        If a batch should be loaded
+
+        Args:
+            rows: The number of buffered rows of the stream
+            size: The serialized size of the buffered rows in bytes
+        """
+        return rows >= self.batch_rows or size >= self.max_bytes
+
+
+def tuned_batch_config(tap_name: str, stream_names: t.List[str], max_batch_bytes: int = None,
+                       batch_load_seconds: float = None, history_size: int = 10) -> dict:
+    """
+    Returns the batch size config for an external target derived from the previous runs of the streams in the run ledger
+
+    The batch size is the number of rows the tap delivers in `batch_load_seconds` at the median record rate of the
+    previous runs, limited to `max_batch_bytes` at the average row width. The record rate is measured end-to-end
+    and is mostly determined by the tap (e.g. API throughput), so the target loads a batch about every
+    `batch_load_seconds`; how long a load takes is not taken into account. Since the config applies to all streams,
+    the smallest batch size of the streams is used.
+
+    Args:
+        tap_name: The tap command name
+        stream_names: The synced streams
+        max_batch_bytes: (default: config.max_batch_bytes()) The maximum size of a batch in bytes
+        batch_load_seconds: (default: config.batch_load_seconds()) The targeted number of seconds in which the tap delivers a batch
+        history_size: The number of previous runs taken into account
+
+    Returns:
+        A dict with the keys `batch_size_rows` (pipelinewise targets) and `max_batch_rows` (datamill targets), or
+        an empty dict when there is no run history
+    """
+    from .ledger import run_ledger
+
+    ledger = run_ledger()
+    if not ledger or not stream_names:
+        return {}
+
+    max_batch_bytes = max_batch_bytes or config.max_batch_bytes()
+    batch_load_seconds = batch_load_seconds or config.batch_load_seconds()
+
+    batch_sizes = []
+    for stream_name in stream_names:
+        history = ledger.stream_history(tap_name, stream_name, limit=history_size)
+        rates = [entry['records_per_second'] for entry in history if entry['records_per_second']]
+        if not rates:
+            continue
+        batch_size = statistics.median(rates) * batch_load_seconds
+
+        sized = [entry for entry in history if entry['byte_count'] and entry['record_count']]
+        if sized and max_batch_bytes:
+            row_width = sum(entry['byte_count'] for entry in sized) / sum(entry['record_count'] for entry in sized)
+            batch_size = min(batch_size, max_batch_bytes / row_width)
+        batch_sizes.append(max(int(batch_size), config.min_batch_rows()))
+
+    if not batch_sizes:
+        return {}
+    batch_size = min(min(batch_sizes), config.max_batch_rows())
+    return {'batch_size_rows': batch_size, 'max_batch_rows': batch_size}
@@ -1,14 +1,14 @@
+import copy
 import os
-import json
 import pathlib
 import enum
 import typing as t
 
 from .singer import catalog as singer_catalog
 from .singer import metadata as singer_metadata
-from .singer import schema as singer_schema
 
 from . import config
+from . import fastjson
 from .schema import Table
 
 class ReplicationMethod(enum.EnumMeta):
@@ -32,13 +32,13 @@ class SingerCatalog:
         if not self._catalog:
             file_path = self.catalog_file_path()
             if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
-                self._catalog = singer_catalog.Catalog.load(file_path)
+                self._catalog = singer_catalog.Catalog.from_dict(fastjson.load_file(file_path))
             else:
                 self._catalog = singer_catalog.Catalog(streams=[])
         return self._catalog
 
     @property
-    def streams(self) -> t.List[str]:
+    def streams(self) -> t.Dict[str, 'SingerStream']:
         if not self._streams:
             self._streams = {}
             catalog = self._load_catalog()
@@ -65,8 +65,7 @@ class SingerCatalog:
         if not catalog_file_path:
             catalog_file_path = self.catalog_file_path()
 
-        with open(catalog_file_path,'w') as catalog_file:
-            json.dump(self._catalog.to_dict(), catalog_file)
+        fastjson.dump_file(self._catalog.to_dict(), catalog_file_path)
 
 
 class SingerStream:
@@ -74,54 +73,100 @@ class SingerStream:
         self.name = name
         self.stream = stream
 
+        # cache for compiled metadata and schema
+        self._mdata = None
+        self._schema_dict = None
+        self._table_cache_key = None
+
+    @classmethod
+    def from_schema(cls, name: str, schema: dict, key_properties: t.List[str] = None) -> 'SingerStream':
+        """
+        Creates a stream with all properties selected from a JSON schema, e.g. from a singer SCHEMA message
+
+        Args:
+            name: The stream name
+            schema: The JSON schema of the stream records
+            key_properties: The key properties of the stream
+        """
+        entry = singer_catalog.CatalogEntry(
+            tap_stream_id=name,
+            stream=name,
+            key_properties=key_properties,
+            metadata=singer_metadata.get_standard_metadata(schema=schema, key_properties=key_properties))
+        entry.set_raw_schema(schema)
+
+        stream = cls(name=name, stream=entry)
+        stream.mark_as_selected(properties=list(schema.get('properties', {}).keys()))
+        return stream
+
+    def _metadata_map(self) -> dict:
+        """The compiled metadata of the stream. Cached until the selection is changed."""
+        if self._mdata is None:
+            self._mdata = singer_metadata.to_map(self.stream.metadata)
+        return self._mdata
+
+    def invalidate_cache(self):
+        """Resets the cached metadata and schema. Must be called after self.stream was modified directly."""
+        self._mdata = None
+        self._schema_dict = None
+        self._table_cache_key = None
+
     @property
     def key_properties(self) -> t.List[str]:
         """The key properties of the stream"""
         key_properties = self.stream.key_properties
         if not key_properties:
-            mdata = singer_metadata.to_map(self.stream.metadata)
+            mdata = self._metadata_map()
             key_properties = singer_metadata.get(mdata, (), 'table-key-properties') or singer_metadata.get(mdata, (), 'view-key-properties')
         return key_properties
 
     @property
     def schema(self):
-        """The JSON schema for the stream"""
-        return self.stream.schema.to_dict()
+        """The JSON schema for the stream. Returns a copy, see schema_dict for read-only access without copying."""
+        return copy.deepcopy(self.schema_dict)
+
+    @property
+    def schema_dict(self):
+        """The cached JSON schema for the stream. Read-only: it is shared with the catalog, do not modify it."""
+        if self._schema_dict is None:
+            self._schema_dict = self.stream.raw_schema
+        return self._schema_dict
 
     @property
     def is_selected(self):
-        mdata = singer_metadata.to_map(self.stream.metadata)
-        schema_dict = self.schema
+        schema_dict = self.schema_dict
         if 'selected' in schema_dict:
             return schema_dict['selected']
-        return singer_metadata.get(mdata, (), 'selected')
+        return singer_metadata.get(self._metadata_map(), (), 'selected')
 
     def property_is_selected(self, property_name: str):
-        mdata = singer_metadata.to_map(self.stream.metadata)
-        return singer_metadata.get(mdata, ('properties', property_name), 'selected')
+        return singer_metadata.get(self._metadata_map(), ('properties', property_name), 'selected')
 
     def unmark_as_selected(self):
-        schema_dict = self.schema
+        self._table_cache_key = None
+        schema_dict = self.schema_dict
         if 'selected' in schema_dict:
-            schema_dict['selected'] = False
-            self.stream.schema = singer_metadata.Schema.from_dict(schema_dict)
+            self.stream.set_raw_schema(dict(schema_dict, selected=False))
+            self._schema_dict = None
 
-        mdata = singer_metadata.to_map(self.stream.metadata)
+        mdata = self._metadata_map()
         if singer_metadata.get(mdata, (), 'selected'):
             mdata = singer_metadata.write(mdata, (), 'selected', False)
 
             # set properties to not selected
-            for metadata in singer_metadata.to_list(mdata):
-                if len(metadata.breadcrumb) == 2 and metadata.breadcrumb[1] == 'properties':
-                    if singer_metadata.get(mdata, metadata.breadcrumb, 'selected'):
-                        mdata = singer_metadata.write(mdata, (), 'selected', False)
+            for breadcrumb in mdata.keys():
+                if breadcrumb != () and singer_metadata.get(mdata, breadcrumb, 'selected'):
+                    mdata = singer_metadata.write(mdata, breadcrumb, 'selected', False)
 
             self.stream.metadata = singer_metadata.to_list(mdata)
 
     def mark_as_selected(self, properties: t.List[str] = None):
-        mdata = singer_metadata.to_map(self.stream.metadata)
+        self._table_cache_key = None
+        mdata = self._metadata_map()
         mdata = singer_metadata.write(mdata, (), 'selected', True)
 
+        selected_properties = set(properties or [])
+
         def breadcrumb_name(breadcrumb):
             name = ".".join(breadcrumb)
             name = name.replace('properties.', '')
@@ -137,11 +182,11 @@ class SingerStream:
                 if singer_metadata.get(mdata, breadcrumb, 'inclusion') == 'automatic':
                     selected = True
                 elif properties:
-                    selected = property_name in properties
+                    selected = property_name in selected_properties
                 elif singer_metadata.get(mdata, breadcrumb, 'selected-by-default'):
                     selected = True
 
-                if property_name in (properties or []):
+                if property_name in selected_properties:
                     selected = True
 
                 mdata = singer_metadata.write(mdata, breadcrumb, 'selected', selected)
@@ -150,21 +195,19 @@ class SingerStream:
 
         if not properties:
             # legacy implementation
-            schema_dict = self.schema
-            schema_dict['selected'] = True
-
-            self.stream.schema = singer_schema.Schema.from_dict(schema_dict)
+            self.stream.set_raw_schema(dict(self.schema_dict, selected=True))
+            self._schema_dict = None
 
     @property
     def replication_method(self) -> str:
         """Either FULL_TABLE, INCREMENTAL, or LOG_BASED. The replication method to use for a stream."""
 
         # check for deprecated way of saving the replication_method
-        replication_method = self.stream.to_dict().get('replication_method')
+        replication_method = self.stream.replication_method
         if replication_method: 
             return replication_method
 
-        mdata = singer_metadata.to_map(self.stream.metadata)
+        mdata = self._metadata_map()
         return singer_metadata.get(mdata, (), 'forced-replication-method') or singer_metadata.get(mdata, (), 'replication-method')
 
     @property
@@ -172,11 +215,11 @@ class SingerStream:
         """The name of a property in the source to use as a "bookmark". For example, this will often be an "updated-at" field or an auto-incrementing primary key (requires replication-method)."""
 
         # check for deprecated way of saving the replication_key
-        replication_key = self.stream.to_dict().get('replication_key')
+        replication_key = self.stream.replication_key
         if replication_key: 
             return replication_key
 
-        mdata = singer_metadata.to_map(self.stream.metadata)
+        mdata = self._metadata_map()
         return singer_metadata.get(mdata, (), 'replication-key')
 
     def to_table(self) -> Table:
@@ -184,22 +227,33 @@ class SingerStream:
         Creates a Table object from the JSON schema behind the singer stream
         Only the selected properties will be added as columns to the table. When no selection marks
         exist, the default selection applies
+
+        The tables are cached by a hash of the stream schema and metadata, see `mara_singer.schema.table_cache`.
+        The columns of the returned table are shared with the cache and must not be modified.
         """
-        schema_dict = self.schema
+        from .schema import table_cache
+
+        if self._table_cache_key is None:
+            self._table_cache_key = table_cache.table_cache_key(
+                self.name, self.schema_dict, self.stream.metadata, self.stream.key_properties)
+        return table_cache.table_cache().get_or_create(self._table_cache_key, self._create_table)
+
+    def _create_table(self) -> Table:
+        schema_dict = self.schema_dict
         if 'type' not in schema_dict or 'object' not in schema_dict['type']:
             raise Exception(f'The JSON schema for stream {self.name} must be of type object to be convertable to a SQL table')
 
         from .schema import jsonschema
         from .schema import Table
 
-        mdata = singer_metadata.to_map(self.stream.metadata)
+        mdata = self._metadata_map()
         schema_name = singer_metadata.get(mdata, (), 'schema-name')
 
         table = Table(
             table_name=self.name,
             schema_name=schema_name)
 
-        key_properties = self.key_properties or []
+        key_properties = set(self.key_properties or [])
 
         use_property_selection = self.is_selected
 
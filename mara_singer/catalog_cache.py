@@ -0,0 +1,142 @@
+"""
+A cache for catalogs with a stream selection applied, which are passed to the taps instead of the catalog file.
+
+The cached catalogs are stored in `config.catalog_dir() / '.selected'`. Their file names contain a hash of the
+source catalog file content and a hash of the stream selection, so a changed catalog never hits a stale entry:
+
+    {catalog file stem}.{selection hash}.{source catalog hash}.json
+
+When an entry for a changed source catalog is written, the entries of the previous catalog content with the same
+selection are removed. Beyond that, the least recently used entries are evicted when there are more than
+config.selected_catalog_cache_size() entries.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import typing as t
+
+from . import config
+
+
+# increase when the way a selection is applied changes to invalidate existing entries
+_CACHE_VERSION = 1
+
+_source_hashes: t.Dict[str, t.Tuple[int, int, str]] = {}
+_lock = threading.Lock()
+
+
+def cache_dir() -> pathlib.Path:
+    """The directory in which the selected catalogs are cached"""
+    return pathlib.Path(config.catalog_dir()) / '.selected'
+
+
+def source_catalog_hash(catalog_file_path: t.Union[str, pathlib.Path]) -> str:
+    """
+    Returns a hash of the content of a catalog file. The hash is kept in memory until the size or the
+    modification time of the file changes.
+    """
+    stat = os.stat(catalog_file_path)
+    with _lock:
+        cached = _source_hashes.get(str(catalog_file_path))
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(catalog_file_path, 'rb') as catalog_file:
+        for chunk in iter(lambda: catalog_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    source_hash = digest.hexdigest()
+    with _lock:
+        _source_hashes[str(catalog_file_path)] = (stat.st_size, stat.st_mtime_ns, source_hash)
+    return source_hash
+
+
+def selection_hash(stream_selection: t.Union[t.List[str], t.Dict[str, t.List[str]]], exclusive: bool = False) -> str:
+    """Returns a hash of a stream selection which does not depend on the order of the streams or properties"""
+    if isinstance(stream_selection, dict):
+        normalized = {stream_name: sorted(properties) if properties else None for stream_name, properties in stream_selection.items()}
+    else:
+        normalized = {stream_name: None for stream_name in stream_selection}
+    data = json.dumps([_CACHE_VERSION, normalized, exclusive], sort_keys=True)
+    return hashlib.blake2b(data.encode(), digest_size=10).hexdigest()
+
+
+def selected_catalog_file_path(catalog_file_name: str, stream_selection: t.Union[t.List[str], t.Dict[str, t.List[str]]],
+                               exclusive: bool = False) -> pathlib.Path:
+    """
+    Returns the path of the cached catalog for a stream selection. The file might not exist yet.
+
+    Args:
+        catalog_file_name: The source catalog file name in config.catalog_dir()
+        stream_selection: The stream selection, see _SingerTapReadCommand
+        exclusive: If the streams not in the stream selection are unmarked as selected
+    """
+    source_path = pathlib.Path(config.catalog_dir()) / catalog_file_name
+    source_hash = source_catalog_hash(source_path) if source_path.exists() else 'missing'
+    return cache_dir() / f'{source_path.stem}.{selection_hash(stream_selection, exclusive)}.{source_hash}.json'
+
+
+def selected_catalog(catalog_file_name: str, stream_selection: t.Union[t.List[str], t.Dict[str, t.List[str]]],
+                     write_catalog: t.Callable[[pathlib.Path], bool], exclusive: bool = False) -> t.Optional[pathlib.Path]:
+    """
+    Returns the path of the cached catalog for a stream selection and creates it on a cache miss
+
+    Args:
+        catalog_file_name: The source catalog file name in config.catalog_dir()
+        stream_selection: The stream selection, see _SingerTapReadCommand
+        write_catalog: A function writing the catalog with the selection applied to a file path. Returns False on failure.
+        exclusive: If the streams not in the stream selection are unmarked as selected
+
+    Returns:
+        The file path, or None when write_catalog failed
+    """
+    file_path = selected_catalog_file_path(catalog_file_name, stream_selection, exclusive=exclusive)
+    try:
+        os.utime(file_path) # the modification time is used for evicting the least recently used entries
+        return file_path
+    except FileNotFoundError:
+        pass
+
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file_path = file_path.parent / f'{file_path.name}.tmp-{os.getpid()}-{threading.get_ident()}'
+    try:
+        if not write_catalog(tmp_file_path):
+            return None
+        os.replace(tmp_file_path, file_path)
+    finally:
+        if tmp_file_path.exists():
+            os.remove(tmp_file_path)
+
+    _evict(file_path)
+    return file_path
+
+
+def _evict(file_path: pathlib.Path):
+    """Removes the entries of other source catalog versions with the same selection and the least recently used entries"""
+    stem, selection_key, _, _ = file_path.name.rsplit('.', 3)
+    for stale_file_path in file_path.parent.glob(f'{stem}.{selection_key}.*.json'):
+        if stale_file_path != file_path:
+            _remove(stale_file_path)
+
+    file_paths = []
+    for entry_file_path in file_path.parent.glob('*.json'):
+        try:
+            file_paths.append((entry_file_path.stat().st_mtime, entry_file_path))
+        except FileNotFoundError:
+            pass # removed by another process
+    max_size = config.selected_catalog_cache_size()
+    if len(file_paths) > max_size:
+        file_paths.sort()
+        for _, entry_file_path in file_paths[:len(file_paths) - max_size]:
+            if entry_file_path != file_path:
+                _remove(entry_file_path)
+
+
+def _remove(file_path: pathlib.Path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass # removed by another process
@@ -1,6 +1,8 @@
 """Command line interface for running singer default pipelines"""
 
 import sys
+import typing as t
+
 import click
 
 from mara_app.monkey_patch import patch
@@ -9,40 +11,62 @@ import mara_pipelines.ui.cli
 
 
 @click.command()
-@click.option('--tap-name', required=True,
-              help='The tap name, e.g. tap-exchangeratesapi')
+@click.option('--tap-name', required=True, multiple=True,
+              help='The tap name, e.g. tap-exchangeratesapi. Can be given several times to discover several taps in parallel.')
 @click.option('--config-file-name',
               help='The config file name in the singer config path. Default: <tap-name>.json',
               default=None)
 @click.option('--catalog-file-name',
               help='The destination catalog file name in the singer catalog path. Default: <tap-name>.json',
               default=None)
+@click.option('--max-workers', type=int,
+              help='The maximum number of taps discovering at the same time. Default: mara_singer.config.discover_max_workers()',
+              default=None)
 @click.option('--disable-colors', default=False, is_flag=True,
               help='Output logs without coloring them.')
-def discover(tap_name: str, config_file_name: str = None, catalog_file_name: str = None, disable_colors: bool = False):
-    """Run discover for a singer tap"""
+def discover(tap_name: t.Tuple[str], config_file_name: str = None, catalog_file_name: str = None, max_workers: int = None,
+             disable_colors: bool = False):
+    """Run discover for one or several singer taps"""
 
     from mara_pipelines.pipelines import Pipeline, Task
-    from .commands.singer import SingerTapDiscover
-
+    from .commands.singer import SingerTapDiscover, SingerTapsDiscover
 
+    tap_names = list(tap_name)
+    if len(tap_names) > 1 and (config_file_name or catalog_file_name):
+        print('The options --config-file-name and --catalog-file-name can only be used with a single tap', file=sys.stderr)
+        sys.exit(-1)
 
     pipeline = Pipeline(
         id='_singer',
         description="Internal Singer.io management pipeline")
 
-    tap_pipeline = Pipeline(
-        id=tap_name.replace('-','_'),
-        description=f'Package {tap_name}')
-
-    tap_pipeline.add(
-        Task(id='discover',
-             description=f'Reload the {tap_name} catalog',
-             commands=[
-                 SingerTapDiscover(tap_name=tap_name,
-                                   config_file_name=config_file_name,
-                                   catalog_file_name=catalog_file_name)
-             ]))
+    if len(tap_names) == 1:
+        pipeline_id = tap_names[0].replace('-','_')
+        tap_pipeline = Pipeline(
+            id=pipeline_id,
+            description=f'Package {tap_names[0]}')
+
+        tap_pipeline.add(
+            Task(id='discover',
+                 description=f'Reload the {tap_names[0]} catalog',
+                 commands=[
+                     SingerTapDiscover(tap_name=tap_names[0],
+                                       config_file_name=config_file_name,
+                                       catalog_file_name=catalog_file_name)
+                 ]))
+    else:
+        pipeline_id = 'taps'
+        tap_pipeline = Pipeline(
+            id=pipeline_id,
+            description='Package for several taps')
+
+        tap_pipeline.add(
+            Task(id='discover',
+                 description=f'Reload the catalogs of {", ".join(tap_names)}',
+                 commands=[
+                     SingerTapsDiscover(tap_names=tap_names,
+                                        max_workers=max_workers)
+                 ]))
 
     pipeline.add(tap_pipeline)
 
@@ -57,9 +81,9 @@ def discover(tap_name: str, config_file_name: str = None, catalog_file_name: str
     # the pipeline to run
     for node in pipeline.nodes:
         print(node)
-    pipeline, found = pipelines.find_node(['_singer',tap_name.replace('-','_')])
+    pipeline, found = pipelines.find_node(['_singer',pipeline_id])
     if not found:
-        print(f'Could not find pipeline. You have to add {tap_name} to config mara_singer.config.tap_names to be able to use this command', file=sys.stderr)
+        print(f'Could not find pipeline. You have to add {", ".join(tap_names)} to config mara_singer.config.tap_names to be able to use this command', file=sys.stderr)
         sys.exit(-1)
     if not isinstance(pipeline, pipelines.Pipeline):
         print(f'Internal error: Note is not a pipeline, but a {pipeline.__class__.__name__}', file=sys.stderr)
@@ -0,0 +1,209 @@
+import datetime
+import json
+import os
+import pathlib
+import typing as t
+
+from mara_pipelines.logging.logger import log
+from mara_pipelines.pipelines import Command
+from mara_page import _
+
+from .singer import _SingerTapReadCommand, unique_file_suffix
+from .. import config
+from ..catalog import ReplicationMethod, SingerCatalog
+from ..metrics import SingerMetricsCollector
+from ..schema.coercion import parse_datetime
+from ..singer import bookmarks as singer_bookmarks
+from ..state import SingerTapState
+
+
+def _to_datetime(value: t.Union[datetime.date, datetime.datetime]) -> datetime.datetime:
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def _parse_bookmark(value) -> t.Optional[datetime.datetime]:
+    """Parses a bookmark value into a date time with timezone, raises a ValueError when it is not a date time"""
+    if value is None or value == '':
+        return None
+    return _to_datetime(parse_datetime(value))
+
+
+def format_bookmark(value: datetime.datetime) -> str:
+    """Formats a date time as bookmark value, e.g. `2020-01-01T00:00:00Z`"""
+    return _to_datetime(value).astimezone(datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def bookmark_windows(start_date: t.Union[datetime.date, datetime.datetime], end_date: t.Union[datetime.date, datetime.datetime],
+                     window_count: int) -> t.List[t.Tuple[datetime.datetime, datetime.datetime]]:
+    """
+    Splits a date range into windows of the same length
+
+    Args:
+        start_date: The start of the range (inclusive). Dates and date times without timezone are taken as UTC.
+        end_date: The end of the range (exclusive)
+        window_count: The number of windows
+
+    Returns:
+        The start and end of each window
+    """
+    start_date, end_date = _to_datetime(start_date), _to_datetime(end_date)
+    if end_date <= start_date:
+        raise ValueError(f'The end date {end_date} must be after the start date {start_date}')
+    if window_count < 1:
+        raise ValueError('The window count must be at least 1')
+
+    window_length = (end_date - start_date) / window_count
+    boundaries = [start_date + window_length * i for i in range(window_count)] + [end_date]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+class SingerTapBackfill(Command):
+    def __init__(self, command: _SingerTapReadCommand, stream_name: str,
+                 start_date: t.Union[datetime.date, datetime.datetime], end_date: t.Union[datetime.date, datetime.datetime],
+                 window_count: int, max_parallel_windows: int = None,
+                 start_date_config_key: str = 'start_date', end_date_config_key: str = 'end_date') -> None:
+        """
+        Backfills an INCREMENTAL stream with a date time replication key by splitting the date range into windows
+        which are synced in parallel, each by its own tap and target process.
+
+        Each window gets a state with the window start as bookmark and a tap config with the window start and end.
+        The records are loaded by the target of the given command, e.g. a SingerTapToDB into a staging schema.
+        The states emitted by the targets are discarded; only when all windows succeeded, the bookmark of the stream
+        in the state file of the command is set to the end date.
+
+        Args:
+            command: The command of which the tap, catalog, state file and target are used
+            stream_name: The stream to backfill
+            start_date: The start of the backfill (inclusive). Dates and date times without timezone are taken as UTC.
+            end_date: The end of the backfill (exclusive)
+            window_count: The number of windows the date range is split into
+            max_parallel_windows: (default: window_count) The maximum number of windows synced at the same time
+            start_date_config_key: The tap config key for the start of a window
+            end_date_config_key: The tap config key for the end of a window. The tap must support it.
+        """
+        super().__init__()
+        self.command = command
+        self.stream_name = stream_name
+        self.start_date = start_date
+        self.end_date = end_date
+        self.window_count = window_count
+        self.max_parallel_windows = max_parallel_windows
+        self.start_date_config_key = start_date_config_key
+        self.end_date_config_key = end_date_config_key
+
+        # the metrics of the last run
+        self.metrics: t.Optional[SingerMetricsCollector] = None
+
+    def _replication_key(self) -> t.Optional[str]:
+        """Returns the replication key of the stream, or None when the stream can not be backfilled"""
+        catalog = SingerCatalog(self.command.catalog_file_name)
+        if self.stream_name not in catalog.streams:
+            log(message=f"Could not find stream '{self.stream_name}' in catalog for backfill", is_error=True)
+            return None
+
+        stream = catalog.streams[self.stream_name]
+        if stream.replication_method != ReplicationMethod.INCREMENTAL or not stream.replication_key:
+            log(message=f"The stream '{self.stream_name}' must use replication method {ReplicationMethod.INCREMENTAL} with a replication key for a backfill", is_error=True)
+            return None
+
+        property_definition = stream.schema_dict.get('properties', {}).get(stream.replication_key, {})
+        if property_definition.get('format') not in ['date-time', 'date']:
+            log(message=f"The replication key '{stream.replication_key}' of stream '{self.stream_name}' must be a date time for a backfill", is_error=True)
+            return None
+        return stream.replication_key
+
+    def run(self, *args, **kargs) -> bool:
+        import concurrent.futures
+        from .. import shell
+
+        replication_key = self._replication_key()
+        if not replication_key:
+            return False
+
+        stream_selection = ({self.stream_name: self.command.stream_selection[self.stream_name]}
+                            if isinstance(self.command.stream_selection, dict) and self.stream_name in self.command.stream_selection
+                            else [self.stream_name])
+        catalog_file_path = self.command._selected_catalog(stream_selection, exclusive=True)
+        if not catalog_file_path or not self.command._pre_run():
+            return False
+
+        windows = bookmark_windows(self.start_date, self.end_date, self.window_count)
+        tap_config = self.command.tap_config or {}
+        target_config = {}
+        self.command._create_target_config(target_config)
+        self.command._create_batch_config(target_config)
+
+        tmp_file_paths = []
+
+        def write_tmp_file(directory: pathlib.Path, file_name: str, content: dict) -> pathlib.Path:
+            file_path = pathlib.Path(directory) / f'{file_name}.tmp-{unique_file_suffix()}'
+            tmp_file_paths.append(file_path)
+            with open(file_path, 'w') as tmp_file:
+                json.dump(content, tmp_file)
+            return file_path
+
+        self.metrics = SingerMetricsCollector()
+        try:
+            target_command = self.command._target_executable() + [
+                '--config', str(write_tmp_file(config.config_dir(), f'{self.command._target_name()}.json', target_config))]
+
+            window_commands = []
+            for window_start, window_end in windows:
+                window_state = {}
+                singer_bookmarks.write_bookmark(window_state, self.stream_name, replication_key, format_bookmark(window_start))
+                window_tap_config = dict(tap_config, **{self.start_date_config_key: format_bookmark(window_start),
+                                                        self.end_date_config_key: format_bookmark(window_end)})
+                window_commands.append(
+                    [self.command.tap_name,
+                     '--config', str(write_tmp_file(config.config_dir(), self.command.config_file_name, window_tap_config)),
+                     '--state', str(write_tmp_file(config.state_dir(), f'{self.command.tap_name}.json', window_state)),
+                     '-p', str(catalog_file_path), '--catalog', str(catalog_file_path)])
+
+            def sync_window(tap_command: t.List[str]):
+                return shell.singer_run_tap_to_target(tap_command=tap_command, target_command=target_command,
+                                                      metrics=self.metrics)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_parallel_windows or len(windows)) as executor:
+                results = list(executor.map(sync_window, window_commands))
+        finally:
+            for file_path in tmp_file_paths:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+
+        failed_windows = [f'{format_bookmark(window_start)} - {format_bookmark(window_end)}'
+                          for (window_start, window_end), result in zip(windows, results) if not result]
+        if failed_windows:
+            log(message=f"Backfill of stream '{self.stream_name}' failed for windows: {', '.join(failed_windows)}. The bookmark was not changed.",
+                is_error=True)
+            return False
+
+        if self.command.state_file_name:
+            state = SingerTapState(self.command.tap_name, state_file_name=self.command.state_file_name)
+            bookmark_value = state.get_bookmark(self.stream_name, replication_key)
+            try:
+                bookmark = _parse_bookmark(bookmark_value)
+            except ValueError:
+                log(message=f"Bookmark {replication_key} of stream '{self.stream_name}' is not a date time: {bookmark_value!r}, kept it")
+                return True
+            if bookmark is None or bookmark < _to_datetime(self.end_date):
+                state.set_bookmark(self.stream_name, replication_key, format_bookmark(self.end_date))
+                state.save()
+                log(message=f"Bookmark {replication_key} of stream '{self.stream_name}' set to {format_bookmark(self.end_date)}")
+            else:
+                log(message=f"Bookmark {replication_key} of stream '{self.stream_name}' is already after the end date, kept it")
+        return True
+
+    def html_doc_items(self) -> t.List[t.Tuple[str, str]]:
+        return [
+            ('tap name', self.command.tap_name),
+            ('stream', _.tt[self.stream_name]),
+            ('start date', format_bookmark(self.start_date)),
+            ('end date', format_bookmark(self.end_date)),
+            ('window count', self.window_count),
+            ('max parallel windows', self.max_parallel_windows or self.window_count),
+            ('command', self.command.__class__.__name__)
+        ] + self.command.html_doc_items()
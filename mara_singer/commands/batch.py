@@ -0,0 +1,82 @@
+import typing as t
+
+from mara_pipelines.logging.logger import log
+from mara_pipelines.pipelines import Command
+from mara_page import _
+
+from .singer import _SingerTapReadCommand
+from .. import config
+
+
+class SingerTapBatch(Command):
+    def __init__(self, commands: t.List[_SingerTapReadCommand], max_concurrency: int = None, timeout: float = None) -> None:
+        """
+        Runs many read commands (e.g. SingerTapToDB, SingerTapToFile) in one asyncio event loop instead of one
+        pipeline node each, see mara_singer.async_runner. The messages are always routed in-process.
+
+        A failing command does not stop the others; the batch fails when one of the commands failed.
+
+        Args:
+            commands: The commands to run. Commands with parallel_streams are not supported.
+            max_concurrency: (default: config.async_max_concurrency()) The maximum number of commands running at the same time
+            timeout: (optional) The maximum number of seconds per command. When exceeded, the tap and target
+                processes of the command are killed.
+        """
+        super().__init__()
+        for command in commands:
+            if command._run_parallel():
+                raise ValueError(f'The command for tap {command.tap_name} uses parallel_streams, which is not supported in SingerTapBatch')
+        self.commands = commands
+        self._max_concurrency = max_concurrency
+        self.timeout = timeout
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency or config.async_max_concurrency()
+
+    def _sync_names(self) -> t.List[str]:
+        """The log prefix for each command: the tap name, numbered when a tap is used by several commands"""
+        tap_names = [command.tap_name for command in self.commands]
+        return [tap_name if tap_names.count(tap_name) == 1 else f'{tap_name}#{tap_names[:i].count(tap_name) + 1}'
+                for i, tap_name in enumerate(tap_names)]
+
+    def run(self, *args, **kargs) -> bool:
+        from ..async_runner import SingerSync, run_syncs
+
+        results = {}
+        prepared_commands = []
+        try:
+            syncs, sync_commands = [], {}
+            for name, command in zip(self._sync_names(), self.commands):
+                prepared_commands.append(command)
+                if not command._prepare_run():
+                    results[name] = False
+                    continue
+                syncs.append(SingerSync(name, tap_command=command.tap_command(), target_command=command.target_command(),
+                                        timeout=self.timeout, state_checkpointer=command._state_checkpointer(),
+                                        metrics=command.metrics))
+                sync_commands[name] = command
+
+            for result in run_syncs(syncs, max_concurrency=self.max_concurrency):
+                if result.router:
+                    sync_commands[result.name].ledger_run.add_router(result.router)
+                results[result.name] = result.succeeded
+        finally:
+            for name, command in zip(self._sync_names(), prepared_commands):
+                command._cleanup_run(results.get(name, False))
+
+        failed_names = [name for name in self._sync_names() if not results.get(name)]
+        if failed_names:
+            log(message=f"Sync failed for taps: {', '.join(failed_names)}", is_error=True)
+            return False
+        return True
+
+    def shell_command(self):
+        return '\n'.join(command.shell_command() for command in self.commands)
+
+    def html_doc_items(self) -> t.List[t.Tuple[str, str]]:
+        return [
+            ('commands', _.ul[[_.li[_.tt[command.__class__.__name__], ' ', command.tap_name] for command in self.commands]]),
+            ('max concurrency', self.max_concurrency),
+            ('timeout', f'{self.timeout} seconds' if self.timeout else None)
+        ]
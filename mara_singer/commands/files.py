@@ -1,6 +1,8 @@
 import enum
+import importlib.util
 import os
 import pathlib
+import sys
 import typing as t
 
 import mara_db.config
@@ -14,6 +16,7 @@ class FileFormat(enum.EnumMeta):
     """Different destination file formats"""
     CSV = 'csv'
     JSONL = 'jsonl'
+    PARQUET = 'parquet' # written by the target built into mara_singer, requires pyarrow
 
 class SingerTapToFile(_SingerTapReadCommand):
     def __init__(self,
@@ -26,7 +29,12 @@ class SingerTapToFile(_SingerTapReadCommand):
 
         # optional args for special calls; NOTE might be removed some day!
         use_state_file: bool = True,
-        pass_state_file: bool = True) -> None:
+        pass_state_file: bool = True,
+        use_router: bool = False,
+        state_checkpoint_interval: float = None,
+
+        # optional args for compressed and rotated CSV/JSONL files
+        compression: str = None, max_file_size: int = None, max_file_records: int = None) -> None:
         """
         Reads data from a singer.io tab and writes the content to file per stream.
 
@@ -41,34 +49,71 @@ class SingerTapToFile(_SingerTapReadCommand):
             state_file_name: (default: {tap_name}.json) The state file name
             use_state_file: (default: True) If the state file name should be passed to the tap command
             pass_state_file: (default: False) If the state file shall be passed to the tap. Is only passed when state_file_name is given.
+            use_router: (default: False) Run tap and target as two processes and route the messages in-process instead of using a bash pipe
+            state_checkpoint_interval: (default: config.state_checkpoint_interval()) The minimal number of seconds between two writes of the state file while the tap is running.
+            compression: (default: None) Compress the CSV/JSONL files with 'gzip' or 'zstd' (requires zstandard)
+            max_file_size: (default: None) Start a new numbered part file when a file exceeds this (compressed) number of bytes
+            max_file_records: (default: None) Start a new numbered part file when a file reaches this number of records
+
+        When compression, max_file_size or max_file_records is given, the CSV/JSONL files are written by the target
+        built into mara_singer, which writes the part files `{stream}.part-00001.jsonl.gz`, ... and a manifest
+        `{stream}.manifest.json` listing the parts with row counts and byte sizes.
         """
         super().__init__(tap_name,
             stream_selection=stream_selection,
             config=config, config_file_name=config_file_name,
             catalog_file_name=catalog_file_name if catalog_file_name else f'{tap_name}.json',
             state_file_name=state_file_name if state_file_name else (f'{tap_name}.json' if use_state_file else None),
-            pass_state_file=pass_state_file)
+            pass_state_file=pass_state_file,
+            use_router=use_router,
+            state_checkpoint_interval=state_checkpoint_interval)
 
         self.target_format = target_format
+        self.compression = compression
+        self.max_file_size = max_file_size
+        self.max_file_records = max_file_records
 
         self.destination_dir = destination_dir
 
-    def catalog_file_path(self) -> pathlib.Path:
-        path = super().catalog_file_path()
-        if self.stream_selection:
-            path = pathlib.Path(f'{path}.tmp')
-        return path
+    def _use_file_sink(self) -> bool:
+        """If the CSV/JSONL files are written by the target built into mara_singer"""
+        return self.target_format != FileFormat.PARQUET and bool(self.compression or self.max_file_size or self.max_file_records)
 
     def destination_path(self) -> pathlib.Path:
         return pathlib.Path(config.data_dir()) / self.destination_dir
 
     def _target_name(self):
+        if self._use_file_sink():
+            return 'mara-singer-targets-files'
         return {
             FileFormat.CSV: 'target-csv',
-            FileFormat.JSONL: 'target-jsonl'
+            FileFormat.JSONL: 'target-jsonl',
+            FileFormat.PARQUET: 'mara-singer-targets-parquet'
         }[self.target_format]
 
+    def _target_executable(self) -> t.List[str]:
+        if self.target_format == FileFormat.PARQUET:
+            return [sys.executable, '-m', 'mara_singer.targets.parquet']
+        if self._use_file_sink():
+            return [sys.executable, '-m', 'mara_singer.targets.files']
+        return super()._target_executable()
+
+    def _adaptive_batching(self) -> bool:
+        return self.target_format == FileFormat.PARQUET or self._use_file_sink()
+
     def _create_target_config(self, config: dict):
+        if self._use_file_sink():
+            config.update({
+                'destination_path': f'{self.destination_path()}',
+                'format': {FileFormat.CSV: 'csv', FileFormat.JSONL: 'jsonl'}[self.target_format],
+                'compression': self.compression,
+                'max_file_size': self.max_file_size,
+                'max_file_records': self.max_file_records,
+                'delimiter': '\t',
+                'quotechar': '"'
+            })
+            return
+
         if self.target_format == FileFormat.JSONL:
             config.update({
                 'destination_path': f'{self.destination_path()}',
@@ -83,15 +128,27 @@ class SingerTapToFile(_SingerTapReadCommand):
                 'destination_path': f'{self.destination_path()}'
             })
 
+        if self.target_format == FileFormat.PARQUET:
+            config.update({
+                'destination_path': f'{self.destination_path()}',
+                'compression': 'zstd'
+            })
+
     def _pre_run(self) -> bool:
         if not os.path.exists(self.destination_path()):
             log(message=f"The destination path '{self.destination_path()}' does not exist.", is_error=True)
             return False
+        if self.target_format == FileFormat.PARQUET and not importlib.util.find_spec('pyarrow'):
+            log(message="The target format parquet requires pyarrow. Install it via `pip install mara-singer[parquet]`", is_error=True)
+            return False
         return True
 
     def html_doc_items(self) -> t.List[t.Tuple[str, str]]:
         doc = super().html_doc_items() + [
             ('taget format', self.target_format),
-            ('destination dir', self.destination_dir)
+            ('destination dir', self.destination_dir),
+            ('compression', self.compression),
+            ('max file size', self.max_file_size),
+            ('max file records', self.max_file_records)
         ]
         return doc
@@ -4,11 +4,16 @@ import pathlib
 import typing as t
 
 
+from mara_pipelines.logging import logger
 from mara_pipelines.logging.logger import log
 from mara_pipelines.pipelines import Command
-from mara_page import _, html
+from mara_page import _, bootstrap, html
 
 from ..catalog import SingerCatalog
+from ..ledger import SingerRun, run_ledger
+from .. import batching, catalog_cache
+from ..metrics import SingerMetricsCollector
+from ..state import SingerTapState, SingerStateCheckpointer
 from .. import config
 
 def unique_file_suffix() -> str:
@@ -37,6 +42,9 @@ class _SingerTapCommand(Command):
         self.catalog_file_name = catalog_file_name
         self.__tmp_config_file_path = None
 
+        # the metrics of the last run
+        self.metrics: t.Optional[SingerMetricsCollector] = None
+
     def _patch_tap_config(self, config: dict):
         """A method which is called before writing the patched config"""
         pass
@@ -68,11 +76,22 @@ class _SingerTapCommand(Command):
         Returns:
             False on failure
         """
-        from .. import shell
-        shell_command = self.shell_command()
+        succeeded = False
+        try:
+            if self._prepare_run():
+                succeeded = bool(self._execute())
+            return succeeded
+        finally:
+            self._cleanup_run(succeeded)
 
+    def _prepare_run(self) -> bool:
+        """
+        Creates the temp files of a run. `_cleanup_run` must be called afterwards, also when this fails.
+
+        Returns:
+            False when the run can not be started
+        """
         # create temp tap config file
-        tmp_config_file_path = None
         if self._tap_config:
             tmp_config_file_path = self.config_file_path()
             tap_config = self.tap_config
@@ -82,14 +101,33 @@ class _SingerTapCommand(Command):
             log(message=f"The tap config '{self.config_file_path()}' does not exist.", is_error=True)
             return False
 
-        try:
-            result = shell.singer_run_shell_command(shell_command)
-        finally:
-            if self._tap_config:
-                os.remove(tmp_config_file_path)
-                self.__tmp_config_file_path = None
+        self.metrics = SingerMetricsCollector()
+        return True
 
-        return result
+    def _cleanup_run(self, succeeded: bool):
+        """Removes the temp files of a run"""
+        if self.__tmp_config_file_path:
+            if os.path.exists(self.__tmp_config_file_path):
+                os.remove(self.__tmp_config_file_path)
+            self.__tmp_config_file_path = None
+        if self.metrics:
+            self._log_metrics()
+
+    def _execute(self):
+        """Executes the command after the temp config files have been created"""
+        from .. import shell
+        return shell.singer_run_shell_command(self.shell_command(), metrics=self.metrics)
+
+    def _log_metrics(self):
+        """Logs a summary of the metrics reported by the tap"""
+        for summary in self.metrics.stream_summaries():
+            message = f"{summary['stream']}: {summary['records']} records"
+            if summary['records per second'] is not None:
+                message += f", {summary['records per second']:.1f} records/s"
+            if summary['http requests']:
+                message += (f", {summary['http requests']} http requests"
+                            + f" (p50 {summary['http request duration p50']:.3f}s, p95 {summary['http request duration p95']:.3f}s)")
+            log(message=message)
 
     def config_file_path(self) -> pathlib.Path:
         if self._tap_config:
@@ -105,7 +143,13 @@ class _SingerTapCommand(Command):
     def catalog_file_path(self) -> pathlib.Path:
         return pathlib.Path(config.catalog_dir()) / self.catalog_file_name
 
-    def shell_command(self):
+    def tap_command(self, catalog_file_path: pathlib.Path = None) -> t.List[str]:
+        """
+        The tap command and its arguments
+
+        Args:
+            catalog_file_path: (default: catalog_file_path()) The catalog file passed to the tap
+        """
         config_file_path = self.config_file_path()
         if self._tap_config:
             if self.__tmp_config_file_path:
@@ -117,10 +161,16 @@ class _SingerTapCommand(Command):
         if self.state_file_name and os.path.exists(self.state_file_path()) and os.stat(self.state_file_path()).st_size != 0:
             state_file_path = self.state_file_path()
 
-        return (f'{self.tap_name}'
-                + f' --config {config_file_path}'
-                + (f' --state {state_file_path}' if state_file_path and self.pass_state_file else '')
-                + (f' -p {self.catalog_file_path()} --catalog {self.catalog_file_path()}' if self.catalog_file_name else ''))
+        command = [self.tap_name, '--config', str(config_file_path)]
+        if state_file_path and self.pass_state_file:
+            command += ['--state', str(state_file_path)]
+        if self.catalog_file_name:
+            catalog_file_path = catalog_file_path or self.catalog_file_path()
+            command += ['-p', str(catalog_file_path), '--catalog', str(catalog_file_path)]
+        return command
+
+    def shell_command(self):
+        return ' '.join(self.tap_command())
 
     def html_doc_items(self) -> t.List[t.Tuple[str, str]]:
         config_file_content = self.config_file_path().read_text().strip('\n') if self.config_file_path().exists() else '-- file not found'
@@ -147,13 +197,22 @@ class _SingerTapCommand(Command):
 
         return doc
 
+    @staticmethod
+    def _format_metric(value) -> str:
+        if value is None:
+            return ''
+        if isinstance(value, float):
+            return f'{value:.3f}'
+        return str(value)
+
 
 class _SingerTapReadCommand(_SingerTapCommand):
     """A base command for interacting with a singer tab to read data"""
 
     def __init__(self, tap_name: str, stream_selection: t.Union[t.List[str], t.Dict[str, t.List[str]]] = None,
         config: dict = None, config_file_name: str = None,
-        catalog_file_name: str = None, state_file_name: str = None, use_state_file: bool = True, pass_state_file: bool = False) -> None:
+        catalog_file_name: str = None, state_file_name: str = None, use_state_file: bool = True, pass_state_file: bool = False,
+        use_router: bool = False, parallel_streams: int = None, state_checkpoint_interval: float = None) -> None:
         super().__init__(tap_name,
             config=config, config_file_name=config_file_name,
             catalog_file_name=catalog_file_name if catalog_file_name else f'{tap_name}.json',
@@ -161,17 +220,37 @@ class _SingerTapReadCommand(_SingerTapCommand):
             pass_state_file=pass_state_file)
 
         self.stream_selection = stream_selection
-        self.__tmp_catalog_file_path = None
+        self.use_router = use_router
+        self.parallel_streams = parallel_streams
+        self._state_checkpoint_interval = state_checkpoint_interval
+        self.__selected_catalog_file_path = None
         self.__target_config_path = None
+
+        # the ledger entry of the last run
+        self.ledger_run: t.Optional[SingerRun] = None
  
     def catalog_file_path(self) -> pathlib.Path:
         path = super().catalog_file_path()
         if self.stream_selection:
-            if not self.__tmp_catalog_file_path:
-                self.__tmp_catalog_file_path = pathlib.Path(f'{path}.tmp-{unique_file_suffix()}')
-            path = self.__tmp_catalog_file_path
+            if self.__selected_catalog_file_path:
+                path = self.__selected_catalog_file_path
+            else: # this is only for UI display. In a real run, the catalog is taken from the cache or created
+                path = catalog_cache.selected_catalog_file_path(self.catalog_file_name, self.stream_selection)
         return path
 
+    def _selected_catalog(self, stream_selection: t.Union[t.List[str], t.Dict[str, t.List[str]]],
+                          exclusive: bool = False) -> t.Optional[pathlib.Path]:
+        """
+        Returns the path of a catalog with the stream selection applied, see mara_singer.catalog_cache
+
+        Returns:
+            The file path, or None when a selected stream does not exist in the catalog
+        """
+        return catalog_cache.selected_catalog(
+            self.catalog_file_name, stream_selection,
+            write_catalog=lambda file_path: self._write_selection_catalog(stream_selection, file_path, exclusive=exclusive),
+            exclusive=exclusive)
+
     def _pre_run(self) -> bool:
         """Is called before the tap is called. This is a good place for """
         return True
@@ -179,84 +258,249 @@ class _SingerTapReadCommand(_SingerTapCommand):
     def _create_target_config(self, config: dict):
         raise NotImplementedError(f'Please implement _create_target_config() for type "{self.__class__.__name__}"')
 
+    def _adaptive_batching(self) -> bool:
+        """If the target adapts its batch size itself, see mara_singer.targets.SingerTarget"""
+        return False
+
+    def _create_batch_config(self, target_config: dict):
+        """Adds the batch size config to the target config unless it is set by _create_target_config()"""
+        if self._adaptive_batching():
+            batch_config = {
+                'batch_size_rows': config.max_batch_rows(),
+                'min_batch_rows': config.min_batch_rows(),
+                'max_batch_bytes': config.max_batch_bytes(),
+                'batch_load_seconds': config.batch_load_seconds(),
+                'flush_interval': config.batch_flush_interval()
+            }
+        elif config.tune_target_batch_size():
+            batch_config = batching.tuned_batch_config(self.tap_name, list(self.stream_selection or []))
+        else:
+            return
+        for key, value in batch_config.items():
+            target_config.setdefault(key, value)
+
     def _target_name(self):
         raise NotImplementedError(f'Please implement _target_name() for type "{self.__class__.__name__}"')
 
+    def _target_executable(self) -> t.List[str]:
+        """The command to call the target"""
+        return [self._target_name()]
+
+    def target_command(self) -> t.List[str]:
+        """The target command and its arguments"""
+        return self._target_executable() + ['--config', str(self._target_config_path())]
+
     def _target_config_path(self):
         if not self.__target_config_path:
             self.__target_config_path = pathlib.Path(config.config_dir()) / f'{self._target_name()}.json.tmp-{unique_file_suffix()}'
         return self.__target_config_path
 
-    def run(self, *args, **kargs) -> bool:
-        # create temp catalog (if necessary)
-        tmp_catalog_file_path = None
-        if self.stream_selection:
-            tmp_catalog_file_path = self.catalog_file_path()
-            catalog = SingerCatalog(self.catalog_file_name)
-            has_error = False
-            if isinstance(self.stream_selection, list):
-                for stream_name in self.stream_selection:
-                    if stream_name in catalog.streams:
-                        catalog.streams[stream_name].mark_as_selected()
-                    else:
-                        log(message=f"Could not find stream '{stream_name}' in catalog for selection", is_error=True)
-                        has_error = True
-            elif isinstance(self.stream_selection, dict):
-                for stream_name, properties in self.stream_selection.items():
-                    if stream_name in catalog.streams:
-                        catalog.streams[stream_name].mark_as_selected(properties=properties)
-                    else:
-                        log(message=f"Could not find stream '{stream_name}' in catalog for selection", is_error=True)
-                        has_error = True
-            else:
-                raise Exception(f'Unexpected type of stream_selection: {self.stream_selection.__class__.__name__}')
+    @property
+    def state_checkpoint_interval(self) -> float:
+        """The minimal number of seconds between two writes of the state file while the tap is running"""
+        if self._state_checkpoint_interval is not None:
+            return self._state_checkpoint_interval
+        return config.state_checkpoint_interval()
+
+    def _state_checkpointer(self, state: SingerTapState = None, tap_stream_id: str = None) -> SingerStateCheckpointer:
+        """Creates a checkpointer for the state file, or None when no state file is used"""
+        if not self.state_file_name:
+            return None
+        return SingerStateCheckpointer(state or SingerTapState(self.tap_name, state_file_name=self.state_file_name),
+                                       interval=self.state_checkpoint_interval,
+                                       tap_stream_id=tap_stream_id)
+
+    def _run_parallel(self) -> bool:
+        """If the selected streams are synced by several tap processes in parallel"""
+        return bool(self.parallel_streams and self.parallel_streams > 1
+                    and self.stream_selection and len(self.stream_selection) > 1)
+
+    def _write_selection_catalog(self, stream_selection: t.Union[t.List[str], t.Dict[str, t.List[str]]],
+                                 catalog_file_path: pathlib.Path, exclusive: bool = False) -> bool:
+        """
+        Writes a copy of the catalog with the stream selection applied
 
-            if has_error:
-                return False
+        Args:
+            stream_selection: The streams to be marked as selected
+            catalog_file_path: The file to which the catalog is written
+            exclusive: When true, all streams not in the stream selection are unmarked as selected
+        """
+        catalog = SingerCatalog(self.catalog_file_name)
+        has_error = False
+        if isinstance(stream_selection, list):
+            for stream_name in stream_selection:
+                if stream_name in catalog.streams:
+                    catalog.streams[stream_name].mark_as_selected()
+                else:
+                    log(message=f"Could not find stream '{stream_name}' in catalog for selection", is_error=True)
+                    has_error = True
+        elif isinstance(stream_selection, dict):
+            for stream_name, properties in stream_selection.items():
+                if stream_name in catalog.streams:
+                    catalog.streams[stream_name].mark_as_selected(properties=properties)
+                else:
+                    log(message=f"Could not find stream '{stream_name}' in catalog for selection", is_error=True)
+                    has_error = True
+        else:
+            raise Exception(f'Unexpected type of stream_selection: {stream_selection.__class__.__name__}')
+
+        if has_error:
+            return False
+
+        if exclusive:
+            for stream_name, stream in catalog.streams.items():
+                if stream_name not in stream_selection:
+                    stream.unmark_as_selected()
+
+        catalog.save(catalog_file_path)
+        return True
 
-            catalog.save(tmp_catalog_file_path)
+    def _prepare_run(self) -> bool:
+        self.metrics = None
+        self.ledger_run = SingerRun(self.tap_name, command=self.__class__.__name__, target=self._target_name(),
+                                    stream_names=list(self.stream_selection or []), state_file_name=self.state_file_name)
+
+        # get the selected catalog (if necessary); in parallel mode, a catalog per stream is selected on execution
+        if self.stream_selection and not self._run_parallel():
+            self.__selected_catalog_file_path = self._selected_catalog(self.stream_selection)
+            if not self.__selected_catalog_file_path:
+                return False
 
         # create temp target config file
         target_config = {}
         self._create_target_config(target_config)
-        tmp_target_config_path = self._target_config_path()
-        with open(tmp_target_config_path, 'w') as target_config_file:
+        self._create_batch_config(target_config)
+        with open(self._target_config_path(), 'w') as target_config_file:
             json.dump(target_config, target_config_file)
 
-        # run command
+        # run pre-checks before calling run
+        if not self._pre_run():
+            return False
+
+        return super()._prepare_run()
+
+    def _cleanup_run(self, succeeded: bool):
+        super()._cleanup_run(succeeded)
+        self.__selected_catalog_file_path = None
+        if self.__target_config_path:
+            if os.path.exists(self.__target_config_path):
+                os.remove(self.__target_config_path)
+            self.__target_config_path = None
+        self._write_ledger(succeeded)
+
+    def _write_ledger(self, succeeded: bool):
+        """Completes the ledger entry of the run and writes it to the run ledger, see mara_singer.ledger"""
+        ledger = run_ledger()
+        if not ledger or not self.ledger_run:
+            return
         try:
-            # run pre-checks before calling run
-            if not self._pre_run():
-                return False
+            self.ledger_run.finish(succeeded, metrics=self.metrics)
+            ledger.write(self.ledger_run)
+        except Exception as e:
+            log(message=f'Could not write the run to the run ledger: {e}', format=logger.Format.ITALICS)
 
-            # execute shell command
-            if not super().run(*args, **kargs):
-                return False
+    def _execute(self):
+        from .. import shell
+
+        if self._run_parallel():
+            return self._execute_parallel()
+
+        state_checkpointer = self._state_checkpointer()
+        if self.use_router:
+            router = shell.singer_run_tap_to_target(
+                tap_command=self.tap_command(),
+                target_command=self.target_command(),
+                state_checkpointer=state_checkpointer,
+                metrics=self.metrics)
+            if router:
+                self.ledger_run.add_router(router)
+            return router
+
+        # the target writes the states to stdout
+        try:
+            return shell.singer_run_shell_command(
+                self.shell_command(),
+                stdout_consumer=state_checkpointer.checkpoint_line if state_checkpointer else None,
+                metrics=self.metrics)
         finally:
-            if self.stream_selection:
-                os.remove(tmp_catalog_file_path)
-                self.__tmp_catalog_file_path = None
-            os.remove(tmp_target_config_path)
-            self.__target_config_path = None
+            if state_checkpointer:
+                state_checkpointer.flush()
 
-        return True
+    def _execute_parallel(self) -> bool:
+        """
+        Syncs each selected stream with its own tap and target process, running up to `parallel_streams`
+        stream syncs at the same time. The stream bookmarks emitted by the targets are checkpointed into the state file.
+        """
+        import concurrent.futures
+        from .. import shell
 
-    def shell_command(self):
-        command = ((super().shell_command() + ' \\\n')
-                   + f'  | {self._target_name()} --config {self._target_config_path()}')
+        stream_names = list(self.stream_selection)
+        state = SingerTapState(self.tap_name, state_file_name=self.state_file_name) if self.state_file_name else None
 
-        if self.state_file_name:
-            command += (f' >> {self.state_file_path()} \\\n'
-                        + f'  ; tail -1 {self.state_file_path()} > {self.state_file_path()}.tmp && mv {self.state_file_path()}.tmp {self.state_file_path()}')
+        catalog_file_paths = {}
+        for stream_name in stream_names:
+            stream_selection = ({stream_name: self.stream_selection[stream_name]} if isinstance(self.stream_selection, dict)
+                                else [stream_name])
+            catalog_file_paths[stream_name] = self._selected_catalog(stream_selection, exclusive=True)
+            if not catalog_file_paths[stream_name]:
+                return False
 
-        return command
+        def sync_stream(stream_name: str):
+            router = shell.singer_run_tap_to_target(
+                tap_command=self.tap_command(catalog_file_path=catalog_file_paths[stream_name]),
+                target_command=self.target_command(),
+                state_checkpointer=self._state_checkpointer(state, tap_stream_id=stream_name),
+                metrics=self.metrics)
+            if router:
+                self.ledger_run.add_router(router)
+            return router
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.parallel_streams) as executor:
+            results = dict(zip(stream_names, executor.map(sync_stream, stream_names)))
+
+        failed_stream_names = [stream_name for stream_name, router in results.items() if not router]
+        if failed_stream_names:
+            log(message=f"Sync failed for streams: {', '.join(failed_stream_names)}", is_error=True)
+            return False
+
+        return True
+
+    def shell_command(self):
+        return ((super().shell_command() + ' \\\n')
+                + '  | ' + ' '.join(self.target_command()))
 
     def html_doc_items(self) -> t.List[t.Tuple[str, str]]:
         doc = super().html_doc_items() + [
-            ('stream selection', html.highlight_syntax(json.dumps(self.stream_selection), 'json') if self.stream_selection else None)
+            ('stream selection', html.highlight_syntax(json.dumps(self.stream_selection), 'json') if self.stream_selection else None),
+            ('use router', self.use_router),
+            ('parallel streams', self.parallel_streams),
+            ('state checkpoint interval', self.state_checkpoint_interval if self.state_file_name else None)
         ]
+        last_run = self._last_run_doc()
+        if last_run:
+            doc.append(('last run', last_run))
         return doc
 
+    def _last_run_doc(self):
+        """The streams of the latest run of the command in the run ledger. The runs are executed in other processes."""
+        ledger = run_ledger()
+        if not ledger:
+            return _.i['Enable the run ledger (config run_ledger_file or run_ledger_db_alias) to see the metrics of the last run']
+        try:
+            last_run = ledger.last_run(self.tap_name, command=self.__class__.__name__)
+        except Exception as e:
+            return _.i[f'Could not read the run ledger: {e}']
+        if not last_run:
+            return None
+
+        columns = ['stream', 'record_count', 'byte_count', 'records_per_second',
+                   'http_request_count', 'http_request_errors', 'http_request_duration_p50', 'http_request_duration_p95']
+        return [
+            _.p[f"{last_run['status']}, started {last_run['started_at']}, {self._format_metric(last_run['duration'])} seconds"],
+            bootstrap.table([column.replace('_', ' ') for column in columns],
+                            [_.tr[[_.td[self._format_metric(stream[column])] for column in columns]]
+                             for stream in last_run['streams']])]
+
 
 class SingerTapDiscover(_SingerTapCommand):
     def __init__(self, tap_name: str, config_file_name: str = None, catalog_file_name: str = None) -> None:
@@ -264,6 +508,9 @@ class SingerTapDiscover(_SingerTapCommand):
         Runs a tap discover and writes it to a catalog file.
         See also: https://github.com/singer-io/getting-started/blob/master/docs/DISCOVERY_MODE.md#discovery-mode
 
+        The discovered catalog is merged with the existing catalog file: the selection and replication settings
+        of existing streams and properties are kept. The catalog file is only replaced when the catalog changed.
+
         Args:
             tap_name: The tap command name (e.g. tap-exchangeratesapi)
             config: (default: None) A dict which is used to path the config file (when it exists) or create a temp config file (when it does not exists)
@@ -277,9 +524,83 @@ class SingerTapDiscover(_SingerTapCommand):
         return pathlib.Path(config.catalog_dir()) / self.new_catalog_file_name
 
     def shell_command(self):
-        return (super().shell_command() + f" --discover > {self.new_catalog_file_path()}")
+        return super().shell_command() + ' --discover'
+
+    def _execute(self):
+        from .. import discovery, fastjson, shell
+
+        output = shell.singer_run_shell_command(self.shell_command(), stdout_consumer=lambda line: None,
+                                                metrics=self.metrics, capture_output=True)
+        if not output:
+            return False
+        try:
+            discovered_catalog = fastjson.loads(output.read())
+        except ValueError as e:
+            log(message=f'The tap {self.tap_name} did not write a valid catalog: {e}', is_error=True)
+            return False
+        finally:
+            output.close()
+
+        catalog_file_path = self.new_catalog_file_path()
+        existing_catalog = None
+        if os.path.isfile(catalog_file_path) and os.path.getsize(catalog_file_path) > 0:
+            try:
+                existing_catalog = fastjson.load_file(catalog_file_path)
+            except ValueError:
+                log(message=f"The existing catalog '{catalog_file_path}' is not valid JSON and is replaced", format=logger.Format.ITALICS)
+
+        catalog, diffs = discovery.merge_catalog(existing_catalog, discovered_catalog)
+        for diff in diffs.values():
+            if diff.change != discovery.StreamChange.UNCHANGED:
+                log(message=f'{self.tap_name}: {diff}')
+
+        if discovery.write_catalog_if_changed(catalog, catalog_file_path):
+            log(message=f"{self.tap_name}: catalog '{catalog_file_path}' written", format=logger.Format.ITALICS)
+        else:
+            log(message=f'{self.tap_name}: catalog unchanged', format=logger.Format.ITALICS)
+        return True
 
     def html_doc_items(self) -> t.List[t.Tuple[str, str]]:
         doc = super().html_doc_items()
         doc.append(('catalog file name', _.i[self.new_catalog_file_name]))
         return doc
+
+
+class SingerTapsDiscover(Command):
+    def __init__(self, tap_names: t.List[str], max_workers: int = None) -> None:
+        """
+        Runs the discovery of several taps in parallel, see SingerTapDiscover. The catalogs are written to the
+        default catalog file names ({tap_name}.json).
+
+        Args:
+            tap_names: The tap command names
+            max_workers: (default: config.discover_max_workers()) The maximum number of taps discovering at the same time
+        """
+        super().__init__()
+        self.tap_names = tap_names
+        self._max_workers = max_workers
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers or config.discover_max_workers()
+
+    def run(self, *args, **kargs) -> bool:
+        import concurrent.futures
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = dict(zip(self.tap_names, executor.map(lambda tap_name: SingerTapDiscover(tap_name).run(), self.tap_names)))
+
+        failed_tap_names = [tap_name for tap_name, result in results.items() if not result]
+        if failed_tap_names:
+            log(message=f"Discovery failed for taps: {', '.join(failed_tap_names)}", is_error=True)
+            return False
+        return True
+
+    def shell_command(self):
+        return '\n'.join(SingerTapDiscover(tap_name).shell_command() for tap_name in self.tap_names)
+
+    def html_doc_items(self) -> t.List[t.Tuple[str, str]]:
+        return [
+            ('tap names', _.tt[', '.join(self.tap_names)]),
+            ('max workers', self.max_workers)
+        ]
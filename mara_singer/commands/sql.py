@@ -1,10 +1,14 @@
+import sys
 import typing as t
 
 from mara_db import dbs
 import mara_pipelines.config
+from mara_pipelines.logging import logger
+from mara_pipelines.logging.logger import log
 from mara_page import _
 
 from .singer import _SingerTapReadCommand
+from ..catalog import SingerCatalog
 
 class SingerTapToDB(_SingerTapReadCommand):
     def __init__(self,
@@ -18,7 +22,12 @@ class SingerTapToDB(_SingerTapReadCommand):
 
         # optional args for special calls; NOTE might be removed some day!
         use_state_file: bool = True,
-        pass_state_file: bool = True) -> None:
+        pass_state_file: bool = True,
+        use_router: bool = False,
+        parallel_streams: int = None,
+        native_target: bool = False,
+        state_checkpoint_interval: float = None,
+        migrate_schema: bool = False) -> None:
         """
         Reads data from a singer.io tab and writes the content to a database schema.
 
@@ -33,22 +42,51 @@ class SingerTapToDB(_SingerTapReadCommand):
             state_file_name: (default: {tap_name}.json) The state file name
             use_state_file: (default: True) If the state file name should be passed to the tap command
             pass_state_file: (default: False) If the state file shall be passed to the tap. Is only passed when state_file_name is given.
+            use_router: (default: False) Run tap and target as two processes and route the messages in-process instead of using a bash pipe
+            parallel_streams: (default: None) When given, each selected stream is synced by its own tap and target process, running up to this number of streams in parallel. The stream bookmarks are merged into the state file.
+            native_target: (default: False) Load with the target built into mara_singer instead of the external singer target. Supported for PostgreSQL (bulk load via COPY) and SQLite.
+            state_checkpoint_interval: (default: config.state_checkpoint_interval()) The minimal number of seconds between two writes of the state file while the tap is running.
+            migrate_schema: (default: False) Before the tap is started, create the tables of the selected streams or add their new columns, so that the target does not need to change the table schema while loading. See mara_singer.schema.ddl.
         """
         super().__init__(tap_name,
             config=config, config_file_name=config_file_name,
             stream_selection=stream_selection,
             catalog_file_name=catalog_file_name if catalog_file_name else f'{tap_name}.json',
             state_file_name=state_file_name if state_file_name else (f'{tap_name}.json' if use_state_file else None),
-            pass_state_file=pass_state_file)
+            pass_state_file=pass_state_file,
+            use_router=use_router,
+            state_checkpoint_interval=state_checkpoint_interval,
+            parallel_streams=parallel_streams)
         
         self._target_db_alias = target_db_alias
         self.target_schema = target_schema
+        self.native_target = native_target
+        self.migrate_schema = migrate_schema
 
     @property
     def target_db_alias(self):
         return self._target_db_alias or mara_pipelines.config.default_db_alias()
 
+    def _native_target_module(self) -> str:
+        """The module of the target built into mara_singer for the target db"""
+        db = dbs.db(self.target_db_alias)
+        if isinstance(db, dbs.PostgreSQLDB) and not isinstance(db, dbs.RedshiftDB): # Redshift does not support COPY from STDIN
+            return 'mara_singer.targets.postgres'
+        elif isinstance(db, dbs.SQLiteDB):
+            return 'mara_singer.targets.sqlite'
+        raise Exception(f'Not supported DB type {type(db)} for a native target in command SingerTapToDB')
+
+    def _target_executable(self) -> t.List[str]:
+        if self.native_target:
+            return [sys.executable, '-m', self._native_target_module()]
+        return super()._target_executable()
+
+    def _adaptive_batching(self) -> bool:
+        return self.native_target
+
     def _target_name(self):
+        if self.native_target:
+            return self._native_target_module().replace('.', '-').replace('_', '-')
         db = dbs.db(self.target_db_alias)
         if isinstance(db, dbs.PostgreSQLDB):
             return 'target-postgres'
@@ -102,9 +140,35 @@ class SingerTapToDB(_SingerTapReadCommand):
         else:
             raise Exception(f'Not supported DB type {type(db)} for command SingerTapToDB')
 
+    def _pre_run(self) -> bool:
+        if self.migrate_schema:
+            return self._migrate_schema()
+        return True
+
+    def _migrate_schema(self) -> bool:
+        """Creates or migrates the tables of the selected streams in the target schema"""
+        from ..schema import ddl
+
+        catalog = SingerCatalog(self.catalog_file_name)
+        stream_selection = self.stream_selection or [stream_name for stream_name, stream in catalog.streams.items()
+                                                     if stream.is_selected]
+        for stream_name in stream_selection:
+            if stream_name not in catalog.streams:
+                log(message=f"Could not find stream '{stream_name}' in catalog for schema migration", is_error=True)
+                return False
+            stream = catalog.streams[stream_name]
+            if self.stream_selection:
+                stream.mark_as_selected(properties=self.stream_selection[stream_name] if isinstance(self.stream_selection, dict) else None)
+
+            for statement in ddl.migrate_table(self.target_db_alias, stream.to_table(), schema_name=self.target_schema):
+                log(message=statement, format=logger.Format.VERBATIM)
+        return True
+
     def html_doc_items(self) -> t.List[t.Tuple[str, str]]:
         doc = super().html_doc_items() + [
             ('target db', _.tt[self.target_db_alias]),
-            ('target schema', self.target_schema)
+            ('target schema', self.target_schema),
+            ('native target', self.native_target),
+            ('migrate schema', self.migrate_schema)
         ]
         return doc
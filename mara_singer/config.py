@@ -16,6 +16,84 @@ def catalog_dir():
     """The directory where state files are stored"""
     return pathlib.Path('./app/singer/catalog')
 
+def discover_max_workers() -> int:
+    """The maximum number of taps running discovery at the same time in SingerTapsDiscover"""
+    return 8
+
+def async_max_concurrency() -> int:
+    """The maximum number of syncs running at the same time in SingerTapBatch, see mara_singer.async_runner"""
+    return 16
+
+def selected_catalog_cache_size() -> int:
+    """The maximum number of catalogs with a stream selection applied which are cached in `catalog_dir() / '.selected'`"""
+    return 64
+
+def run_ledger_file():
+    """The SQLite file in which the runs of the read commands are recorded (e.g. `state_dir() / 'run_ledger.sqlite3'`), see mara_singer.ledger. None disables the ledger."""
+    return None
+
+def run_ledger_db_alias() -> str:
+    """When given, the run ledger is written to this database instead of run_ledger_file()"""
+    return None
+
+def max_batch_rows() -> int:
+    """The maximum number of records a target loads at once"""
+    return 100000
+
+def min_batch_rows() -> int:
+    """The minimum number of records a target loads at once (unless max_batch_bytes() is reached earlier)"""
+    return 1000
+
+def max_batch_bytes() -> int:
+    """The maximum (serialized) size of the records a target buffers before loading them"""
+    return 64 * 1024 * 1024
+
+def batch_load_seconds() -> float:
+    """The targeted number of seconds a target takes to load a batch of records, see mara_singer.batching"""
+    return 5.0
+
+def batch_flush_interval() -> float:
+    """The maximum number of seconds a target of mara_singer buffers records before loading them"""
+    return 60.0
+
+def tune_target_batch_size() -> bool:
+    """
+    If the batch size config of external targets (`batch_size_rows`, `max_batch_rows`) is derived from the
+    previous runs in the run ledger. A heuristic based on the record rate of the tap, see mara_singer.batching.tuned_batch_config
+    """
+    return False
+
+def state_checkpoint_interval() -> float:
+    """The minimal number of seconds between two writes of the state file while a tap is running"""
+    return 60.0
+
+def state_history_size() -> int:
+    """The number of previous states kept in memory per tap for debugging"""
+    return 0
+
+def table_cache_size() -> int:
+    """The maximum number of tables created from stream schemas which are cached"""
+    return 256
+
+def table_cache_dir():
+    """
+    The directory in which tables created from stream schemas are cached across processes, e.g.
+    `catalog_dir() / '.table_cache'`. None disables the disk cache.
+    """
+    return None
+
+def log_batch_interval() -> float:
+    """The maximum number of seconds log lines of a tap are held back before they are forwarded to the mara logger"""
+    return 1.0
+
+def log_batch_size() -> int:
+    """The maximum number of log lines of a tap which are forwarded to the mara logger at once"""
+    return 1000
+
+def log_rate_limits() -> dict:
+    """The maximum number of log lines per minute forwarded per log level; ERROR and CRITICAL lines are never suppressed"""
+    return {'INFO': 1000, 'WARNING': 1000, 'NOTSET': 1000}
+
 import os
 import json
 
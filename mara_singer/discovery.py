@@ -0,0 +1,212 @@
+"""
+Re-discovery of singer catalogs. A freshly discovered catalog is merged with the existing catalog file, so that the
+stream and property selection survives a re-discovery, and the catalog file is only replaced when the merged
+catalog differs from it.
+
+    catalog, diffs = merge_catalog(existing_catalog, discovered_catalog)
+    for diff in diffs.values():
+        print(diff) # e.g. "stream users changed (added properties: email; retyped properties: address.zip)"
+"""
+
+import enum
+import os
+import pathlib
+import threading
+import typing as t
+
+from . import fastjson
+from .singer import metadata as singer_metadata
+
+
+# metadata which is set by the user (not by the tap) and taken over from the existing catalog
+USER_METADATA_KEYS = ['selected', 'replication-method', 'replication-key']
+
+# stream entry keys set by the user; deprecated, see SingerStream.replication_method
+USER_STREAM_KEYS = ['replication_method', 'replication_key']
+
+
+class StreamChange(enum.EnumMeta):
+    """How a stream changed between the existing and the discovered catalog"""
+    ADDED = 'added'
+    REMOVED = 'removed'
+    CHANGED = 'changed'
+    UNCHANGED = 'unchanged'
+
+
+class PropertyChange(enum.EnumMeta):
+    """How a property changed between the existing and the discovered stream schema"""
+    ADDED = 'added'
+    REMOVED = 'removed'
+    RETYPED = 'retyped' # the JSON schema type or format changed. A change of the nullability is not a retype.
+
+
+class StreamDiff:
+    def __init__(self, tap_stream_id: str, change: str, properties: t.Dict[str, str] = None) -> None:
+        """
+        The difference of a stream between the existing and the discovered catalog
+
+        Args:
+            tap_stream_id: The stream id
+            change: How the stream changed, see StreamChange
+            properties: The changed properties by property path (e.g. `address.city`), see PropertyChange
+        """
+        self.tap_stream_id = tap_stream_id
+        self.change = change
+        self.properties = properties or {}
+
+    def properties_with_change(self, change: str) -> t.List[str]:
+        """The paths of the properties with a PropertyChange"""
+        return [property_path for property_path, property_change in self.properties.items() if property_change == change]
+
+    def __str__(self) -> str:
+        text = f'stream {self.tap_stream_id} {self.change}'
+        details = []
+        for change in [PropertyChange.ADDED, PropertyChange.REMOVED, PropertyChange.RETYPED]:
+            property_paths = self.properties_with_change(change)
+            if property_paths:
+                details.append(f'{change} properties: ' + ', '.join(property_paths))
+        if details:
+            text += ' (' + '; '.join(details) + ')'
+        return text
+
+
+def property_path(breadcrumb: t.Tuple[str, ...]) -> str:
+    """The property path for a breadcrumb, e.g. `address.city` for ('properties', 'address', 'properties', 'city')"""
+    return '.'.join(breadcrumb).replace('properties.', '').replace('.items', '[]')
+
+
+def _type_signature(definition: dict) -> tuple:
+    """The type of a property definition, ignoring the nullability"""
+    if 'anyOf' in definition:
+        return ('anyOf', fastjson.dumps(definition['anyOf']))
+    types = definition.get('type', [])
+    if isinstance(types, str):
+        types = [types]
+    return (tuple(sorted(type for type in types if type != 'null')), definition.get('format'))
+
+
+def diff_schema(existing_schema: dict, discovered_schema: dict) -> t.Dict[str, str]:
+    """
+    Compares two JSON schemas property by property, including nested objects and array items. Both schemas are
+    walked together and identical subtrees are skipped, so the comparison is linear in the number of properties.
+    For an added or removed object, only the object itself is reported, not its properties.
+
+    Returns:
+        The changed properties by property path, see PropertyChange
+    """
+    properties = {}
+    pending = [((), existing_schema, discovered_schema)]
+    while pending:
+        breadcrumb, existing_definition, discovered_definition = pending.pop()
+        if not isinstance(existing_definition, dict) or not isinstance(discovered_definition, dict):
+            continue
+
+        existing_properties = existing_definition.get('properties') or {}
+        discovered_properties = discovered_definition.get('properties') or {}
+        for name, discovered_property in discovered_properties.items():
+            existing_property = existing_properties.get(name)
+            if existing_property == discovered_property:
+                continue
+            property_breadcrumb = breadcrumb + ('properties', name)
+            if existing_property is None:
+                properties[property_path(property_breadcrumb)] = PropertyChange.ADDED
+                continue
+            if _type_signature(existing_property) != _type_signature(discovered_property):
+                properties[property_path(property_breadcrumb)] = PropertyChange.RETYPED
+            pending.append((property_breadcrumb, existing_property, discovered_property))
+        for name in existing_properties.keys():
+            if name not in discovered_properties:
+                properties[property_path(breadcrumb + ('properties', name))] = PropertyChange.REMOVED
+
+        if breadcrumb and existing_definition.get('items') != discovered_definition.get('items'):
+            pending.append((breadcrumb + ('items',), existing_definition.get('items'), discovered_definition.get('items')))
+    return properties
+
+
+def _merge_stream(existing_stream: dict, discovered_stream: dict) -> dict:
+    """Takes over the user settings of an existing catalog entry into a discovered one"""
+    stream = dict(discovered_stream)
+    for key in USER_STREAM_KEYS:
+        if existing_stream.get(key):
+            stream[key] = existing_stream[key]
+
+    if 'selected' in existing_stream.get('schema', {}) and 'schema' in stream:
+        stream['schema'] = dict(stream['schema'], selected=existing_stream['schema']['selected'])
+
+    # the metadata of both streams is indexed by breadcrumb, so the merge is linear in the number of breadcrumbs
+    existing_mdata = singer_metadata.to_map(existing_stream.get('metadata', []))
+    metadata_list = []
+    for md in stream.get('metadata', []):
+        metadata = md['metadata']
+        existing_metadata = existing_mdata.get(tuple(md['breadcrumb']))
+        if existing_metadata:
+            # the user settings take precedence over the defaults written by the tap
+            user_metadata = {key: existing_metadata[key] for key in USER_METADATA_KEYS if key in existing_metadata}
+            if user_metadata:
+                md = {'breadcrumb': md['breadcrumb'], 'metadata': dict(metadata, **user_metadata)}
+        metadata_list.append(md)
+    stream['metadata'] = metadata_list
+    return stream
+
+
+def merge_catalog(existing_catalog: t.Optional[dict], discovered_catalog: dict) -> t.Tuple[dict, t.Dict[str, StreamDiff]]:
+    """
+    Merges a discovered catalog with an existing catalog
+
+    The streams and their schemas are taken from the discovered catalog; the selection and replication settings
+    (see USER_METADATA_KEYS) of streams and properties which exist in both catalogs are taken from the existing
+    catalog. Streams are matched by tap_stream_id, metadata by breadcrumb.
+
+    Args:
+        existing_catalog: The existing catalog, None when there is none
+        discovered_catalog: The catalog written by the tap in discovery mode
+
+    Returns:
+        The merged catalog and the difference per stream by tap_stream_id
+    """
+    existing_streams = {stream['tap_stream_id']: stream for stream in (existing_catalog or {}).get('streams', [])}
+
+    streams = []
+    diffs = {}
+    for discovered_stream in discovered_catalog.get('streams', []):
+        tap_stream_id = discovered_stream['tap_stream_id']
+        existing_stream = existing_streams.get(tap_stream_id)
+        if existing_stream is None:
+            streams.append(discovered_stream)
+            diffs[tap_stream_id] = StreamDiff(tap_stream_id, StreamChange.ADDED)
+        else:
+            stream = _merge_stream(existing_stream, discovered_stream)
+            streams.append(stream)
+            properties = diff_schema(existing_stream.get('schema', {}), stream.get('schema', {}))
+            diffs[tap_stream_id] = StreamDiff(tap_stream_id,
+                                              StreamChange.CHANGED if properties or stream != existing_stream else StreamChange.UNCHANGED,
+                                              properties=properties)
+
+    for tap_stream_id in existing_streams.keys():
+        if tap_stream_id not in diffs:
+            diffs[tap_stream_id] = StreamDiff(tap_stream_id, StreamChange.REMOVED)
+
+    return dict(discovered_catalog, streams=streams), diffs
+
+
+def write_catalog_if_changed(catalog: dict, file_path: t.Union[str, pathlib.Path]) -> bool:
+    """
+    Writes a catalog file atomically, unless the file already holds the same catalog
+
+    Returns:
+        True when the file was written
+    """
+    if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
+        try:
+            if fastjson.load_file(file_path) == catalog:
+                return False
+        except ValueError:
+            pass # an invalid file is replaced
+
+    tmp_file_path = pathlib.Path(f'{file_path}.tmp-{os.getpid()}-{threading.get_ident()}')
+    with open(tmp_file_path, 'w') as catalog_file:
+        catalog_file.write(fastjson.dumps(catalog))
+        catalog_file.flush()
+        os.fsync(catalog_file.fileno())
+    os.replace(tmp_file_path, file_path)
+    return True
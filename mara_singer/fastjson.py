@@ -0,0 +1,60 @@
+"""
+JSON serialization using the fastest available library. orjson or msgspec are used when installed
+(e.g. via `pip install mara-singer[fastjson]`), otherwise the json module from the standard library.
+"""
+
+import json
+import pathlib
+import typing as t
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def backend() -> str:
+    """The name of the library used for JSON serialization"""
+    if orjson:
+        return 'orjson'
+    if msgspec:
+        return 'msgspec'
+    return 'json'
+
+
+def loads(data: t.Union[str, bytes]) -> object:
+    """Deserializes a JSON document"""
+    if orjson:
+        return orjson.loads(data)
+    if msgspec:
+        return msgspec.json.decode(data)
+    return json.loads(data)
+
+
+def dumps(obj: object) -> str:
+    """Serializes an object to a JSON document"""
+    try:
+        if orjson:
+            return orjson.dumps(obj).decode()
+        if msgspec:
+            return msgspec.json.encode(obj).decode()
+    except TypeError:
+        pass # e.g. integers exceeding 64 bit; the json module can handle these
+    return json.dumps(obj)
+
+
+def load_file(file_path: t.Union[str, pathlib.Path]) -> object:
+    """Reads a JSON file"""
+    with open(file_path, 'rb') as file:
+        return loads(file.read())
+
+
+def dump_file(obj: object, file_path: t.Union[str, pathlib.Path]):
+    """Writes an object to a JSON file"""
+    with open(file_path, 'w') as file:
+        file.write(dumps(obj))
@@ -0,0 +1,316 @@
+"""
+A ledger of singer tap runs. For each run of a read command (e.g. SingerTapToDB), the ledger records the start,
+end, target and exit status, and per stream the number of records, bytes, throughput, the bookmarks before
+and after the run and the http request latency percentiles reported by the tap.
+
+The record and byte counts are taken from the message stream when the messages are routed in-process
+(`use_router` or `parallel_streams`); with a bash pipe, the record counts are taken from the METRIC messages
+of the tap and the bytes are not known.
+
+The ledger is opt-in: it is written to the SQLite file config.run_ledger_file(), or to the database
+config.run_ledger_db_alias(), when one of them is set.
+"""
+
+import datetime
+import enum
+import json
+import sqlite3
+import threading
+import typing as t
+import uuid
+
+from . import config
+from .metrics import SingerMetricsCollector
+from .router import SingerMessageRouter
+from .schema import DataType, Table
+
+
+class RunStatus(enum.EnumMeta):
+    """The exit status of a run"""
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+
+class SingerRunStream:
+    def __init__(self, stream_name: str) -> None:
+        """The ledger entry of a stream in a run"""
+        self.stream_name = stream_name
+        self.record_count = 0
+        self.byte_count: t.Optional[int] = None
+        self.records_per_second: t.Optional[float] = None
+        self.bookmark_before: t.Optional[dict] = None
+        self.bookmark_after: t.Optional[dict] = None
+
+        # from the http_request_duration METRIC messages of the tap
+        self.http_request_count: t.Optional[int] = None
+        self.http_request_errors: t.Optional[int] = None
+        self.http_request_duration_p50: t.Optional[float] = None
+        self.http_request_duration_p95: t.Optional[float] = None
+
+
+class SingerRun:
+    def __init__(self, tap_name: str, command: str, target: str, stream_names: t.List[str] = None,
+                 state_file_name: str = None) -> None:
+        """
+        The ledger entry of a run, filled while the run is executed
+
+        Args:
+            tap_name: The tap command name
+            command: The name of the command class
+            target: The target name
+            stream_names: The selected streams
+            state_file_name: The state file of the run. The bookmarks are read from it when the run starts and finishes.
+        """
+        self.run_id = uuid.uuid4().hex
+        self.tap_name = tap_name
+        self.command = command
+        self.target = target
+        self.state_file_name = state_file_name
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.finished_at: t.Optional[datetime.datetime] = None
+        self.status: t.Optional[str] = None
+
+        self.streams: t.Dict[str, SingerRunStream] = {}
+        for stream_name in stream_names or []:
+            self.stream(stream_name)
+
+        self._routed = False
+        self._lock = threading.Lock()
+        for stream_name, bookmark in self._read_bookmarks().items():
+            self.stream(stream_name).bookmark_before = bookmark
+
+    def stream(self, stream_name: str) -> SingerRunStream:
+        """Returns the ledger entry of a stream"""
+        if stream_name not in self.streams:
+            self.streams[stream_name] = SingerRunStream(stream_name)
+        return self.streams[stream_name]
+
+    def _read_bookmarks(self) -> t.Dict[str, dict]:
+        if not self.state_file_name:
+            return {}
+        from .state import SingerTapState
+        return SingerTapState(self.tap_name, state_file_name=self.state_file_name).sink.read().get('bookmarks', {})
+
+    def add_router(self, router: SingerMessageRouter):
+        """Takes over the record and byte counts of a router which routed (a part of) the messages of the run"""
+        with self._lock:
+            if not self._routed:
+                self._routed = True
+                for stream in self.streams.values():
+                    stream.record_count = 0
+            for stream_name, record_count in router.record_counts.items():
+                stream = self.stream(stream_name)
+                stream.record_count += record_count
+                stream.byte_count = (stream.byte_count or 0) + router.record_bytes.get(stream_name, 0)
+
+    def finish(self, succeeded: bool, metrics: SingerMetricsCollector = None):
+        """
+        Completes the entry when the run finished
+
+        Args:
+            succeeded: If the run succeeded
+            metrics: (optional) The metrics reported by the tap
+        """
+        self.finished_at = datetime.datetime.now(datetime.timezone.utc)
+        self.status = RunStatus.SUCCEEDED if succeeded else RunStatus.FAILED
+
+        if metrics:
+            for stream_metrics in list(metrics.streams.values()):
+                stream = self.stream(stream_metrics.stream_name)
+                if not self._routed:
+                    stream.record_count = stream_metrics.record_count
+                    stream.records_per_second = stream_metrics.records_per_second(metrics.started)
+                if stream_metrics.http_request_durations:
+                    stream.http_request_count = len(stream_metrics.http_request_durations)
+                    stream.http_request_errors = stream_metrics.http_request_errors
+                    stream.http_request_duration_p50 = stream_metrics.http_request_duration_percentile(50)
+                    stream.http_request_duration_p95 = stream_metrics.http_request_duration_percentile(95)
+
+        duration = self.duration
+        for stream in self.streams.values():
+            if stream.records_per_second is None and stream.record_count and duration:
+                stream.records_per_second = stream.record_count / duration
+
+        for stream_name, bookmark in self._read_bookmarks().items():
+            self.stream(stream_name).bookmark_after = bookmark
+
+    @property
+    def duration(self) -> t.Optional[float]:
+        """The duration of the run in seconds"""
+        if not self.finished_at:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    @property
+    def record_count(self) -> int:
+        return sum(stream.record_count for stream in self.streams.values())
+
+    @property
+    def byte_count(self) -> t.Optional[int]:
+        if not self._routed:
+            return None
+        return sum(stream.byte_count or 0 for stream in self.streams.values())
+
+
+def _ledger_tables() -> t.List[Table]:
+    run_table = Table(table_name='singer_run')
+    run_table.add_column('run_id', DataType.TEXT, is_primary_key=True)
+    run_table.add_column('tap_name', DataType.TEXT, nullable=False)
+    run_table.add_column('command', DataType.TEXT, nullable=True)
+    run_table.add_column('target', DataType.TEXT, nullable=True)
+    run_table.add_column('started_at', DataType.TIMESTAMPTZ, nullable=False)
+    run_table.add_column('finished_at', DataType.TIMESTAMPTZ, nullable=True)
+    run_table.add_column('duration', DataType.NUMBER, nullable=True)
+    run_table.add_column('status', DataType.TEXT, nullable=True)
+    run_table.add_column('record_count', DataType.INT, nullable=True)
+    run_table.add_column('byte_count', DataType.INT, nullable=True)
+
+    stream_table = Table(table_name='singer_run_stream')
+    stream_table.add_column('run_id', DataType.TEXT, is_primary_key=True)
+    stream_table.add_column('stream', DataType.TEXT, is_primary_key=True)
+    stream_table.add_column('record_count', DataType.INT, nullable=True)
+    stream_table.add_column('byte_count', DataType.INT, nullable=True)
+    stream_table.add_column('records_per_second', DataType.NUMBER, nullable=True)
+    stream_table.add_column('bookmark_before', DataType.TEXT, nullable=True)
+    stream_table.add_column('bookmark_after', DataType.TEXT, nullable=True)
+    stream_table.add_column('http_request_count', DataType.INT, nullable=True)
+    stream_table.add_column('http_request_errors', DataType.INT, nullable=True)
+    stream_table.add_column('http_request_duration_p50', DataType.NUMBER, nullable=True)
+    stream_table.add_column('http_request_duration_p95', DataType.NUMBER, nullable=True)
+    return [run_table, stream_table]
+
+
+class RunLedger:
+    def __init__(self, db_alias: str = None, file_path: str = None) -> None:
+        """
+        The storage of the run ledger
+
+        Args:
+            db_alias: The mara_db alias of the database holding the ledger tables (PostgreSQL, Redshift or SQLite)
+            file_path: The SQLite file holding the ledger tables, used when no db_alias is given
+        """
+        if not db_alias and not file_path:
+            raise ValueError('Either db_alias or file_path must be given for the run ledger')
+        self.db_alias = db_alias
+        self.file_path = file_path
+        self._tables_created = False
+        self._lock = threading.Lock()
+
+    def _dialect(self) -> str:
+        from .schema import ddl
+        if not self.db_alias:
+            return ddl.Dialect.SQLITE
+        return ddl.dialect_for_db(self.db_alias)
+
+    def _execute(self, statements: t.List[t.Tuple[str, tuple]], fetch: bool = False) -> t.Optional[t.List[tuple]]:
+        """Executes statements with '?' placeholders in a transaction and returns the rows of the last statement"""
+        from .schema import ddl
+
+        dialect = self._dialect()
+        if dialect == ddl.Dialect.BIGQUERY:
+            raise Exception('The run ledger does not support BigQuery')
+        if dialect != ddl.Dialect.SQLITE:
+            statements = [(statement.replace('?', '%s'), parameters) for statement, parameters in statements]
+        if not self._tables_created:
+            statements = [(ddl.create_table_statement(table, dialect), ()) for table in _ledger_tables()] + statements
+
+        def execute(cursor):
+            for statement, parameters in statements:
+                cursor.execute(statement, parameters)
+            return cursor.fetchall() if fetch else None
+
+        with self._lock:
+            if self.db_alias:
+                from mara_db import dbs
+                with dbs.cursor_context(self.db_alias) as cursor:
+                    rows = execute(cursor)
+            else:
+                connection = sqlite3.connect(str(self.file_path), timeout=30)
+                try:
+                    with connection:
+                        rows = execute(connection.cursor())
+                finally:
+                    connection.close()
+            self._tables_created = True
+        return rows
+
+    def write(self, run: SingerRun):
+        """Adds a finished run to the ledger"""
+        statements = [(
+            'INSERT INTO singer_run (run_id, tap_name, command, target, started_at, finished_at, duration, status, record_count, byte_count)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (run.run_id, run.tap_name, run.command, run.target, run.started_at.isoformat(),
+             run.finished_at.isoformat() if run.finished_at else None, run.duration, run.status, run.record_count, run.byte_count))]
+        for stream in run.streams.values():
+            statements.append((
+                'INSERT INTO singer_run_stream (run_id, stream, record_count, byte_count, records_per_second, bookmark_before, bookmark_after,'
+                ' http_request_count, http_request_errors, http_request_duration_p50, http_request_duration_p95)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (run.run_id, stream.stream_name, stream.record_count, stream.byte_count, stream.records_per_second,
+                 json.dumps(stream.bookmark_before) if stream.bookmark_before is not None else None,
+                 json.dumps(stream.bookmark_after) if stream.bookmark_after is not None else None,
+                 stream.http_request_count, stream.http_request_errors,
+                 stream.http_request_duration_p50, stream.http_request_duration_p95)))
+        self._execute(statements)
+
+    def stream_history(self, tap_name: str, stream_name: str, limit: int = 20, succeeded_only: bool = True) -> t.List[dict]:
+        """
+        Returns the ledger entries of a stream, latest run first
+
+        Args:
+            tap_name: The tap command name
+            stream_name: The stream name
+            limit: The maximum number of runs
+            succeeded_only: Only return succeeded runs
+        """
+        rows = self._execute([(
+            'SELECT r.run_id, r.started_at, r.duration, r.status, r.target, s.record_count, s.byte_count, s.records_per_second'
+            ' FROM singer_run r JOIN singer_run_stream s ON s.run_id = r.run_id'
+            ' WHERE r.tap_name = ? AND s.stream = ?' + (' AND r.status = ?' if succeeded_only else '')
+            + f' ORDER BY r.started_at DESC LIMIT {int(limit)}',
+            (tap_name, stream_name) + ((RunStatus.SUCCEEDED,) if succeeded_only else ()))], fetch=True)
+        columns = ['run_id', 'started_at', 'duration', 'status', 'target', 'record_count', 'byte_count', 'records_per_second']
+        return [dict(zip(columns, row)) for row in rows]
+
+    def last_run(self, tap_name: str, command: str = None) -> t.Optional[dict]:
+        """
+        Returns the latest run of a tap with its streams, or None when the tap did not run yet
+
+        Args:
+            tap_name: The tap command name
+            command: (optional) Only runs of this command class
+        """
+        rows = self._execute([(
+            'SELECT run_id, started_at, duration, status, target, record_count, byte_count FROM singer_run'
+            ' WHERE tap_name = ?' + (' AND command = ?' if command else '') + ' ORDER BY started_at DESC LIMIT 1',
+            (tap_name,) + ((command,) if command else ()))], fetch=True)
+        if not rows:
+            return None
+        run = dict(zip(['run_id', 'started_at', 'duration', 'status', 'target', 'record_count', 'byte_count'], rows[0]))
+
+        columns = ['stream', 'record_count', 'byte_count', 'records_per_second', 'bookmark_after',
+                   'http_request_count', 'http_request_errors', 'http_request_duration_p50', 'http_request_duration_p95']
+        stream_rows = self._execute([(
+            f'SELECT {", ".join(columns)} FROM singer_run_stream WHERE run_id = ? ORDER BY stream', (run['run_id'],))], fetch=True)
+        run['streams'] = [dict(zip(columns, row)) for row in stream_rows]
+        return run
+
+
+_run_ledger: t.Optional[RunLedger] = None
+_run_ledger_key = None
+_run_ledger_lock = threading.Lock()
+
+
+def run_ledger() -> t.Optional[RunLedger]:
+    """The run ledger configured via config.run_ledger_db_alias() and config.run_ledger_file(), or None when disabled"""
+    global _run_ledger, _run_ledger_key
+    db_alias = config.run_ledger_db_alias()
+    file_path = None if db_alias else config.run_ledger_file()
+    if not db_alias and not file_path:
+        return None
+
+    with _run_ledger_lock:
+        if _run_ledger is None or _run_ledger_key != (db_alias, str(file_path)):
+            _run_ledger = RunLedger(db_alias=db_alias, file_path=file_path)
+            _run_ledger_key = (db_alias, str(file_path))
+        return _run_ledger
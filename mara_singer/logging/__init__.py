@@ -2,6 +2,65 @@ import threading
 
 from mara_pipelines.logging import logger
 
+from ..metrics import SingerMetricsCollector
+from .forwarder import SingerLogForwarder
+
+class SingerLogHandler:
+    """
+    Handles the log lines written by a singer tap or target to stderr
+    See also: https://github.com/singer-io/getting-started/blob/master/docs/SPEC.md#output
+
+    Args:
+        metrics: (optional) The collector to which the METRIC messages are added
+        forwarder: (optional) When given, the lines are logged through the forwarder instead of directly to the mara logger
+        prefix: (optional) A prefix added to each logged line, e.g. to tell apart the processes sharing a logger
+    """
+    def __init__(self, metrics: SingerMetricsCollector = None, forwarder: SingerLogForwarder = None, prefix: str = None):
+        self.metrics = metrics
+        self.forwarder = forwarder
+        self.prefix = prefix
+        self._has_error = False
+
+    @property
+    def has_error(self):
+        """True when an ERROR or CRITICAL line was logged"""
+        return self._has_error
+
+    def handle_line(self, line: str):
+        pos = line.find(' ')
+        if pos == -1:
+            loglevel = 'NOTSET'
+            logmsg = line
+        else:
+            loglevel = line[:pos]
+            logmsg = line[(pos+1):]
+
+        if loglevel == 'INFO':
+            if logmsg.startswith('METRIC:'):
+                # see also https://github.com/singer-io/getting-started/blob/96a0f7addec517fcf5155284744c648fe4f16902/docs/SYNC_MODE.md#metric-messages
+                if self.metrics:
+                    self.metrics.add_log_message(logmsg)
+                self._log(loglevel, logmsg, format=logger.Format.ITALICS)
+            else:
+                self._log(loglevel, logmsg, format=logger.Format.VERBATIM)
+
+        elif loglevel in ['NOTSET','WARNING']:
+            self._log(loglevel, logmsg, format=logger.Format.VERBATIM)
+        elif loglevel == 'DEBUG':
+            pass # DEBUG messages are ignored
+        elif loglevel in ['ERROR','CRITICAL']:
+            self._has_error = True
+            self._log(loglevel, logmsg, format=logger.Format.VERBATIM, is_error=True)
+
+    def _log(self, loglevel: str, logmsg: str, format: logger.Format, is_error: bool = False):
+        if self.prefix:
+            logmsg = self.prefix + logmsg
+        if self.forwarder:
+            self.forwarder.log(logmsg, level=loglevel, format=format, is_error=is_error)
+        else:
+            logger.log(logmsg, format=format, is_error=is_error)
+
+
 class SingerTapReadLogThread(threading.Thread):
     """
     A thread class handling read of singer log from stdout
@@ -9,40 +68,23 @@ class SingerTapReadLogThread(threading.Thread):
 
     Args:
         process: The process running the singer tap command
+        stream: (default: process.stderr) The text stream to read the log from
+        metrics: (optional) The collector to which the METRIC messages are added
     """
-    def __init__(self, process):
+    def __init__(self, process, stream=None, metrics: SingerMetricsCollector = None):
         threading.Thread.__init__(self)
 
         self.process = process
-        self._has_error = False
+        self.stream = stream if stream is not None else process.stderr
+        self.metrics = metrics
+        self._handler = SingerLogHandler(metrics=metrics)
 
     @property
     def has_error(self):
-        return self._has_error
+        return self._handler.has_error
 
     def run(self):
-        self._has_error = False
+        self._handler = SingerLogHandler(metrics=self.metrics)
 
-        for line in self.process.stderr:
-            pos = line.find(' ')
-            if pos == -1:
-                loglevel = 'NOTSET'
-                logmsg = line
-            else:
-                loglevel = line[:pos]
-                logmsg = line[(pos+1):]
-
-            if loglevel == 'INFO':
-                if logmsg.startswith('METRIC:'):
-                    # This data could be used for showing execution statistics; see also https://github.com/singer-io/getting-started/blob/96a0f7addec517fcf5155284744c648fe4f16902/docs/SYNC_MODE.md#metric-messages
-                    logger.log(logmsg, format=logger.Format.ITALICS)
-                else:
-                    logger.log(logmsg, format=logger.Format.VERBATIM)
-
-            elif loglevel in ['NOTSET','WARNING']:
-                logger.log(logmsg, format=logger.Format.VERBATIM)
-            elif loglevel == 'DEBUG':
-                pass # DEBUG messages are ignored
-            elif loglevel in ['ERROR','CRITICAL']:
-                self._has_error = True
-                logger.log(logmsg, format=logger.Format.VERBATIM, is_error=True)
+        for line in self.stream:
+            self._handler.handle_line(line)
@@ -0,0 +1,124 @@
+"""Forwarding of high-volume tap output to the mara logger"""
+
+import threading
+import time
+import typing as t
+
+from mara_pipelines.logging import logger
+
+from .. import config
+
+
+class SingerLogForwarder:
+    """
+    Forwards log lines to the mara logger in batches.
+
+    - Lines are held back for up to `batch_interval` seconds and then logged with one call per format.
+    - Consecutive identical lines are logged once, followed by the number of repetitions.
+    - Per log level, at most `rate_limits[level]` lines per minute are forwarded; the number of suppressed lines is logged
+      at the end of each minute.
+    - Error lines are never suppressed; they are logged immediately after all lines held back.
+
+    Args:
+        batch_interval: (default: config.log_batch_interval()) The maximum number of seconds a line is held back
+        batch_size: (default: config.log_batch_size()) The maximum number of lines held back
+        rate_limits: (default: config.log_rate_limits()) The maximum number of lines per minute per log level
+    """
+    def __init__(self, batch_interval: float = None, batch_size: int = None, rate_limits: t.Dict[str, int] = None) -> None:
+        self.batch_interval = batch_interval if batch_interval is not None else config.log_batch_interval()
+        self.batch_size = batch_size if batch_size is not None else config.log_batch_size()
+        self.rate_limits = rate_limits if rate_limits is not None else config.log_rate_limits()
+
+        self._lock = threading.RLock()
+        self._batch: t.List[t.Tuple[str, logger.Format]] = []
+        self._timer: t.Optional[threading.Timer] = None
+
+        # the last line and how often it was repeated since
+        self._last_line: t.Optional[t.Tuple[str, logger.Format]] = None
+        self._repetitions = 0
+
+        # rate limit window
+        self._window_start = time.monotonic()
+        self._window_counts: t.Dict[str, int] = {}
+        self._suppressed_counts: t.Dict[str, int] = {}
+
+    def log(self, message: str, level: str = 'NOTSET', format: logger.Format = logger.Format.VERBATIM, is_error: bool = False):
+        """
+        Forwards a line
+
+        Args:
+            message: The message to log
+            level: The singer log level of the line, e.g. INFO
+            format: How to format the message
+            is_error: Whether the message is an error message. Error messages flush all lines held back.
+        """
+        message = message.rstrip('\n')
+        with self._lock:
+            if is_error:
+                self.flush()
+                logger.log(message, format=format, is_error=True)
+                return
+
+            self._roll_window()
+            limit = self.rate_limits.get(level)
+            count = self._window_counts.get(level, 0)
+            if limit is not None and count >= limit:
+                self._suppressed_counts[level] = self._suppressed_counts.get(level, 0) + 1
+                return
+            self._window_counts[level] = count + 1
+
+            line = (message, format)
+            if line == self._last_line:
+                self._repetitions += 1
+                return
+            self._add_repetitions()
+            self._last_line = line
+            self._batch.append(line)
+
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+            elif not self._timer:
+                self._timer = threading.Timer(self.batch_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Logs all lines held back"""
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._add_repetitions()
+            self._last_line = None
+            self._add_suppressed_counts()
+
+            batch, self._batch = self._batch, []
+            # one logger call per run of lines with the same format
+            start = 0
+            for end in range(1, len(batch) + 1):
+                if end == len(batch) or batch[end][1] != batch[start][1]:
+                    logger.log('\n'.join(message for message, _ in batch[start:end]), format=batch[start][1])
+                    start = end
+
+    def close(self):
+        """Logs all lines held back and stops the timer"""
+        self.flush()
+
+    def _add_repetitions(self):
+        if self._repetitions:
+            self._batch.append((f'(last line repeated {self._repetitions} times)', logger.Format.ITALICS))
+            self._repetitions = 0
+
+    def _add_suppressed_counts(self):
+        for level, count in self._suppressed_counts.items():
+            self._batch.append((f'{count} {level} lines suppressed', logger.Format.ITALICS))
+        self._suppressed_counts = {}
+
+    def _roll_window(self):
+        now = time.monotonic()
+        if now - self._window_start >= 60:
+            self._add_repetitions()
+            self._last_line = None
+            self._add_suppressed_counts()
+            self._window_start = now
+            self._window_counts = {}
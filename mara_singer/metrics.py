@@ -0,0 +1,138 @@
+"""Collecting the metrics logged by singer taps
+See also: https://github.com/singer-io/getting-started/blob/master/docs/SYNC_MODE.md#metric-messages
+"""
+
+import json
+import threading
+import time
+import typing as t
+
+
+def percentile(values: t.List[float], p: float) -> t.Optional[float]:
+    """
+    Returns the p-th percentile of a list of values using linear interpolation
+
+    Args:
+        values: The values
+        p: The percentile, between 0 and 100
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class SingerStreamMetrics:
+    """The aggregated metrics of a single stream (endpoint) of a tap"""
+    def __init__(self, stream_name: str) -> None:
+        self.stream_name = stream_name
+        self.record_count = 0
+        self.http_request_durations: t.List[float] = []
+        self.http_request_errors = 0
+        self.first_seen: t.Optional[float] = None
+        self.last_seen: t.Optional[float] = None
+
+    def records_per_second(self, started: float) -> t.Optional[float]:
+        """The average number of records per second from the start of the run until the last metric of the stream"""
+        if not self.record_count or self.last_seen is None or self.last_seen <= started:
+            return None
+        return self.record_count / (self.last_seen - started)
+
+    def http_request_duration_percentile(self, p: float) -> t.Optional[float]:
+        return percentile(self.http_request_durations, p)
+
+
+class SingerMetricsCollector:
+    """
+    Aggregates the METRIC messages logged by a singer tap during a run
+
+    Known metrics:
+        record_count: A counter of the records synced per endpoint since the last record_count message
+        http_request_duration: A timer of a single HTTP request
+        job_duration: A timer of a tap job, e.g. a bulk export
+    """
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.streams: t.Dict[str, SingerStreamMetrics] = {}
+        self.job_durations: t.Dict[str, t.List[float]] = {}
+        self.metric_count = 0
+        self._lock = threading.Lock()
+
+    def add_log_message(self, message: str) -> bool:
+        """
+        Parses a log message of the form 'METRIC: {...}'
+
+        Returns:
+            False when the message could not be parsed
+        """
+        if not message.startswith('METRIC:'):
+            return False
+        try:
+            metric = json.loads(message[len('METRIC:'):])
+        except ValueError:
+            return False
+        if not isinstance(metric, dict):
+            return False
+        self.add(metric)
+        return True
+
+    def add(self, metric: dict):
+        """Adds a parsed metric, e.g. {"type": "counter", "metric": "record_count", "value": 100, "tags": {"endpoint": "users"}}"""
+        tags = metric.get('tags') or {}
+        value = metric.get('value')
+        if not isinstance(value, (int, float)):
+            return
+        now = time.monotonic()
+
+        with self._lock:
+            self.metric_count += 1
+            metric_name = metric.get('metric')
+            if metric_name == 'job_duration':
+                self.job_durations.setdefault(tags.get('job_type', 'unknown'), []).append(value)
+                return
+            if metric_name not in ('record_count', 'http_request_duration'):
+                return
+
+            stream_name = tags.get('endpoint') or tags.get('stream') or 'unknown'
+            stream = self.streams.get(stream_name)
+            if stream is None:
+                stream = self.streams[stream_name] = SingerStreamMetrics(stream_name)
+            if stream.first_seen is None:
+                stream.first_seen = now
+            stream.last_seen = now
+
+            if metric_name == 'record_count':
+                stream.record_count += value
+            else:
+                stream.http_request_durations.append(value)
+                if tags.get('status') == 'failed':
+                    stream.http_request_errors += 1
+
+    @property
+    def record_count(self) -> int:
+        """The number of records synced over all streams"""
+        return sum(stream.record_count for stream in self.streams.values())
+
+    def records_per_second(self) -> t.Optional[float]:
+        """The average number of records per second over all streams"""
+        last_seen = max((stream.last_seen for stream in self.streams.values() if stream.record_count), default=None)
+        if last_seen is None or last_seen <= self.started:
+            return None
+        return self.record_count / (last_seen - self.started)
+
+    def stream_summaries(self) -> t.List[dict]:
+        """A summary per stream, ordered by record count descending"""
+        with self._lock:
+            return [{
+                'stream': stream.stream_name,
+                'records': stream.record_count,
+                'records per second': stream.records_per_second(self.started),
+                'http requests': len(stream.http_request_durations),
+                'http request errors': stream.http_request_errors,
+                'http request duration p50': stream.http_request_duration_percentile(50),
+                'http request duration p95': stream.http_request_duration_percentile(95),
+                'http request duration p99': stream.http_request_duration_percentile(99),
+            } for stream in sorted(self.streams.values(), key=lambda stream: -stream.record_count)]
@@ -0,0 +1,153 @@
+"""In-process routing of singer messages from a tap to a target"""
+
+import json
+import typing as t
+
+from mara_pipelines.logging import logger
+
+from .state import parse_state_line
+
+
+# singer-python serializes messages with the 'type' key first, e.g. {"type": "RECORD", "stream": "users", ...}
+_TYPE_PREFIX = b'{"type": "'
+_STREAM_PREFIX = b', "stream": "'
+
+
+def parse_message_header(line: bytes) -> t.Tuple[t.Optional[str], t.Optional[str]]:
+    """
+    Returns the message type and the stream name of a singer message line without parsing the whole JSON document.
+    See also: https://github.com/singer-io/getting-started/blob/master/docs/SPEC.md#output
+
+    Args:
+        line: A single line written by a singer tap
+
+    Returns:
+        A tuple (type, stream). The stream is None for messages without a stream (e.g. STATE). The type
+        is None when the line is not a singer message.
+    """
+    if line.startswith(_TYPE_PREFIX):
+        type_end = line.find(b'"', len(_TYPE_PREFIX))
+        if type_end != -1:
+            message_type = line[len(_TYPE_PREFIX):type_end].decode()
+            if line.startswith(_STREAM_PREFIX, type_end + 1):
+                stream_start = type_end + 1 + len(_STREAM_PREFIX)
+                stream_end = line.find(b'"', stream_start)
+                if stream_end != -1 and line.find(b'\\', stream_start, stream_end) == -1:
+                    return (message_type, line[stream_start:stream_end].decode())
+            elif message_type == 'STATE':
+                return (message_type, None)
+
+    # slow path: the message is not serialized in the singer-python key order
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return (None, None)
+    if not isinstance(message, dict):
+        return (None, None)
+    return (message.get('type'), message.get('stream'))
+
+
+class SingerMessageRouter:
+    """
+    Pumps the singer messages from the stdout of a tap to the stdin of a target.
+
+    Data is passed through unchanged in large chunks; only the message type and the stream name of each line
+    are inspected. Writes to the target block when its stdin pipe is full, so a slow target slows down the
+    tap instead of buffering records in memory.
+
+    Args:
+        buffer_size: The maximum number of bytes read from the tap at once
+        on_target_state: (optional) Is called with each state emitted by the target
+    """
+    def __init__(self, buffer_size: int = 1024 * 1024, on_target_state: t.Callable[[dict], None] = None) -> None:
+        self.buffer_size = buffer_size
+        self.on_target_state = on_target_state
+
+        self.record_counts: t.Dict[str, int] = {}
+        self.record_bytes: t.Dict[str, int] = {}
+        self.message_counts: t.Dict[str, int] = {}
+        self.bytes_routed = 0
+
+        # the last STATE message sent by the tap and the last state written by the target
+        self.tap_state: t.Optional[dict] = None
+        self.target_state_line: t.Optional[str] = None
+
+        self._pending = b''
+
+    @property
+    def target_state(self) -> t.Optional[dict]:
+        """The last state emitted by the target, e.g. the state which is safe to be used for the next run"""
+        if self.target_state_line is None:
+            return None
+        return json.loads(self.target_state_line)
+
+    def pump(self, source: t.BinaryIO, destination: t.BinaryIO) -> bool:
+        """
+        Copies the messages from source to destination until source reaches EOF
+
+        Returns:
+            False when the destination was closed before all messages could be passed on
+        """
+        while True:
+            chunk = source.read1(self.buffer_size)
+            if not chunk:
+                break
+
+            try:
+                destination.write(chunk)
+                destination.flush()
+            except BrokenPipeError:
+                return False
+
+            self.add_chunk(chunk)
+
+        self.finish()
+        return True
+
+    def add_chunk(self, chunk: bytes):
+        """Inspects a chunk of tap output which was passed to the target, e.g. when the messages are pumped by an event loop"""
+        self.bytes_routed += len(chunk)
+        self._inspect_chunk(chunk)
+
+    def finish(self):
+        """Inspects the last line when the tap output ended without a line break"""
+        if self._pending:
+            self._inspect_line(self._pending)
+            self._pending = b''
+
+    def _inspect_chunk(self, chunk: bytes):
+        lines = (self._pending + chunk).split(b'\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self._inspect_line(line)
+
+    def _inspect_line(self, line: bytes):
+        (message_type, stream) = parse_message_header(line)
+        if message_type is None:
+            return
+
+        self.message_counts[message_type] = self.message_counts.get(message_type, 0) + 1
+        if message_type == 'RECORD':
+            self.record_counts[stream] = self.record_counts.get(stream, 0) + 1
+            self.record_bytes[stream] = self.record_bytes.get(stream, 0) + len(line) + 1
+        elif message_type == 'STATE':
+            try:
+                message = json.loads(line)
+            except ValueError:
+                return # passed on unchanged, the target reports the error
+            if isinstance(message, dict):
+                self.tap_state = message.get('value')
+
+    def handle_target_output(self, line: str):
+        """
+        Handles a line written by the target to stdout. Singer targets write the state after it is committed;
+        lines which are not a state are logged.
+        """
+        state = parse_state_line(line)
+        if state is None:
+            if line.strip():
+                logger.log(line.strip(), format=logger.Format.VERBATIM)
+            return
+        self.target_state_line = line.strip()
+        if self.on_target_state:
+            self.on_target_state(state)
@@ -0,0 +1,126 @@
+"""Reading the output of many concurrently running singer processes in a single thread"""
+
+import codecs
+import os
+import selectors
+import threading
+import typing as t
+
+
+class SingerStreamReader:
+    """
+    Splits the data read from a process pipe into lines and passes them to a line handler
+
+    Args:
+        stream: The binary pipe to read from, e.g. `process.stdout`
+        line_handler: Is called with each line (decoded, including the line break)
+    """
+    def __init__(self, stream: t.BinaryIO, line_handler: t.Callable[[str], None]) -> None:
+        self.stream = stream
+        self.line_handler = line_handler
+
+        self.error: t.Optional[BaseException] = None
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._pending = ''
+        self._done = threading.Event()
+
+    def feed(self, chunk: bytes):
+        lines = (self._pending + self._decoder.decode(chunk)).split('\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self._handle_line(line + '\n')
+
+    def close(self):
+        self._pending += self._decoder.decode(b'', final=True)
+        if self._pending:
+            self._handle_line(self._pending)
+            self._pending = ''
+        self.stream.close()
+        self._done.set()
+
+    def _handle_line(self, line: str):
+        if self.error:
+            return # a failing handler does not get any further lines
+        try:
+            self.line_handler(line)
+        except BaseException as e:
+            self.error = e
+
+    def wait(self):
+        """Blocks until the stream reached EOF. Re-raises exceptions of the line handler."""
+        self._done.wait()
+        if self.error:
+            raise self.error
+
+
+class SingerProcessMultiplexer:
+    """
+    Reads the pipes of many processes in one event loop thread using the `selectors` module.
+
+    The thread blocks until one of the pipes has data, so an idle process does not cost any CPU.
+    The line handlers are called from the event loop thread and should return quickly.
+    """
+    def __init__(self) -> None:
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._pending_readers: t.List[SingerStreamReader] = []
+        self._thread: t.Optional[threading.Thread] = None
+
+        # writing to the wakeup pipe interrupts the select call when new streams are added
+        self._wakeup_read_fd, self._wakeup_write_fd = os.pipe()
+        self._selector.register(self._wakeup_read_fd, selectors.EVENT_READ)
+
+    def add_stream(self, stream: t.BinaryIO, line_handler: t.Callable[[str], None]) -> SingerStreamReader:
+        """
+        Starts reading a pipe
+
+        Args:
+            stream: The binary pipe to read from, e.g. `process.stdout`
+            line_handler: Is called with each line (decoded, including the line break)
+
+        Returns:
+            A reader on which `wait()` can be called to wait until the stream reached EOF
+        """
+        reader = SingerStreamReader(stream, line_handler)
+        with self._lock:
+            self._pending_readers.append(reader)
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name='singer-process-multiplexer', daemon=True)
+                self._thread.start()
+        os.write(self._wakeup_write_fd, b'\0')
+        return reader
+
+    def _run(self):
+        while True:
+            for key, _ in self._selector.select():
+                if key.fileobj == self._wakeup_read_fd:
+                    os.read(self._wakeup_read_fd, 4096)
+                    with self._lock:
+                        readers, self._pending_readers = self._pending_readers, []
+                    for reader in readers:
+                        self._selector.register(reader.stream.fileno(), selectors.EVENT_READ, reader)
+                    continue
+
+                reader: SingerStreamReader = key.data
+                chunk = os.read(key.fd, 1024 * 1024)
+                if chunk:
+                    reader.feed(chunk)
+                else:
+                    self._selector.unregister(key.fd)
+                    reader.close()
+
+
+_shared_multiplexer: t.Optional[SingerProcessMultiplexer] = None
+_shared_multiplexer_pid: t.Optional[int] = None
+_shared_multiplexer_lock = threading.Lock()
+
+
+def shared_multiplexer() -> SingerProcessMultiplexer:
+    """The multiplexer used for all singer processes of the current process"""
+    global _shared_multiplexer, _shared_multiplexer_pid
+    with _shared_multiplexer_lock:
+        # mara pipelines runs commands in forked processes, which do not inherit the event loop thread
+        if _shared_multiplexer is None or _shared_multiplexer_pid != os.getpid():
+            _shared_multiplexer = SingerProcessMultiplexer()
+            _shared_multiplexer_pid = os.getpid()
+        return _shared_multiplexer
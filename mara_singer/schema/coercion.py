@@ -0,0 +1,254 @@
+"""
+Coercion of singer records into typed rows before bulk loading.
+
+A Table (e.g. from `SingerStream.to_table()`) is compiled once per stream into a specialized function which
+converts a record dict into a tuple of values in column order. The function is generated as Python source with
+one parser per column, so no schema is walked per record:
+
+    coerce = compile_record_coercer(table)
+    rows = coerce_records(coerce, records)
+
+Value types of the rows:
+    INT: int
+    NUMBER: int, float or decimal.Decimal (for numbers given as string when exact_numbers is true)
+    BOOL: bool
+    TEXT: str
+    DATE: datetime.date
+    TIMESTAMP: datetime.datetime without timezone (converted to UTC)
+    TIMESTAMPTZ: datetime.datetime with timezone (UTC when the value has no timezone)
+    JSON, XML and unknown types: unchanged, or as JSON text when json_as_text is true
+    structs: dict with the coerced fields of the struct and the undeclared keys unchanged
+    arrays: list of coerced values
+"""
+
+import datetime
+import decimal
+import json
+import re
+import typing as t
+
+from . import Column, DataType, StructDataType, Table
+
+
+def _parse_int(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, bool):
+        raise ValueError(f'Boolean {value} is not an integer')
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f'Number {value} is not an integer')
+        return int(value)
+    return int(value)
+
+
+def _parse_number(value):
+    if type(value) in (int, float):
+        return value
+    if isinstance(value, bool):
+        raise ValueError(f'Boolean {value} is not a number')
+    if isinstance(value, decimal.Decimal):
+        return value
+    return decimal.Decimal(value)
+
+
+def _parse_float(value):
+    if type(value) in (int, float):
+        return value
+    if isinstance(value, bool):
+        raise ValueError(f'Boolean {value} is not a number')
+    return float(value)
+
+
+_BOOL_STRINGS = {'true': True, 't': True, '1': True, 'yes': True, 'false': False, 'f': False, '0': False, 'no': False}
+
+
+def _parse_bool(value):
+    if value is True or value is False:
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.lower() in _BOOL_STRINGS:
+        return _BOOL_STRINGS[value.lower()]
+    raise ValueError(f'Could not parse {value!r} as boolean')
+
+
+def _parse_text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if value is True or value is False:
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def _parse_json_text(value):
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, default=json_default)
+
+
+def json_default(value):
+    """A `default` function for json.dumps serializing the values of coerced records"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {value.__class__.__name__} is not JSON serializable')
+
+
+# RFC 3339 / ISO 8601 date-times as written by taps: any number of fractional digits, 'Z' or offsets with or without colon
+_DATETIME_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})'
+                          r'(?:[Tt ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d+))?)?'
+                          r'\s*(?:([Zz])|([+-])(\d{2})(?::?(\d{2}))?)?)?')
+
+
+def parse_datetime(value) -> datetime.datetime:
+    """
+    Parses an RFC 3339 date-time (or a date) into a datetime.datetime. Unlike datetime.fromisoformat before
+    Python 3.11, any number of fractional digits (more than 6 are truncated) and offsets without colon are supported.
+
+    Raises:
+        ValueError: when the value is not a date-time
+    """
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    if not isinstance(value, str):
+        raise ValueError(f'Could not parse {value!r} as date-time')
+    if value[-1:] in ('Z', 'z'):
+        value = value[:-1] + '+00:00'
+    try:
+        return datetime.datetime.fromisoformat(value) # fast path for the common formats
+    except ValueError:
+        pass
+    match = _DATETIME_RE.fullmatch(value.strip())
+    if not match:
+        raise ValueError(f'Could not parse {value!r} as date-time')
+    year, month, day, hour, minute, second, fraction, utc, sign, offset_hours, offset_minutes = match.groups()
+
+    tzinfo = None
+    if utc:
+        tzinfo = datetime.timezone.utc
+    elif sign:
+        offset = datetime.timedelta(hours=int(offset_hours), minutes=int(offset_minutes or 0))
+        tzinfo = datetime.timezone(-offset if sign == '-' else offset)
+    return datetime.datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                             int((fraction or '0')[:6].ljust(6, '0')), tzinfo=tzinfo)
+
+
+def _parse_timestamptz(value):
+    value = parse_datetime(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def _parse_timestamp(value):
+    value = parse_datetime(value)
+    if value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _parse_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f'Could not parse {value!r} as date')
+    return parse_datetime(value).date()
+
+
+def value_parser(type: t.Union[DataType, StructDataType], is_array: bool = False,
+                 exact_numbers: bool = True, json_as_text: bool = False) -> t.Optional[t.Callable]:
+    """
+    Returns a function parsing a (not None) JSON value into the Python type for a column or struct field type,
+    or None when values are passed unchanged
+
+    Args:
+        type: The column or struct field type
+        is_array: If the values are arrays
+        exact_numbers: When true, numbers given as string are parsed as decimal.Decimal, otherwise as float
+        json_as_text: When true, values of JSON, XML and unknown types are serialized to JSON text
+    """
+    if isinstance(type, StructDataType):
+        field_parsers = [(field.name, value_parser(field.type, field.is_array, exact_numbers=exact_numbers, json_as_text=json_as_text))
+                         for field in type.fields]
+
+        def parse(value):
+            if not isinstance(value, dict):
+                raise ValueError(f'Could not parse {value!r} as object')
+            result = dict(value) # undeclared keys are kept unchanged
+            for name, field_parser in field_parsers:
+                field_value = value.get(name)
+                result[name] = field_parser(field_value) if field_parser and field_value is not None else field_value
+            return result
+    else:
+        parse = {
+            DataType.INT: _parse_int,
+            DataType.NUMBER: _parse_number if exact_numbers else _parse_float,
+            DataType.BOOL: _parse_bool,
+            DataType.TEXT: _parse_text,
+            DataType.DATE: _parse_date,
+            DataType.TIMESTAMP: _parse_timestamp,
+            DataType.TIMESTAMPTZ: _parse_timestamptz
+        }.get(type, _parse_json_text if json_as_text else None) # JSON, XML and unknown types
+
+    if is_array:
+        element_parse = parse
+
+        def parse(value):
+            if not isinstance(value, list):
+                value = [value]
+            if element_parse is None:
+                return value
+            return [None if element is None else element_parse(element) for element in value]
+
+    return parse
+
+
+def _coercion_error(column: Column, value, error: Exception):
+    raise ValueError(f'Could not coerce value {value!r} of column {column.name}: {error}') from error
+
+
+def compile_record_coercer(table: Table, exact_numbers: bool = True, json_as_text: bool = False) -> t.Callable[[dict], tuple]:
+    """
+    Compiles a function converting a record dict into a tuple of typed values in the column order of the table
+
+    Args:
+        table: The table, e.g. from `SingerStream.to_table()`
+        exact_numbers: When true, numbers given as string are parsed as decimal.Decimal, otherwise as float
+        json_as_text: When true, values of JSON, XML and unknown types are serialized to JSON text
+
+    Raises (when called):
+        ValueError: when a value can not be coerced or a value of a not nullable column is missing
+    """
+    namespace = {'_coercion_error': _coercion_error}
+    lines = ['def coerce(record):',
+             '    get = record.get']
+    for i, column in enumerate(table.columns):
+        namespace[f'column_{i}'] = column
+        parser = value_parser(column.type, column.is_array, exact_numbers=exact_numbers, json_as_text=json_as_text)
+        lines.append(f'    v{i} = get({column.name!r})')
+        if not column.nullable:
+            lines.append(f'    if v{i} is None: _coercion_error(column_{i}, None, ValueError("value is missing"))')
+        if parser:
+            namespace[f'parse_{i}'] = parser
+            lines += [f'    if v{i} is not None:',
+                      '        try:',
+                      f'            v{i} = parse_{i}(v{i})',
+                      '        except (ValueError, TypeError, ArithmeticError) as e:',
+                      f'            _coercion_error(column_{i}, v{i}, e)']
+    lines.append('    return (' + ''.join(f'v{i}, ' for i in range(len(table.columns))) + ')')
+
+    exec(compile('\n'.join(lines), f'<record coercer for {table.table_name}>', 'exec'), namespace)
+    return namespace['coerce']
+
+
+def coerce_records(coerce: t.Callable[[dict], tuple], records: t.Iterable[dict]) -> t.List[tuple]:
+    """Applies a compiled record coercer to a batch of records"""
+    return list(map(coerce, records))
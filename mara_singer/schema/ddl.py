@@ -0,0 +1,267 @@
+"""
+DDL generation for tables created from singer streams, and migration of existing tables.
+
+    statements = ddl.migration_statements(table, ddl.Dialect.POSTGRESQL,
+                                          live_columns=ddl.live_table_columns(cursor, ddl.Dialect.POSTGRESQL, 'users', 'public'),
+                                          schema_name='public')
+
+The migration only makes additive changes: the table is created when it does not exist, missing columns are added
+and columns which became nullable drop their NOT NULL constraint (where the database supports it). Columns are
+never dropped and column types are not changed.
+"""
+
+import enum
+import typing as t
+
+from . import Column, DataType, StructDataType, Table
+
+
+class Dialect(enum.EnumMeta):
+    """The SQL dialects for which DDL can be generated"""
+    POSTGRESQL = 'postgresql'
+    REDSHIFT = 'redshift'
+    SQLITE = 'sqlite'
+    BIGQUERY = 'bigquery'
+
+
+class LiveColumn:
+    def __init__(self, name: str, type: str, nullable: bool) -> None:
+        """
+        A column of an existing database table
+
+        Args:
+            name: The column name
+            type: The column type as reported by the database
+            nullable: If the column accepts NULL values
+        """
+        self.name = name
+        self.type = type
+        self.nullable = nullable
+
+
+def dialect_for_db(db: object) -> str:
+    """Returns the dialect for a mara_db database"""
+    from mara_db import dbs
+
+    if isinstance(db, str):
+        db = dbs.db(db)
+    if isinstance(db, dbs.RedshiftDB):
+        return Dialect.REDSHIFT
+    if isinstance(db, dbs.PostgreSQLDB):
+        return Dialect.POSTGRESQL
+    if isinstance(db, dbs.SQLiteDB):
+        return Dialect.SQLITE
+    if isinstance(db, dbs.BigQueryDB):
+        return Dialect.BIGQUERY
+    raise Exception(f'Not supported DB type {type(db)} for DDL generation')
+
+
+def quote_identifier(name: str, dialect: str) -> str:
+    """Quotes an identifier"""
+    if dialect == Dialect.BIGQUERY:
+        return '`' + name.replace('`', '\\`') + '`'
+    return '"' + name.replace('"', '""') + '"'
+
+
+def table_identifier(table_name: str, dialect: str, schema_name: str = None) -> str:
+    """Returns the quoted, optionally schema qualified table name"""
+    if schema_name and dialect != Dialect.SQLITE:
+        return f'{quote_identifier(schema_name, dialect)}.{quote_identifier(table_name, dialect)}'
+    return quote_identifier(table_name, dialect)
+
+
+_TYPES = {
+    Dialect.POSTGRESQL: {
+        DataType.INT: 'BIGINT',
+        DataType.NUMBER: 'NUMERIC',
+        DataType.TEXT: 'TEXT',
+        DataType.DATE: 'DATE',
+        DataType.TIMESTAMP: 'TIMESTAMP',
+        DataType.TIMESTAMPTZ: 'TIMESTAMPTZ',
+        DataType.BOOL: 'BOOLEAN',
+        DataType.XML: 'XML',
+        DataType.JSON: 'JSONB'
+    },
+    Dialect.REDSHIFT: {
+        DataType.INT: 'BIGINT',
+        DataType.NUMBER: 'DOUBLE PRECISION',
+        DataType.TEXT: 'VARCHAR(65535)',
+        DataType.DATE: 'DATE',
+        DataType.TIMESTAMP: 'TIMESTAMP',
+        DataType.TIMESTAMPTZ: 'TIMESTAMPTZ',
+        DataType.BOOL: 'BOOLEAN',
+        DataType.XML: 'VARCHAR(65535)',
+        DataType.JSON: 'SUPER'
+    },
+    Dialect.SQLITE: {
+        DataType.INT: 'INTEGER',
+        DataType.NUMBER: 'NUMERIC',
+        DataType.BOOL: 'BOOLEAN'
+    },
+    Dialect.BIGQUERY: {
+        DataType.INT: 'INT64',
+        DataType.NUMBER: 'NUMERIC',
+        DataType.TEXT: 'STRING',
+        DataType.DATE: 'DATE',
+        DataType.TIMESTAMP: 'DATETIME',
+        DataType.TIMESTAMPTZ: 'TIMESTAMP',
+        DataType.BOOL: 'BOOL',
+        DataType.XML: 'STRING',
+        DataType.JSON: 'JSON'
+    }
+}
+
+
+def data_type(type: t.Union[DataType, StructDataType], dialect: str, is_array: bool = False) -> str:
+    """Returns the SQL data type for a column or struct field type"""
+    if dialect == Dialect.SQLITE:
+        if is_array or isinstance(type, StructDataType):
+            return 'TEXT' # stored as JSON
+        return _TYPES[dialect].get(type, 'TEXT')
+
+    if dialect == Dialect.BIGQUERY:
+        if isinstance(type, StructDataType):
+            sql_type = 'STRUCT<' + ', '.join(f'{quote_identifier(field.name, dialect)} {data_type(field.type, dialect, field.is_array)}'
+                                             for field in type.fields) + '>'
+        else:
+            sql_type = _TYPES[dialect].get(type, 'JSON')
+        return f'ARRAY<{sql_type}>' if is_array else sql_type
+
+    if dialect == Dialect.REDSHIFT:
+        if is_array or isinstance(type, StructDataType):
+            return 'SUPER'
+        return _TYPES[dialect].get(type, 'SUPER')
+
+    # PostgreSQL: structs are stored as JSON
+    sql_type = 'JSONB' if isinstance(type, StructDataType) else _TYPES[dialect].get(type, 'JSONB')
+    return sql_type + ('[]' if is_array else '')
+
+
+def column_type(column: Column, dialect: str) -> str:
+    """Returns the SQL data type for a column"""
+    return data_type(column.type, dialect, column.is_array)
+
+
+def column_definition(column: Column, dialect: str, constraints: bool = True) -> str:
+    """Returns the column definition used in CREATE TABLE and ADD COLUMN"""
+    definition = f'{quote_identifier(column.name, dialect)} {column_type(column, dialect)}'
+    # BigQuery arrays can not be NULL and do not accept a NOT NULL constraint
+    if constraints and not column.nullable and not (dialect == Dialect.BIGQUERY and column.is_array):
+        definition += ' NOT NULL'
+    return definition
+
+
+def create_table_statement(table: Table, dialect: str, schema_name: str = None, table_name: str = None,
+                           if_not_exists: bool = True, temporary: bool = False, constraints: bool = True) -> str:
+    """
+    Returns the CREATE TABLE statement for a table
+
+    Args:
+        table: The table
+        dialect: The SQL dialect, see Dialect
+        schema_name: (default: table.schema_name) The database schema, ignored for SQLite
+        table_name: (default: table.table_name) The name of the created table
+        if_not_exists: Add IF NOT EXISTS
+        temporary: Create a temporary table
+        constraints: Add NOT NULL and PRIMARY KEY constraints
+    """
+    column_definitions = [column_definition(column, dialect, constraints=constraints) for column in table.columns]
+    if constraints and table.primary_key_columns:
+        primary_key = 'PRIMARY KEY (' + ', '.join(quote_identifier(column.name, dialect) for column in table.primary_key_columns) + ')'
+        if dialect == Dialect.BIGQUERY:
+            primary_key += ' NOT ENFORCED'
+        column_definitions.append(primary_key)
+
+    identifier = table_identifier(table_name or table.table_name, dialect,
+                                  schema_name=schema_name if schema_name is not None else table.schema_name)
+    return ('CREATE ' + ('TEMPORARY ' if temporary else '') + 'TABLE ' + ('IF NOT EXISTS ' if if_not_exists else '')
+            + identifier + ' (\n  ' + ',\n  '.join(column_definitions) + '\n)')
+
+
+def live_table_columns(cursor: object, dialect: str, table_name: str, schema_name: str = None) -> t.Optional[t.Dict[str, LiveColumn]]:
+    """
+    Reads the columns of an existing table
+
+    Args:
+        cursor: A DB-API cursor (or a sqlite3 connection)
+        dialect: The SQL dialect, see Dialect
+        table_name: The table name
+        schema_name: The database schema, ignored for SQLite
+
+    Returns:
+        The columns by name, or None when the table does not exist
+    """
+    if dialect == Dialect.SQLITE:
+        rows = [(row[1], row[2], not row[3]) for row in cursor.execute(f'PRAGMA table_info({quote_identifier(table_name, dialect)})').fetchall()]
+    elif dialect == Dialect.BIGQUERY:
+        cursor.execute(f'SELECT column_name, data_type, is_nullable = \'YES\''
+                       f' FROM {quote_identifier(schema_name, dialect)}.INFORMATION_SCHEMA.COLUMNS'
+                       f' WHERE table_name = \'{table_name.replace(chr(39), chr(39) * 2)}\' ORDER BY ordinal_position')
+        rows = cursor.fetchall()
+    else:
+        cursor.execute('SELECT column_name, data_type, is_nullable = \'YES\' FROM information_schema.columns'
+                       ' WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position',
+                       (schema_name or 'public', table_name))
+        rows = cursor.fetchall()
+
+    if not rows:
+        return None
+    return {name: LiveColumn(name, type, bool(nullable)) for name, type, nullable in rows}
+
+
+def migration_statements(table: Table, dialect: str, live_columns: t.Optional[t.Dict[str, LiveColumn]],
+                         schema_name: str = None) -> t.List[str]:
+    """
+    Returns the statements migrating an existing table to a table definition
+
+    Args:
+        table: The table definition
+        dialect: The SQL dialect, see Dialect
+        live_columns: The columns of the existing table, see live_table_columns(). None when the table does not exist.
+        schema_name: (default: table.schema_name) The database schema, ignored for SQLite
+    """
+    if schema_name is None:
+        schema_name = table.schema_name
+    if live_columns is None:
+        return [create_table_statement(table, dialect, schema_name=schema_name)]
+
+    identifier = table_identifier(table.table_name, dialect, schema_name=schema_name)
+    statements = []
+    for column in table.columns:
+        live_column = live_columns.get(column.name)
+        if live_column is None:
+            # added columns can not be NOT NULL because the existing rows have no value
+            statements.append(f'ALTER TABLE {identifier} ADD COLUMN {column_definition(column, dialect, constraints=False)}')
+        elif column.nullable and not live_column.nullable and dialect in [Dialect.POSTGRESQL, Dialect.BIGQUERY]:
+            statements.append(f'ALTER TABLE {identifier} ALTER COLUMN {quote_identifier(column.name, dialect)} DROP NOT NULL')
+    return statements
+
+
+def migrate_table(db: object, table: Table, schema_name: str = None) -> t.List[str]:
+    """
+    Creates or migrates a table in a mara_db database
+
+    Args:
+        db: The database alias or mara_db database
+        table: The table definition
+        schema_name: (default: table.schema_name) The database schema, ignored for SQLite
+
+    Returns:
+        The executed statements
+    """
+    from mara_db import dbs
+
+    if isinstance(db, str):
+        db = dbs.db(db)
+    dialect = dialect_for_db(db)
+    if schema_name is None:
+        schema_name = table.schema_name
+
+    with dbs.cursor_context(db) as cursor:
+        live_columns = live_table_columns(cursor, dialect, table.table_name, schema_name=schema_name)
+        statements = migration_statements(table, dialect, live_columns, schema_name=schema_name)
+        if statements and live_columns is None and schema_name and dialect in [Dialect.POSTGRESQL, Dialect.REDSHIFT]:
+            statements.insert(0, f'CREATE SCHEMA IF NOT EXISTS {quote_identifier(schema_name, dialect)}')
+        for statement in statements:
+            cursor.execute(statement)
+    return statements
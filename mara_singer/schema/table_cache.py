@@ -0,0 +1,137 @@
+"""
+A cache for the Table objects created from singer stream schemas.
+
+Entries are keyed by a hash of the stream name, JSON schema, metadata and key properties, so a changed catalog
+never hits a stale entry. The cache is held in memory with an LRU bound (config.table_cache_size()) and
+optionally on disk (config.table_cache_dir()), which makes it survive across processes.
+"""
+
+import collections
+import hashlib
+import os
+import pathlib
+import pickle
+import threading
+import typing as t
+
+from . import Table
+from .. import config
+from .. import fastjson
+
+
+# increase when the Table structure or the mapping from JSON schema changes to invalidate disk cache entries
+_CACHE_VERSION = 1
+
+
+def table_cache_key(name: str, schema: dict, metadata: t.List[dict], key_properties: t.List[str] = None) -> str:
+    """Returns a stable hash for the input of a JSON schema to Table mapping"""
+    data = fastjson.dumps([_CACHE_VERSION, name, schema, metadata, key_properties])
+    return hashlib.blake2b(data.encode(), digest_size=20).hexdigest()
+
+
+def copy_table(table: Table) -> Table:
+    """Returns a copy of a table. The column objects are shared."""
+    copy = Table(table_name=table.table_name, schema_name=table.schema_name)
+    copy.columns = list(table.columns)
+    copy.primary_key_columns = list(table.primary_key_columns)
+    return copy
+
+
+class TableCache:
+    """
+    An LRU cache for Table objects with an optional directory to which the entries are pickled
+
+    Args:
+        max_size: The maximum number of entries held in memory and on disk
+        cache_dir: (optional) The directory for the disk cache
+    """
+    def __init__(self, max_size: int, cache_dir: t.Union[str, pathlib.Path] = None) -> None:
+        self.max_size = max_size
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir else None
+
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'collections.OrderedDict[str, Table]' = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key: str, create_table: t.Callable[[], Table]) -> Table:
+        """
+        Returns a copy of the cached table for a key, or creates and caches the table
+
+        Args:
+            key: The cache key, see table_cache_key()
+            create_table: A function creating the table on a cache miss
+        """
+        with self._lock:
+            table = self._entries.get(key)
+            if table is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy_table(table)
+
+        table = self._read_from_disk(key)
+        if table is None:
+            table = create_table()
+            self._write_to_disk(key, table)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+
+        with self._lock:
+            self._entries[key] = table
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return copy_table(table)
+
+    def clear(self):
+        """Removes all entries from memory"""
+        with self._lock:
+            self._entries.clear()
+
+    def _file_path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / f'{key}.pickle'
+
+    def _read_from_disk(self, key: str) -> t.Optional[Table]:
+        if not self.cache_dir:
+            return None
+        file_path = self._file_path(key)
+        try:
+            with open(file_path, 'rb') as cache_file:
+                table = pickle.load(cache_file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        os.utime(file_path) # the modification time is used for evicting the least recently used entries
+        return table
+
+    def _write_to_disk(self, key: str, table: Table):
+        if not self.cache_dir:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file_path = self.cache_dir / f'{key}.pickle.tmp-{os.getpid()}-{threading.get_ident()}'
+        with open(tmp_file_path, 'wb') as cache_file:
+            pickle.dump(table, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file_path, self._file_path(key))
+
+        file_paths = list(self.cache_dir.glob('*.pickle'))
+        if len(file_paths) > self.max_size:
+            file_paths.sort(key=lambda file_path: file_path.stat().st_mtime)
+            for file_path in file_paths[:len(file_paths) - self.max_size]:
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass # removed by another process
+
+
+_table_cache: t.Optional[TableCache] = None
+_table_cache_lock = threading.Lock()
+
+
+def table_cache() -> TableCache:
+    """The table cache used by SingerStream.to_table()"""
+    global _table_cache
+    with _table_cache_lock:
+        if _table_cache is None:
+            _table_cache = TableCache(max_size=config.table_cache_size(), cache_dir=config.table_cache_dir())
+        return _table_cache
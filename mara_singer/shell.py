@@ -1,67 +1,178 @@
 """Command execution in bash shells"""
 
-import time
+import typing as t
 
 from mara_pipelines import config
 from mara_pipelines.logging import logger
 
-from .logging import SingerTapReadLogThread
+from .logging import SingerLogHandler
+from .logging.forwarder import SingerLogForwarder
+from .metrics import SingerMetricsCollector
+from .router import SingerMessageRouter
+from .runner import shared_multiplexer
+from .state import SingerStateCheckpointer
 
-def singer_run_shell_command(command: str, log_command: bool = True):
+def singer_run_shell_command(command: str, log_command: bool = True, stdout_consumer: t.Callable[[str], None] = None,
+                             metrics: SingerMetricsCollector = None,
+                             capture_output: bool = False, capture_max_memory: int = 10 * 1024 * 1024):
     """
     Runs a command in a bash shell and logs the output of the command in (near)real-time according to the
     singer specification: https://github.com/singer-io/getting-started/blob/master/docs/SPEC.md#output
 
+    The output to stdout is streamed, it is not kept in memory.
+
     Args:
         command: The command to run
         log_command: When true, then the command itself is logged before execution
+        stdout_consumer: (optional) When given, each line written to stdout is passed to it instead of being logged
+        metrics: (optional) The collector to which the METRIC messages of the tap are added
+        capture_output: When true, the output to stdout is captured and returned
+        capture_max_memory: The maximum number of bytes of captured output held in memory. Larger output is
+            spilled to a temp file.
 
     Returns:
         Either (in order)
         - False when the exit code of the command was not 0
-        - True when there was no output to stdout
-        - The output to stdout, as an array of lines
+        - When capture_output is true: the output to stdout as a text file object positioned at the start.
+          The caller should close it.
+        - True
     """
-    import shlex, subprocess, threading
+    import shlex, subprocess, tempfile
 
     if log_command:
         logger.log(command, format=logger.Format.ITALICS)
 
     process = subprocess.Popen(shlex.split(config.bash_command_string()) + ['-c', command],
-                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                               universal_newlines=True)
-
-    # keep stdout output
-    output_lines = []
-
-    # unfortunately, only file descriptors and the system stream can be passed to
-    # subprocess.Popen(..) (and not custom streams without a file handle).
-    # So in order to see be able to log the output in real-time, we have to
-    # query the output steams of the process from to separate threads
-    def read_process_stdout():
-        for line in process.stdout:
-            output_lines.append(line)
-            logger.log(line, format=logger.Format.VERBATIM)
-
-    read_stdout_thread = threading.Thread(target=read_process_stdout)
-    read_stdout_thread.start()
-    read_singertaplog_thread = SingerTapReadLogThread(process=process)
-    read_singertaplog_thread.start()
-
-    # wait until the process finishes
-    while process.poll() is None:
-        time.sleep(0.005)
-
-    read_stdout_thread.join()
-    read_singertaplog_thread.join()
-
-    if read_singertaplog_thread.has_error:
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    output = tempfile.SpooledTemporaryFile(max_size=capture_max_memory, mode='w+') if capture_output else None
+
+    forwarder = SingerLogForwarder()
+
+    def handle_stdout_line(line: str):
+        if output:
+            output.write(line)
+        if stdout_consumer:
+            stdout_consumer(line)
+        else:
+            forwarder.log(line)
+
+    # stdout and stderr are read by the shared multiplexer thread, which blocks until there is output
+    multiplexer = shared_multiplexer()
+    stdout_reader = multiplexer.add_stream(process.stdout, handle_stdout_line)
+    log_handler = SingerLogHandler(metrics=metrics, forwarder=forwarder)
+    stderr_reader = multiplexer.add_stream(process.stderr, log_handler.handle_line)
+
+    # wait until the process finishes and all of its output is handled
+    try:
+        process.wait()
+        stdout_reader.wait()
+        stderr_reader.wait()
+    finally:
+        forwarder.close()
+
+    exitcode = process.returncode
+    if log_handler.has_error or exitcode != 0:
+        if output:
+            output.close()
+        if log_handler.has_error:
+            logger.log('Singer tap error occured', is_error=True, format=logger.Format.ITALICS)
+        else:
+            logger.log(f'exit code {exitcode}', is_error=True, format=logger.Format.ITALICS)
+        return False
+
+    if output:
+        output.seek(0)
+        return output
+    return True
+
+def singer_run_tap_to_target(tap_command: t.List[str], target_command: t.List[str],
+                             state_checkpointer: SingerStateCheckpointer = None, log_command: bool = True,
+                             buffer_size: int = 1024 * 1024, metrics: SingerMetricsCollector = None) -> t.Union[SingerMessageRouter, bool]:
+    """
+    Runs a singer tap and a singer target as two processes and routes the messages from the tap
+    to the target in-process, without a bash pipe in between.
+
+    Args:
+        tap_command: The tap command and its arguments
+        target_command: The target command and its arguments
+        state_checkpointer: (optional) When given, the states emitted by the target are written through the checkpointer
+        log_command: When true, then the command itself is logged before execution
+        buffer_size: The maximum number of bytes read from the tap at once
+        metrics: (optional) The collector to which the METRIC messages of the tap are added
+
+    Returns:
+        False when one of the processes failed, otherwise the router holding the message statistics
+    """
+    import shlex, subprocess
+
+    if log_command:
+        logger.log(' '.join(shlex.quote(str(arg)) for arg in tap_command) + ' \\\n'
+                   + '  | ' + ' '.join(shlex.quote(str(arg)) for arg in target_command),
+                   format=logger.Format.ITALICS)
+
+    router = SingerMessageRouter(buffer_size=buffer_size,
+                                 on_target_state=state_checkpointer.checkpoint if state_checkpointer else None)
+
+    processes = []
+    forwarder = None
+    try:
+        tap_process = subprocess.Popen([str(arg) for arg in tap_command],
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        processes.append(tap_process)
+        target_process = subprocess.Popen([str(arg) for arg in target_command],
+                                          stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        processes.append(target_process)
+
+        multiplexer = shared_multiplexer()
+        target_stdout_reader = multiplexer.add_stream(target_process.stdout, router.handle_target_output)
+        forwarder = SingerLogForwarder()
+        tap_log_handler = SingerLogHandler(metrics=metrics, forwarder=forwarder)
+        target_log_handler = SingerLogHandler(forwarder=forwarder)
+        tap_stderr_reader = multiplexer.add_stream(tap_process.stderr, tap_log_handler.handle_line)
+        target_stderr_reader = multiplexer.add_stream(target_process.stderr, target_log_handler.handle_line)
+
+        # pump the messages in this thread until the tap closes stdout
+        target_accepted_all = router.pump(tap_process.stdout, target_process.stdin)
+        try:
+            target_process.stdin.close()
+        except BrokenPipeError:
+            target_accepted_all = False
+        if not target_accepted_all:
+            logger.log('The target closed its input before all messages were passed', is_error=True, format=logger.Format.ITALICS)
+            tap_process.terminate()
+
+        tap_process.wait()
+        target_process.wait()
+
+        target_stdout_reader.wait()
+        tap_stderr_reader.wait()
+        target_stderr_reader.wait()
+    finally:
+        # no process may outlive the call, e.g. when the target could not be started
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        if forwarder:
+            forwarder.close()
+
+    for stream, record_count in router.record_counts.items():
+        logger.log(f'{record_count} records routed for stream {stream}', format=logger.Format.ITALICS)
+
+    if state_checkpointer:
+        state_checkpointer.flush()
+
+    if tap_log_handler.has_error or target_log_handler.has_error:
         logger.log('Singer tap error occured', is_error=True, format=logger.Format.ITALICS)
         return False
 
-    exitcode = process.returncode
-    if exitcode != 0:
-        logger.log(f'exit code {exitcode}', is_error=True, format=logger.Format.ITALICS)
+    for name, process in [('tap', tap_process), ('target', target_process)]:
+        if process.returncode != 0:
+            logger.log(f'{name} exit code {process.returncode}', is_error=True, format=logger.Format.ITALICS)
+            return False
+
+    if not target_accepted_all:
         return False
 
-    return output_lines or True
\ No newline at end of file
+    return router
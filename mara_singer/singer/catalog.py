@@ -20,6 +20,9 @@ def write_catalog(catalog):
 # pylint: disable=too-many-instance-attributes
 class CatalogEntry():
 
+    __slots__ = ['tap_stream_id', 'stream', 'key_properties', '_schema', '_raw_schema', 'replication_key',
+                 'replication_method', 'is_view', 'database', 'table', 'row_count', 'stream_alias', 'metadata']
+
     def __init__(self, tap_stream_id=None, stream=None,
                  key_properties=None, schema=None, replication_key=None,
                  is_view=None, database=None, table=None, row_count=None,
@@ -28,7 +31,8 @@ class CatalogEntry():
         self.tap_stream_id = tap_stream_id
         self.stream = stream
         self.key_properties = key_properties
-        self.schema = schema
+        self._schema = schema
+        self._raw_schema = None
         self.replication_key = replication_key
         self.replication_method = replication_method
         self.is_view = is_view
@@ -39,10 +43,40 @@ class CatalogEntry():
         self.metadata = metadata
 
     def __str__(self):
-        return str(self.__dict__)
+        return str({k: getattr(self, k) for k in self.__slots__})
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        if not isinstance(other, CatalogEntry):
+            return NotImplemented
+        return (all(getattr(self, k) == getattr(other, k) for k in self.__slots__ if k not in ('_schema', '_raw_schema'))
+                and self.schema == other.schema)
+
+    @property
+    def schema(self):
+        """The schema of the stream. When the entry was loaded from a dict, the Schema object is created on first access."""
+        if self._schema is None and self._raw_schema is not None:
+            self._schema = Schema.from_dict(self._raw_schema)
+            self._raw_schema = None
+        return self._schema
+
+    @schema.setter
+    def schema(self, schema):
+        self._schema = schema
+        self._raw_schema = None
+
+    @property
+    def raw_schema(self):
+        """The schema of the stream as dict, without creating a Schema object"""
+        if self._raw_schema is not None:
+            return self._raw_schema
+        if self._schema is not None:
+            return self._schema.to_dict()
+        return None
+
+    def set_raw_schema(self, raw_schema):
+        """Sets the schema as dict. It is passed through unchanged by to_dict() until the schema property is accessed."""
+        self._schema = None
+        self._raw_schema = raw_schema
 
     def is_selected(self):
         mdata = metadata_module.to_map(self.metadata)
@@ -63,8 +97,10 @@ class CatalogEntry():
             result['replication_method'] = self.replication_method
         if self.key_properties is not None:
             result['key_properties'] = self.key_properties
-        if self.schema is not None:
-            schema = self.schema.to_dict()  # pylint: disable=no-member
+        if self._raw_schema is not None:
+            result['schema'] = self._raw_schema
+        elif self._schema is not None:
+            schema = self._schema.to_dict()  # pylint: disable=no-member
             result['schema'] = schema
         if self.is_view is not None:
             result['is_view'] = self.is_view
@@ -84,11 +120,15 @@ class Catalog():
     def __init__(self, streams):
         self.streams = streams
 
+        # index tap_stream_id -> CatalogEntry, see get_stream()
+        self._stream_index = None
+        self._stream_index_key = None
+
     def __str__(self):
-        return str(self.__dict__)
+        return str({'streams': self.streams})
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return self.streams == other.streams
 
     @classmethod
     def load(cls, filename):
@@ -97,11 +137,6 @@ class Catalog():
 
     @classmethod
     def from_dict(cls, data):
-        # TODO: We may want to store streams as a dict where the key is a
-        # tap_stream_id and the value is a CatalogEntry. This will allow
-        # faster lookup based on tap_stream_id. This would be a breaking
-        # change, since callers typically access the streams property
-        # directly.
         streams = []
         for stream in data['streams']:
             entry = CatalogEntry()
@@ -111,7 +146,7 @@ class Catalog():
             entry.key_properties = stream.get('key_properties')
             entry.database = stream.get('database_name')
             entry.table = stream.get('table_name')
-            entry.schema = Schema.from_dict(stream.get('schema'))
+            entry.set_raw_schema(stream.get('schema'))
             entry.is_view = stream.get('is_view')
             entry.stream_alias = stream.get('stream_alias')
             entry.metadata = stream.get('metadata')
@@ -125,11 +160,23 @@ class Catalog():
     def dump(self):
         json.dump(self.to_dict(), sys.stdout, indent=2)
 
-    def get_stream(self, tap_stream_id):
+    def _build_stream_index(self):
+        self._stream_index = {}
         for stream in self.streams:
-            if stream.tap_stream_id == tap_stream_id:
-                return stream
-        return None
+            self._stream_index.setdefault(stream.tap_stream_id, stream)
+        self._stream_index_key = (id(self.streams), len(self.streams))
+
+    def get_stream(self, tap_stream_id):
+        # the streams list is public and might be modified; the index is rebuilt when the list
+        # was replaced or resized and when an indexed entry got another tap_stream_id
+        if self._stream_index is None or self._stream_index_key != (id(self.streams), len(self.streams)):
+            self._build_stream_index()
+
+        stream = self._stream_index.get(tap_stream_id)
+        if stream is not None and stream.tap_stream_id != tap_stream_id:
+            self._build_stream_index()
+            stream = self._stream_index.get(tap_stream_id)
+        return stream
 
     def _shuffle_streams(self, state):
         currently_syncing = get_currently_syncing(state)
@@ -23,12 +23,40 @@ STANDARD_KEYS = [
 ]
 
 
+# These keys are set for almost every node of a schema and therefore are stored in slots. All other
+# standard keys are rarely used and only stored in a dict when present, see Schema._extra.
+_SLOT_KEYS = ['type', 'format', 'selected', 'inclusion']
+_EXTRA_KEYS = [key for key in STANDARD_KEYS if key not in _SLOT_KEYS]
+_EXTRA_KEY_SET = frozenset(_EXTRA_KEYS)
+
+
+def _extra_key_property(key):
+    def getter(self):
+        return self._extra.get(key) if self._extra else None
+
+    def setter(self, value):
+        if value is None:
+            if self._extra:
+                self._extra.pop(key, None)
+        elif self._extra is None:
+            self._extra = {key: value}
+        else:
+            self._extra[key] = value
+
+    return property(getter, setter)
+
+
 class Schema():  # pylint: disable=too-many-instance-attributes
     '''Object model for JSON Schema.
     Tap and Target authors may find this to be more convenient than
     working directly with JSON Schema data structures.
+
+    Large catalogs create hundreds of thousands of Schema objects, so the
+    class uses __slots__ and stores only the keys which are present.
     '''
 
+    __slots__ = ['properties', 'items', '_extra'] + _SLOT_KEYS
+
     # pylint: disable=too-many-locals
     def __init__(self, type=None, format=None, properties=None, items=None,
                  selected=None, inclusion=None, description=None, minimum=None,
@@ -41,29 +69,46 @@ class Schema():  # pylint: disable=too-many-instance-attributes
         self.items = items
         self.selected = selected
         self.inclusion = inclusion
-        self.description = description
-        self.minimum = minimum
-        self.maximum = maximum
-        self.exclusiveMinimum = exclusiveMinimum
-        self.exclusiveMaximum = exclusiveMaximum
-        self.multipleOf = multipleOf
-        self.maxLength = maxLength
-        self.minLength = minLength
-        self.anyOf = anyOf
         self.format = format
-        self.additionalProperties = additionalProperties
-        self.patternProperties = patternProperties
+
+        extra = {
+            'description': description,
+            'minimum': minimum,
+            'maximum': maximum,
+            'exclusiveMinimum': exclusiveMinimum,
+            'exclusiveMaximum': exclusiveMaximum,
+            'multipleOf': multipleOf,
+            'maxLength': maxLength,
+            'minLength': minLength,
+            'anyOf': anyOf,
+            'additionalProperties': additionalProperties,
+            'patternProperties': patternProperties,
+        }
+        self._extra = {k: v for k, v in extra.items() if v is not None} or None
+
+    def _present_items(self):
+        '''Returns the attributes which are not None'''
+        result = {}
+        for key in ['type', 'properties', 'items', 'selected', 'inclusion', 'format']:
+            value = getattr(self, key)
+            if value is not None:
+                result[key] = value
+        if self._extra:
+            result.update(self._extra)
+        return result
 
     def __str__(self):
         return json.dumps(self.to_dict())
 
     def __repr__(self):
-        pairs = [k + '=' + repr(v) for k, v in self.__dict__.items()]
+        pairs = [k + '=' + repr(v) for k, v in self._present_items().items()]
         args = ', '.join(pairs)
         return 'Schema(' + args + ')'
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        if not isinstance(other, Schema):
+            return NotImplemented
+        return self._present_items() == other._present_items()
 
     def to_dict(self):
         '''Return the raw JSON Schema as a (possibly nested) dict.'''
@@ -80,9 +125,21 @@ class Schema():  # pylint: disable=too-many-instance-attributes
         if self.items is not None:
             result['items'] = self.items.to_dict()  # pylint: disable=no-member
 
-        for key in STANDARD_KEYS:
-            if self.__dict__.get(key) is not None:
-                result[key] = self.__dict__[key]
+        extra = self._extra
+        if extra:
+            for key in STANDARD_KEYS:
+                value = getattr(self, key) if key in _SLOT_KEYS else extra.get(key)
+                if value is not None:
+                    result[key] = value
+        else:
+            if self.selected is not None:
+                result['selected'] = self.selected
+            if self.inclusion is not None:
+                result['inclusion'] = self.inclusion
+            if self.format is not None:
+                result['format'] = self.format
+            if self.type is not None:
+                result['type'] = self.type
 
         return result
 
@@ -91,6 +148,9 @@ class Schema():  # pylint: disable=too-many-instance-attributes
         '''Initialize a Schema object based on the JSON Schema structure.
         :param schema_defaults: The default values to the Schema
         constructor.'''
+        if not schema_defaults:
+            return cls._from_dict(data)
+
         kwargs = schema_defaults.copy()
         properties = data.get('properties')
         items = data.get('items')
@@ -105,4 +165,35 @@ class Schema():  # pylint: disable=too-many-instance-attributes
         for key in STANDARD_KEYS:
             if key in data:
                 kwargs[key] = data[key]
-        return Schema(**kwargs)
\ No newline at end of file
+        return Schema(**kwargs)
+
+    @classmethod
+    def _from_dict(cls, data):
+        '''Fast path of from_dict() without schema defaults, setting only the present keys'''
+        schema = cls.__new__(cls)
+
+        properties = data.get('properties')
+        items = data.get('items')
+        schema.properties = {
+            k: cls._from_dict(v)
+            for k, v in properties.items()
+        } if properties is not None else None
+        schema.items = cls._from_dict(items) if items is not None else None
+
+        schema.type = data.get('type')
+        schema.format = data.get('format')
+        schema.selected = data.get('selected')
+        schema.inclusion = data.get('inclusion')
+
+        extra = None
+        for key, value in data.items():
+            if key in _EXTRA_KEY_SET and value is not None:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        schema._extra = extra
+        return schema
+
+
+for _key in _EXTRA_KEYS:
+    setattr(Schema, _key, _extra_key_property(_key))
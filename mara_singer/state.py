@@ -1,45 +1,216 @@
+import collections
 import os
 import pathlib
 import json
+import threading
+import time
+import typing as t
+import uuid
 
 from .singer import bookmarks as singer_bookmarks
 
 from . import config
 
+
+def parse_state_line(line: str) -> t.Optional[dict]:
+    """
+    Parses a line written by a singer target to stdout. Targets write the committed state as JSON object, but some
+    also print banners or other text there.
+
+    Returns:
+        The state, or None when the line is not a state
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        state = json.loads(line)
+    except ValueError:
+        return None
+    return state if isinstance(state, dict) else None
+
+
+class SingerStateSink:
+    def __init__(self, file_path: pathlib.Path, history_size: int = 0) -> None:
+        """
+        Keeps the latest state of a tap in memory and writes it to a state file by atomic rename.
+        Memory and I/O stay constant no matter how many states a target emits.
+
+        Args:
+            file_path: The state file
+            history_size: (default: 0) The number of previously written states kept in memory for debugging
+        """
+        self.file_path = pathlib.Path(file_path)
+        self.state = None
+        self.history = collections.deque(maxlen=history_size) if history_size else None
+
+    def read(self) -> dict:
+        """Reads the state from the state file. Returns an empty state when the file does not exist or is empty."""
+        if os.path.isfile(self.file_path):
+            with open(self.file_path,'r') as state_file:
+                data = state_file.read()
+            self.state = json.loads(data) if data.strip() else {}
+        else:
+            self.state = {}
+        return self.state
+
+    def write(self, state: dict):
+        """Takes over a new state. Call flush() to persist it."""
+        if self.history is not None and self.state is not None:
+            self.history.append(self.state)
+        self.state = state
+
+    def flush(self):
+        """Writes the latest state to disk and replaces the state file atomically"""
+        if self.state is None:
+            return
+
+        # a unique temp file: several processes can flush the same state file at once, e.g. backfill windows
+        tmp_file_path = pathlib.Path(f'{self.file_path}.{uuid.uuid4().hex}.tmp')
+        try:
+            with open(tmp_file_path,'w') as state_file:
+                json.dump(self.state, state_file)
+                state_file.flush()
+                os.fsync(state_file.fileno())
+            os.replace(tmp_file_path, self.file_path)
+        except BaseException:
+            if os.path.exists(tmp_file_path):
+                os.remove(tmp_file_path)
+            raise
+
+
 class SingerTapState:
-    def __init__(self, tap_name: str) -> None:
-        """State for a singer tap"""
+    def __init__(self, tap_name: str, state_file_name: str = None) -> None:
+        """
+        State for a singer tap
+
+        Args:
+            tap_name: The tap command name (e.g. tap-exchangeratesapi)
+            state_file_name: (default: {tap_name}.json) The state file name
+        """
         self.tap_name = tap_name
+        self.state_file_name = state_file_name if state_file_name else f'{tap_name}.json'
 
         # cache for loaded
         self._state = None
+        self._sink = None
+
+        # guards the state when it is checkpointed from several threads
+        self._lock = threading.RLock()
 
     def state_file_path(self) -> pathlib.Path:
-        return pathlib.Path(config.state_dir()) / f'{self.tap_name}.json'
+        return pathlib.Path(config.state_dir()) / self.state_file_name
+
+    @property
+    def sink(self) -> SingerStateSink:
+        """The sink through which the state file is read and written"""
+        if not self._sink:
+            self._sink = SingerStateSink(self.state_file_path(), history_size=config.state_history_size())
+        return self._sink
+
+    @property
+    def history(self) -> t.List[dict]:
+        """The states written before the current one in this process, see config.state_history_size()"""
+        return list(self.sink.history or [])
 
     def _load_state(self):
-        if not self._state:
-            if os.path.isfile(self.state_file_path()):
-                with open(self.state_file_path(),'r') as state_file:
-                    data = state_file.read()
-                    if len(data) == 0: # empty file
-                        self._state = {}
-                    else:
-                        self._state = json.loads(data)
-            else:
-                self._state = {} # no config file exists -> create an empty config
+        if self._state is None:
+            self._state = self.sink.read()
 
     def save(self):
-        """Saves the changes of a state file"""
+        """Saves the changes of a state file. The file is written to disk and replaced atomically."""
 
-        if not self._state: 
+        if self._state is None:
             return # nothing loaded --> nothing changed --> no need to save
 
-        with open(self.state_file_path(),'w') as state_file:
-            json.dump(self._state, state_file)
+        with self._lock:
+            if self.sink.state is not self._state:
+                self.sink.write(self._state)
+            self.sink.flush()
+
+    def set_state(self, state: dict):
+        """Replaces the whole state. Call save() to persist the change."""
+        self._state = state
+        self.sink.write(state)
 
     def get_bookmark(self, tap_stream_id, key, default=None):
-        if not self._state:
+        if self._state is None:
             self._load_state()
 
         return singer_bookmarks.get_bookmark(self._state, tap_stream_id, key, default=default)
+
+    def set_bookmark(self, tap_stream_id, key, val):
+        """Sets a bookmark of a stream. Call save() to persist the change."""
+        if self._state is None:
+            self._load_state()
+
+        singer_bookmarks.write_bookmark(self._state, tap_stream_id, key, val)
+
+    def get_stream_bookmarks(self, tap_stream_id) -> dict:
+        """Returns all bookmarks of a stream"""
+        if self._state is None:
+            self._load_state()
+
+        return self._state.get('bookmarks', {}).get(tap_stream_id, {})
+
+    def set_stream_bookmarks(self, tap_stream_id, bookmarks: dict):
+        """Replaces all bookmarks of a stream. Call save() to persist the change."""
+        if self._state is None:
+            self._load_state()
+
+        singer_bookmarks.reset_stream(self._state, tap_stream_id)
+        for key, val in bookmarks.items():
+            singer_bookmarks.write_bookmark(self._state, tap_stream_id, key, val)
+
+
+class SingerStateCheckpointer:
+    def __init__(self, state: SingerTapState, interval: float = None, tap_stream_id: str = None) -> None:
+        """
+        Persists the states emitted by a singer target while the target is running, so that a failed
+        sync can be resumed from the last committed bookmark.
+
+        Args:
+            state: The tap state to write to
+            interval: (default: None) The minimal number of seconds between two writes of the state file. When None,
+                the state is only written on flush()
+            tap_stream_id: (default: None) When given, only the bookmarks of this stream are taken over into the state
+        """
+        self.state = state
+        self.interval = interval
+        self.tap_stream_id = tap_stream_id
+
+        self._pending_state = None
+        self._last_save = time.monotonic()
+
+    def checkpoint(self, state: dict):
+        """Takes over a state emitted by the target. The state file is written when the interval has passed."""
+        self._pending_state = state
+        if self.interval is not None and time.monotonic() - self._last_save >= self.interval:
+            self.flush()
+
+    def checkpoint_line(self, line: str):
+        """Takes over a state line written by the target to stdout. Lines which are not a state are logged."""
+        state = parse_state_line(line)
+        if state is None:
+            if line.strip():
+                from mara_pipelines.logging import logger
+                logger.log(line.strip(), format=logger.Format.VERBATIM)
+            return
+        self.checkpoint(state)
+
+    def flush(self):
+        """Writes the last emitted state to the state file"""
+        if self._pending_state is None:
+            return
+
+        with self.state._lock:
+            if self.tap_stream_id:
+                bookmarks = self._pending_state.get('bookmarks', {})
+                if self.tap_stream_id in bookmarks:
+                    self.state.set_stream_bookmarks(self.tap_stream_id, bookmarks[self.tap_stream_id])
+            else:
+                self.state.set_state(self._pending_state)
+            self.state.save()
+
+        self._pending_state = None
+        self._last_save = time.monotonic()
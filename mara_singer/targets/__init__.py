@@ -0,0 +1,214 @@
+"""
+Singer targets implemented inside mara_singer. A target reads singer messages from stdin and can be used
+like any other singer target, e.g. `python -m mara_singer.targets.postgres --config <config file>`.
+See also: https://github.com/singer-io/getting-started/blob/master/docs/SPEC.md
+"""
+
+import argparse
+import json
+import sys
+import time
+import typing as t
+
+from .. import fastjson
+from ..batching import BatchSizer
+from ..schema import Table
+from ..schema.coercion import coerce_records, compile_record_coercer
+
+
+class SingerTarget:
+    """
+    Base class for a singer target
+
+    The records are buffered per stream and loaded in batches. A STATE message is written to stdout only after
+    all records received before it have been loaded, so that the state can safely be used for the next run.
+
+    The batch size of each stream adapts to the row width and load latency, see mara_singer.batching.BatchSizer.
+    All streams are flushed when the buffered records exceed `max_batch_bytes` or `batch_size_rows`, and at
+    least every `flush_interval` seconds (checked on STATE messages and every 256 records) so that states are
+    emitted regularly.
+
+    Targets writing files which are only readable when completed (e.g. Parquet, compressed files) can hold back
+    a state in `commit()` until their current parts are completed. The parts are completed at the latest
+    `flush_interval` seconds after the last emitted state and at the end of the run.
+
+    Config keys:
+        batch_size_rows: (default: 100000) The maximum number of rows buffered over all streams
+        min_batch_rows: (default: 1000) The number of rows of the first batch of a stream
+        max_batch_bytes: (default: 64 MiB) The maximum (serialized) size of the buffered rows in bytes
+        batch_load_seconds: (default: 5) The targeted number of seconds a batch takes to load
+        flush_interval: (default: 60) The maximum number of seconds between two flushes
+
+    Args:
+        config: The target config
+        output: (default: sys.stdout) The stream to which the states are written
+    """
+    # options for the record coercion, see mara_singer.schema.coercion
+    exact_numbers = True
+    json_as_text = False
+
+    def __init__(self, config: dict, output: t.TextIO = None) -> None:
+        self.config = config
+        self.output = output if output is not None else sys.stdout
+
+        self.batch_size_rows = int(config.get('batch_size_rows', 100000))
+        self.min_batch_rows = int(config.get('min_batch_rows', 1000))
+        self.max_batch_bytes = int(config.get('max_batch_bytes', 64 * 1024 * 1024))
+        self.batch_load_seconds = float(config.get('batch_load_seconds', 5.0))
+        self.flush_interval = float(config.get('flush_interval', 60.0))
+
+        self.tables: t.Dict[str, Table] = {}
+        self._coercers: t.Dict[str, t.Callable[[dict], tuple]] = {}
+        self._buffers: t.Dict[str, t.List[dict]] = {}
+        self._buffer_sizes: t.Dict[str, int] = {}
+        self.batch_sizers: t.Dict[str, BatchSizer] = {}
+        self._buffered_rows = 0
+        self._buffered_bytes = 0
+        self._last_flush = time.monotonic()
+        self._last_commit = time.monotonic()
+        self._pending_state = None
+
+    def process(self, input: t.Iterable[str]):
+        """Processes all singer messages from input and flushes the remaining records at the end"""
+        for line in input:
+            line = line.strip()
+            if not line:
+                continue
+
+            message = fastjson.loads(line)
+            message_type = message.get('type')
+            if message_type == 'RECORD':
+                self._handle_record(message['stream'], message['record'], size=len(line))
+            elif message_type == 'SCHEMA':
+                self._handle_schema(message['stream'], message['schema'], message.get('key_properties'))
+            elif message_type == 'STATE':
+                self._pending_state = message['value']
+                if not self._buffered_rows:
+                    self._emit_state()
+                elif time.monotonic() - self._last_flush >= self.flush_interval:
+                    self.flush()
+
+        self.flush(force_commit=True)
+        self.close()
+
+    def _handle_schema(self, stream_name: str, schema: dict, key_properties: t.List[str]):
+        from ..catalog import SingerStream
+
+        if stream_name in self._buffers:
+            self._flush_stream(stream_name)
+
+        table = SingerStream.from_schema(stream_name, schema, key_properties=key_properties).to_table()
+        self.tables[stream_name] = table
+        self._coercers[stream_name] = compile_record_coercer(table, exact_numbers=self.exact_numbers, json_as_text=self.json_as_text)
+        self._buffers[stream_name] = []
+        self._buffer_sizes[stream_name] = 0
+        if stream_name not in self.batch_sizers:
+            self.batch_sizers[stream_name] = BatchSizer(max_rows=self.batch_size_rows, min_rows=self.min_batch_rows,
+                                                        max_bytes=self.max_batch_bytes, load_seconds=self.batch_load_seconds)
+        self.prepare_table(table)
+
+    def _handle_record(self, stream_name: str, record: dict, size: int = 0):
+        if stream_name not in self.tables:
+            raise Exception(f'A record for stream {stream_name} was encountered before a corresponding schema')
+
+        buffer = self._buffers[stream_name]
+        buffer.append(record)
+        self._buffer_sizes[stream_name] += size
+        self._buffered_rows += 1
+        self._buffered_bytes += size
+
+        # the flush interval is checked every 256 records to keep the clock out of the hot path
+        if (self._buffered_rows >= self.batch_size_rows or self._buffered_bytes >= self.max_batch_bytes
+                or (not self._buffered_rows & 0xff and time.monotonic() - self._last_flush >= self.flush_interval)):
+            self.flush()
+        elif self.batch_sizers[stream_name].is_full(len(buffer), self._buffer_sizes[stream_name]):
+            self._flush_stream(stream_name)
+            if not self._buffered_rows:
+                self._emit_state()
+
+    def _flush_stream(self, stream_name: str):
+        records = self._buffers[stream_name]
+        if records:
+            start = time.monotonic()
+            self.load_records(self.tables[stream_name], records)
+            self.batch_sizers[stream_name].observe_load(len(records), self._buffer_sizes[stream_name], time.monotonic() - start)
+            self._buffered_rows -= len(records)
+            self._buffered_bytes -= self._buffer_sizes[stream_name]
+            self._buffers[stream_name] = []
+            self._buffer_sizes[stream_name] = 0
+
+    def flush(self, force_commit: bool = False):
+        """Loads all buffered records and emits the last received state, see commit()"""
+        for stream_name in self._buffers.keys():
+            self._flush_stream(stream_name)
+        self._last_flush = time.monotonic()
+        self._emit_state(force_commit=force_commit)
+
+    def _emit_state(self, force_commit: bool = False):
+        if self._pending_state is None:
+            return
+        if not self.commit(force=force_commit or time.monotonic() - self._last_commit >= self.flush_interval):
+            return # held back until the loaded records are durable
+        self._last_commit = time.monotonic()
+        self.output.write(fastjson.dumps(self._pending_state) + '\n')
+        self.output.flush()
+        self._pending_state = None
+
+    def deduplicate(self, table: Table, records: t.List[dict]) -> t.List[dict]:
+        """Removes records with the same primary key from a batch, keeping the last one"""
+        if not table.primary_key_columns:
+            return records
+
+        key_names = [column.name for column in table.primary_key_columns]
+        records_by_key = {}
+        for record in records:
+            records_by_key[tuple(record.get(name) for name in key_names)] = record
+        if len(records_by_key) == len(records):
+            return records
+        return list(records_by_key.values())
+
+    def coerce(self, table: Table, records: t.List[dict]) -> t.List[tuple]:
+        """Converts records into rows of typed values in the column order of the table"""
+        return coerce_records(self._coercers[table.table_name], records)
+
+    def prepare_table(self, table: Table):
+        """Is called when a schema for a stream is received, e.g. to create the destination table"""
+        raise NotImplementedError(f'Please implement prepare_table() for type "{self.__class__.__name__}"')
+
+    def load_records(self, table: Table, records: t.List[dict]):
+        """Loads a batch of records of a stream"""
+        raise NotImplementedError(f'Please implement load_records() for type "{self.__class__.__name__}"')
+
+    def commit(self, force: bool = False) -> bool:
+        """
+        Is called before a state is emitted
+
+        Args:
+            force: When true, all loaded records must be durable afterwards, e.g. files completed
+
+        Returns:
+            True when all loaded records are durable and the state can be emitted, False to hold back the state
+            until a later commit
+        """
+        return True
+
+    def close(self):
+        """Is called after all messages have been processed"""
+        pass
+
+
+def quote_identifier(name: str) -> str:
+    """Quotes a SQL identifier"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def main(target_class: t.Type[SingerTarget]):
+    """Runs a target as singer command line application"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', required=True, help='Config file')
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as config_file:
+        config = json.load(config_file)
+
+    target_class(config).process(sys.stdin)
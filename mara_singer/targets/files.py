@@ -0,0 +1,93 @@
+"""
+A singer target which writes JSONL or CSV files per stream, optionally compressed and rotated into numbered
+part files with a manifest per stream, see `RotatingFileSink`.
+
+Config keys:
+    destination_path: The directory to which the files are written
+    format: (default: jsonl) jsonl or csv
+    compression: (optional) gzip or zstd
+    max_file_size: (optional) The maximum (compressed) number of bytes of a part file
+    max_file_records: (optional) The maximum number of records of a part file
+    flush_interval: (default: 60) The maximum number of seconds a state is held back while a compressed part is open
+    delimiter: (default: ',') The CSV delimiter
+    quotechar: (default: '"') The CSV quote character
+
+Usage: python -m mara_singer.targets.files --config <config file>
+"""
+
+import csv
+import io
+import json
+import typing as t
+
+from . import SingerTarget, main
+from .sink import RotatingFileSink
+from .. import fastjson
+from ..schema import DataType, StructDataType, Table
+
+
+class FileTarget(SingerTarget):
+    """Writes singer streams to JSONL or CSV files"""
+    def __init__(self, config: dict, output: t.TextIO = None) -> None:
+        super().__init__(config, output=output)
+        self.destination_path = config.get('destination_path', '')
+        self.format = config.get('format', 'jsonl')
+        if self.format not in ['jsonl', 'csv']:
+            raise ValueError(f'Unsupported file format: {self.format}')
+        self.compression = config.get('compression')
+        self.max_file_size = config.get('max_file_size')
+        self.max_file_records = config.get('max_file_records')
+        self.delimiter = config.get('delimiter', ',')
+        self.quotechar = config.get('quotechar', '"')
+
+        self.sinks: t.Dict[str, RotatingFileSink] = {}
+        self._column_names: t.Dict[str, t.List[str]] = {}
+
+    def prepare_table(self, table: Table):
+        column_names = [column.name for column in table.columns]
+        if table.table_name in self.sinks:
+            if self._column_names[table.table_name] == column_names:
+                return
+            # the columns changed: continue with a new part
+            self.sinks[table.table_name].close()
+
+        self._column_names[table.table_name] = column_names
+        self.sinks[table.table_name] = RotatingFileSink(
+            self.destination_path, table.table_name, extension=f'.{self.format}', compression=self.compression,
+            max_bytes=self.max_file_size, max_records=self.max_file_records,
+            header=(lambda: next(self._csv_lines([column_names]))) if self.format == 'csv' else None)
+
+    def load_records(self, table: Table, records: t.List[dict]):
+        sink = self.sinks[table.table_name]
+        if self.format == 'jsonl':
+            for record in records:
+                sink.write(fastjson.dumps(record) + '\n', record_count=1)
+        else:
+            json_columns = [column.is_array or isinstance(column.type, StructDataType) or column.type in [DataType.JSON, None]
+                            for column in table.columns]
+            rows = ([json.dumps(value) if is_json and value is not None else value
+                     for value, is_json in zip((record.get(column.name) for column in table.columns), json_columns)]
+                    for record in records)
+            for line in self._csv_lines(rows):
+                sink.write(line, record_count=1)
+
+    def _csv_lines(self, rows: t.Iterable[list]) -> t.Iterator[str]:
+        """Encodes rows as CSV lines"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=self.delimiter, quotechar=self.quotechar, lineterminator='\n')
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    def commit(self, force: bool = False) -> bool:
+        return all([sink.commit(force=force) for sink in self.sinks.values()])
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
+
+
+if __name__ == '__main__':
+    main(FileTarget)
@@ -0,0 +1,138 @@
+"""
+A singer target which writes Parquet files per stream. The records are coerced into Arrow record batches
+using the column types of the stream schema; each batch is written as a row group.
+
+Each run writes new numbered part files `{stream}.part-00001.parquet`,
+`{stream}.part-00002.parquet`, ...; the files of previous runs are never overwritten. A part is completed when it
+reaches `max_file_size` or `max_file_records`, when the schema changes, at the latest `flush_interval` seconds after
+the last emitted state and at the end of the run. As a Parquet file is only readable when completed, a state is
+held back until all parts with records before the state are completed.
+
+Requires pyarrow (`pip install mara-singer[parquet]`).
+
+Config keys:
+    destination_path: The directory to which the files are written
+    compression: (default: zstd) The Parquet compression codec
+    batch_size_rows: (default: 100000) The maximum number of rows buffered and written as one row group
+    max_file_size: (default: 128 MiB) Start a new part when a part reaches this number of bytes
+    max_file_records: (optional) Start a new part when a part reaches this number of records
+    flush_interval: (default: 60) The maximum number of seconds a state is held back
+
+Usage: python -m mara_singer.targets.parquet --config <config file>
+"""
+
+import os
+import re
+import typing as t
+
+import pyarrow
+import pyarrow.parquet
+
+from . import SingerTarget, main
+from ..schema import DataType, StructDataType, Table
+
+
+def arrow_type(type: t.Union[DataType, StructDataType], is_array: bool = False) -> pyarrow.DataType:
+    """Returns the Arrow data type for a column or struct field type"""
+    if isinstance(type, StructDataType):
+        arrow = pyarrow.struct([pyarrow.field(field.name, arrow_type(field.type, field.is_array), nullable=field.nullable)
+                                for field in type.fields])
+    else:
+        arrow = {
+            DataType.INT: pyarrow.int64(),
+            DataType.NUMBER: pyarrow.float64(),
+            DataType.DATE: pyarrow.date32(),
+            DataType.TIMESTAMP: pyarrow.timestamp('us'),
+            DataType.TIMESTAMPTZ: pyarrow.timestamp('us', tz='UTC'),
+            DataType.BOOL: pyarrow.bool_()
+        }.get(type, pyarrow.string()) # TEXT, JSON, XML and unknown types are written as text
+    return pyarrow.list_(arrow) if is_array else arrow
+
+
+def arrow_schema(table: Table) -> pyarrow.Schema:
+    """Returns the Arrow schema for a table"""
+    return pyarrow.schema([pyarrow.field(column.name, arrow_type(column.type, column.is_array), nullable=column.nullable)
+                           for column in table.columns])
+
+
+class ParquetTarget(SingerTarget):
+    """Writes singer streams to numbered Parquet part files per stream, `{stream}.part-00001.parquet`, ..."""
+    exact_numbers = False # numbers are written as float64
+    json_as_text = True
+
+    def __init__(self, config: dict, output: t.TextIO = None) -> None:
+        super().__init__(config, output=output)
+        self.destination_path = config.get('destination_path', '')
+        self.compression = config.get('compression', 'zstd')
+        self.max_file_size = config.get('max_file_size', 128 * 1024 * 1024)
+        self.max_file_records = config.get('max_file_records')
+
+        self._schemas: t.Dict[str, pyarrow.Schema] = {}
+        self._writers: t.Dict[str, t.Tuple[pyarrow.parquet.ParquetWriter, t.BinaryIO]] = {}
+        self._part_record_counts: t.Dict[str, int] = {}
+        self.file_paths: t.Dict[str, t.List[str]] = {}
+
+    def _part_number(self, stream_name: str) -> int:
+        """The number after the highest part number of a stream in the destination path"""
+        pattern = re.compile(re.escape(stream_name) + r'\.part-(\d+)\.parquet')
+        part_numbers = [int(match.group(1)) for match in map(pattern.fullmatch, os.listdir(self.destination_path or '.')) if match]
+        return max(part_numbers, default=0) + 1
+
+    def _open_file(self, stream_name: str) -> t.Tuple[str, t.BinaryIO]:
+        """Creates the next part file of a stream. An existing file (e.g. of a concurrent run) is never overwritten."""
+        part_number = self._part_number(stream_name)
+        while True:
+            file_path = os.path.join(self.destination_path, f'{stream_name}.part-{part_number:05d}.parquet')
+            try:
+                return file_path, open(file_path, 'xb')
+            except FileExistsError:
+                part_number += 1
+
+    def prepare_table(self, table: Table):
+        schema = arrow_schema(table)
+        if table.table_name in self._schemas and self._schemas[table.table_name].equals(schema):
+            return
+
+        # the schema changed: continue in a new file
+        self._close_writer(table.table_name)
+        self._schemas[table.table_name] = schema
+
+    def load_records(self, table: Table, records: t.List[dict]):
+        schema = self._schemas[table.table_name]
+        rows = self.coerce(table, records)
+        batch = pyarrow.RecordBatch.from_arrays([pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                                                schema=schema)
+
+        if table.table_name not in self._writers:
+            file_path, file = self._open_file(table.table_name)
+            self.file_paths.setdefault(table.table_name, []).append(file_path)
+            self._writers[table.table_name] = (pyarrow.parquet.ParquetWriter(file, schema, compression=self.compression), file)
+        writer, file = self._writers[table.table_name]
+        writer.write_batch(batch, row_group_size=len(records))
+
+        record_count = self._part_record_counts.get(table.table_name, 0) + len(records)
+        self._part_record_counts[table.table_name] = record_count
+        if ((self.max_file_size and file.tell() >= self.max_file_size)
+                or (self.max_file_records and record_count >= self.max_file_records)):
+            self._close_writer(table.table_name)
+
+    def _close_writer(self, stream_name: str):
+        writer, file = self._writers.pop(stream_name, (None, None))
+        self._part_record_counts.pop(stream_name, None)
+        if writer:
+            writer.close()
+            file.close()
+
+    def commit(self, force: bool = False) -> bool:
+        # a Parquet file is only readable after its footer is written: the state waits for the open parts
+        if force:
+            self.close()
+        return not self._writers
+
+    def close(self):
+        for stream_name in list(self._writers.keys()):
+            self._close_writer(stream_name)
+
+
+if __name__ == '__main__':
+    main(ParquetTarget)
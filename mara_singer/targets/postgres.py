@@ -0,0 +1,148 @@
+"""
+A singer target for PostgreSQL which loads the records with COPY into a staging table and merges them
+into the destination table. Uses the same config keys as target-postgres.
+
+Usage: python -m mara_singer.targets.postgres --config <config file>
+"""
+
+import json
+import typing as t
+
+import psycopg2
+
+from . import SingerTarget, main, quote_identifier
+from ..schema import Column, DataType, StructDataType, Table, ddl
+from ..schema.coercion import json_default
+
+
+def postgres_type(column: Column) -> str:
+    """Returns the PostgreSQL data type for a column"""
+    return ddl.column_type(column, ddl.Dialect.POSTGRESQL)
+
+
+def _value_to_text(value, column: Column) -> str:
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(column.type, StructDataType) or column.type in [DataType.JSON, None]:
+        return json.dumps(value, default=json_default)
+    return str(value)
+
+
+def _array_element_to_text(value, column: Column) -> str:
+    if value is None:
+        return 'NULL'
+    text = _value_to_text(value, column)
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def encode_csv_value(value, column: Column) -> str:
+    """
+    Encodes a record value for COPY ... (FORMAT csv). NULL is written as an unquoted empty
+    string, all other values are quoted so that an empty string is not read as NULL.
+    """
+    if value is None:
+        return ''
+    if column.is_array:
+        if not isinstance(value, list):
+            value = [value]
+        text = '{' + ','.join(_array_element_to_text(element, column) for element in value) + '}'
+    else:
+        text = _value_to_text(value, column)
+    return '"' + text.replace('"', '""') + '"'
+
+
+class _CopyInput:
+    """A file-like object which encodes the rows lazily while COPY reads from it"""
+    def __init__(self, table: Table, rows: t.List[tuple]) -> None:
+        columns = table.columns
+        self._lines = (','.join(encode_csv_value(value, column) for value, column in zip(row, columns)) + '\n'
+                       for row in rows)
+        self._buffer = ''
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class PostgreSQLTarget(SingerTarget):
+    """
+    Loads singer streams into PostgreSQL
+
+    Each batch is streamed with COPY into a temporary (and therefore unlogged) staging table per stream. From there
+    it is merged into the destination table: rows with the same primary key are replaced, streams without key
+    properties are appended.
+    """
+    def __init__(self, config: dict, output: t.TextIO = None) -> None:
+        super().__init__(config, output=output)
+
+        self.schema_name = config.get('postgres_schema') or 'public'
+
+        connection_args = {
+            'host': config.get('postgres_host'),
+            'port': config.get('postgres_port'),
+            'dbname': config.get('postgres_database'),
+            'user': config.get('postgres_username'),
+            'password': config.get('postgres_password'),
+            'sslmode': config.get('postgres_sslmode'),
+            'sslrootcert': config.get('postgres_sslrootcert'),
+            'sslcert': config.get('postgres_sslcert'),
+            'sslkey': config.get('postgres_sslkey')
+        }
+        self.connection = psycopg2.connect(**{k: v for k, v in connection_args.items() if v is not None})
+
+    def _table_identifier(self, table: Table) -> str:
+        return f'{quote_identifier(self.schema_name)}.{quote_identifier(table.table_name)}'
+
+    def _staging_table_identifier(self, table: Table) -> str:
+        return 'pg_temp.' + quote_identifier(f'{table.table_name}__stage')
+
+    def prepare_table(self, table: Table):
+        dialect = ddl.Dialect.POSTGRESQL
+        with self.connection.cursor() as cursor:
+            live_columns = ddl.live_table_columns(cursor, dialect, table.table_name, schema_name=self.schema_name)
+            if live_columns is None:
+                cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {quote_identifier(self.schema_name)}')
+            for statement in ddl.migration_statements(table, dialect, live_columns, schema_name=self.schema_name):
+                cursor.execute(statement)
+
+            cursor.execute(f'DROP TABLE IF EXISTS {self._staging_table_identifier(table)}')
+            cursor.execute(ddl.create_table_statement(table, dialect, schema_name='pg_temp', table_name=f'{table.table_name}__stage',
+                                                      if_not_exists=False, temporary=True, constraints=False))
+        self.connection.commit()
+
+    def load_records(self, table: Table, records: t.List[dict]):
+        rows = self.coerce(table, self.deduplicate(table, records))
+
+        table_identifier = self._table_identifier(table)
+        staging_table_identifier = self._staging_table_identifier(table)
+        column_list = ', '.join(quote_identifier(column.name) for column in table.columns)
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {staging_table_identifier}')
+            cursor.copy_expert(f'COPY {staging_table_identifier} ({column_list}) FROM STDIN WITH (FORMAT csv)',
+                               _CopyInput(table, rows))
+
+            if table.primary_key_columns:
+                key_condition = ' AND '.join(f't.{quote_identifier(column.name)} = s.{quote_identifier(column.name)}'
+                                             for column in table.primary_key_columns)
+                cursor.execute(f'DELETE FROM {table_identifier} t USING {staging_table_identifier} s WHERE {key_condition}')
+            cursor.execute(f'INSERT INTO {table_identifier} ({column_list}) SELECT {column_list} FROM {staging_table_identifier}')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == '__main__':
+    main(PostgreSQLTarget)
@@ -0,0 +1,156 @@
+"""Writing compressed files which are rotated into numbered parts"""
+
+import gzip
+import io
+import json
+import os
+import typing as t
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# the file extension per compression
+COMPRESSION_EXTENSIONS = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst'
+}
+
+
+class RotatingFileSink:
+    """
+    Writes data into a sequence of part files `{base_name}.part-00001{extension}`, `...part-00002...`, optionally compressed.
+    A new part is started when the current part exceeds `max_bytes` or `max_records`. The parts are listed with row
+    counts and byte sizes in the manifest file `{base_name}.manifest.json`.
+
+    Parts of previous runs listed in the manifest are kept; the numbering continues after them.
+
+    `commit()` makes the written data durable, e.g. before a target emits a state: an uncompressed part is flushed
+    to disk and listed in the manifest with its committed row count and byte size. Data beyond the committed byte
+    size of a part was not committed. A compressed part is only readable when completed, so it is only completed
+    when the commit is forced; otherwise the commit fails until the part is rotated.
+
+    Args:
+        directory: The directory to which the files are written
+        base_name: The file name prefix, e.g. the stream name
+        extension: The file extension without compression, e.g. '.jsonl'
+        compression: (optional) 'gzip' or 'zstd' (requires the zstandard package)
+        max_bytes: (optional) The maximum (compressed) size of a part. As the compressor buffers data, parts can get slightly bigger.
+        max_records: (optional) The maximum number of records of a part
+        header: (optional) A function returning the data written at the beginning of each part, e.g. a CSV header
+    """
+    def __init__(self, directory: str, base_name: str, extension: str, compression: str = None,
+                 max_bytes: int = None, max_records: int = None, header: t.Callable[[], str] = None) -> None:
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f'Unsupported compression: {compression}')
+        if compression == 'zstd' and not zstandard:
+            raise Exception('The zstd compression requires the package zstandard')
+
+        self.directory = directory
+        self.base_name = base_name
+        self.extension = extension
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.header = header
+
+        self.parts: t.List[dict] = self._read_manifest().get('parts', [])
+
+        self._raw_file = None
+        self._file = None
+        self._part = None
+
+    @property
+    def manifest_file_path(self) -> str:
+        return os.path.join(self.directory, f'{self.base_name}.manifest.json')
+
+    def _read_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_file_path):
+            return {}
+        with open(self.manifest_file_path, 'r') as manifest_file:
+            return json.load(manifest_file)
+
+    def write(self, data: str, record_count: int):
+        """Writes data containing a number of records to the current part"""
+        if self._file and ((self.max_records and self._part['row_count'] + record_count > self.max_records and self._part['row_count'])
+                           or (self.max_bytes and self._raw_file.tell() >= self.max_bytes)):
+            self._close_part()
+        if not self._file:
+            self._open_part()
+
+        self._file.write(data)
+        self._part['row_count'] += record_count
+        if ((self.max_records and self._part['row_count'] >= self.max_records)
+                or (self.max_bytes and self._raw_file.tell() >= self.max_bytes)):
+            self._close_part() # completed parts are committed
+
+    def _open_part(self):
+        part_number = len(self.parts) + 1
+        file_name = f'{self.base_name}.part-{part_number:05d}{self.extension}{COMPRESSION_EXTENSIONS[self.compression]}'
+        self._raw_file = open(os.path.join(self.directory, file_name), 'wb')
+        if self.compression == 'gzip':
+            binary_file = gzip.GzipFile(fileobj=self._raw_file, mode='wb')
+        elif self.compression == 'zstd':
+            binary_file = zstandard.ZstdCompressor().stream_writer(self._raw_file, closefd=False)
+        else:
+            binary_file = self._raw_file
+        self._file = io.TextIOWrapper(binary_file, encoding='utf-8', newline='')
+        self._part = {'file_name': file_name, 'row_count': 0, 'byte_size': None}
+        self.parts.append(self._part)
+        if self.header:
+            self._file.write(self.header())
+
+    def commit(self, force: bool = False) -> bool:
+        """
+        Makes the data written so far durable and lists it in the manifest
+
+        Args:
+            force: Complete the current compressed part
+
+        Returns:
+            False when the current compressed part stays open, so that its data is not committed yet
+        """
+        if not self._file:
+            return True
+        if self.compression:
+            # a compressed stream is only readable when it is completed
+            if not force:
+                return False
+            self._close_part()
+            return True
+        self._file.flush()
+        os.fsync(self._raw_file.fileno())
+        self._part['byte_size'] = self._raw_file.tell()
+        self._write_manifest()
+        return True
+
+    def _close_part(self):
+        self._file.close() # flushes the compressor
+        if not self._raw_file.closed:
+            self._raw_file.close()
+        with open(self._raw_file.name, 'rb') as part_file:
+            os.fsync(part_file.fileno())
+        self._part['byte_size'] = os.path.getsize(self._raw_file.name)
+        self._raw_file, self._file, self._part = None, None, None
+        self._write_manifest()
+
+    def _write_manifest(self):
+        manifest = {
+            'base_name': self.base_name,
+            'compression': self.compression,
+            'parts': self.parts
+        }
+        tmp_file_path = f'{self.manifest_file_path}.tmp'
+        with open(tmp_file_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(tmp_file_path, self.manifest_file_path)
+
+    def close(self):
+        """Closes the current part and writes the manifest"""
+        if self._file:
+            self._close_part()
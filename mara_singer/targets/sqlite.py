@@ -0,0 +1,84 @@
+"""
+A singer target for SQLite which loads the records through a staging table and merges them into the
+destination table. Uses the same config keys as target-sqlite.
+
+Usage: python -m mara_singer.targets.sqlite --config <config file>
+"""
+
+import datetime
+import decimal
+import json
+import sqlite3
+import typing as t
+
+from . import SingerTarget, main, quote_identifier
+from ..schema import Column, DataType, StructDataType, Table, ddl
+from ..schema.coercion import json_default
+
+
+def sqlite_type(column: Column) -> str:
+    """Returns the SQLite data type for a column"""
+    return ddl.column_type(column, ddl.Dialect.SQLITE)
+
+
+def _encode_value(value, column: Column):
+    if value is None:
+        return None
+    if column.is_array or isinstance(column.type, StructDataType) or column.type in [DataType.JSON, None]:
+        return json.dumps(value, default=json_default)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+class SQLiteTarget(SingerTarget):
+    """
+    Loads singer streams into SQLite
+
+    Each batch is inserted into a temporary staging table per stream and then merged into the destination table:
+    rows with the same primary key are replaced, streams without key properties are appended.
+    """
+    def __init__(self, config: dict, output: t.TextIO = None) -> None:
+        super().__init__(config, output=output)
+        self.connection = sqlite3.connect(config['database'])
+
+    def _staging_table_identifier(self, table: Table) -> str:
+        return quote_identifier(f'{table.table_name}__stage')
+
+    def prepare_table(self, table: Table):
+        dialect = ddl.Dialect.SQLITE
+        live_columns = ddl.live_table_columns(self.connection, dialect, table.table_name)
+        for statement in ddl.migration_statements(table, dialect, live_columns):
+            self.connection.execute(statement)
+
+        self.connection.execute(f'DROP TABLE IF EXISTS temp.{self._staging_table_identifier(table)}')
+        self.connection.execute(ddl.create_table_statement(table, dialect, table_name=f'{table.table_name}__stage',
+                                                           if_not_exists=False, temporary=True, constraints=False))
+        self.connection.commit()
+
+    def load_records(self, table: Table, records: t.List[dict]):
+        rows = self.coerce(table, self.deduplicate(table, records))
+
+        table_identifier = quote_identifier(table.table_name)
+        staging_table_identifier = self._staging_table_identifier(table)
+        column_list = ', '.join(quote_identifier(column.name) for column in table.columns)
+
+        self.connection.execute(f'DELETE FROM {staging_table_identifier}')
+        self.connection.executemany(
+            f'INSERT INTO {staging_table_identifier} ({column_list}) VALUES ({", ".join("?" for _ in table.columns)})',
+            (tuple(_encode_value(value, column) for value, column in zip(row, table.columns)) for row in rows))
+
+        if table.primary_key_columns:
+            key_list = ', '.join(quote_identifier(column.name) for column in table.primary_key_columns)
+            self.connection.execute(f'DELETE FROM {table_identifier} WHERE ({key_list}) IN (SELECT {key_list} FROM {staging_table_identifier})')
+        self.connection.execute(f'INSERT INTO {table_identifier} ({column_list}) SELECT {column_list} FROM {staging_table_identifier}')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == '__main__':
+    main(SQLiteTarget)
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+from mara_app.monkey_patch import patch
+
+from mara_singer import config
+from mara_singer.async_runner import SingerSync, _run_in_new_event_loop, run_syncs, sync_tap_to_target
+from mara_singer.commands.batch import SingerTapBatch
+from mara_singer.state import SingerStateCheckpointer, SingerTapState
+
+from test_backfill import CATALOG, _TestCommand
+
+
+TAP = [sys.executable, '-c', '''
+import json, sys, time
+time.sleep(float(sys.argv[1]))
+for i in range(3):
+    print(json.dumps({"type": "RECORD", "stream": "users", "record": {"id": i}}))
+print(json.dumps({"type": "STATE", "value": {"bookmarks": {"users": {"id": 2}}}}))
+sys.exit(int(sys.argv[2]))
+''']
+
+# writes the last state it received, like a singer target
+TARGET = [sys.executable, '-c', '''
+import json, sys
+state = None
+for line in sys.stdin:
+    if json.loads(line)["type"] == "STATE":
+        state = line
+if state:
+    print(json.dumps(json.loads(state)["value"]))
+''']
+
+# starts a child process which would outlive the tap unless the process group is killed
+HANGING_TAP = [sys.executable, '-c', '''
+import subprocess, sys, time
+child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+open(sys.argv[1], 'w').write(str(child.pid))
+time.sleep(60)
+''']
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # a killed child is a zombie until the reaper (init) collects it
+    with open(f'/proc/{pid}/stat') as stat_file:
+        return stat_file.read().split(')')[-1].split()[0] != 'Z'
+
+
+def _wait_until_stopped(pid: int, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not _is_running(pid):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_run_syncs():
+    results = run_syncs([SingerSync('ok', tap_command=TAP + ['0', '0'], target_command=TARGET),
+                         SingerSync('failing', tap_command=TAP + ['0', '1'], target_command=TARGET),
+                         SingerSync('missing', tap_command=['tap-does-not-exist'], target_command=TARGET),
+                         SingerSync('invalid', tap_command=['tap\0'], target_command=TARGET)],
+                        max_concurrency=2)
+
+    assert [result.name for result in results] == ['ok', 'failing', 'missing', 'invalid']
+    assert [result.succeeded for result in results] == [True, False, False, False]
+    assert results[0].router.record_counts == {'users': 3}
+    assert results[0].router.target_state == {'bookmarks': {'users': {'id': 2}}}
+    assert results[1].returncodes == {'tap': 1, 'target': 0}
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason='the child watcher of Python < 3.8 only works in the main thread')
+def test_run_syncs_in_thread():
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(
+        run_syncs([SingerSync('ok', tap_command=TAP + ['0', '0'], target_command=TARGET)])))
+    thread.start()
+    thread.join()
+    assert [result.succeeded for result in results] == [True]
+
+
+def test_run_syncs_checkpoints_off_the_event_loop(tmp_path):
+    patch(config.state_dir)(lambda: tmp_path)
+    threads = []
+
+    class ThreadRecordingCheckpointer(SingerStateCheckpointer):
+        def checkpoint(self, state: dict):
+            threads.append(threading.current_thread())
+            super().checkpoint(state)
+
+    [result] = run_syncs([SingerSync('ok', tap_command=TAP + ['0', '0'], target_command=TARGET,
+                                     state_checkpointer=ThreadRecordingCheckpointer(SingerTapState('tap-test'), interval=0))])
+    assert result.succeeded
+    assert threads and threading.main_thread() not in threads
+    assert json.loads((tmp_path / 'tap-test.json').read_text()) == {'bookmarks': {'users': {'id': 2}}}
+
+
+def test_max_concurrency():
+    start = time.monotonic()
+    results = run_syncs([SingerSync(f'sync-{i}', tap_command=TAP + ['0.5', '0'], target_command=TARGET) for i in range(4)],
+                        max_concurrency=2)
+    assert all(results)
+    assert time.monotonic() - start >= 1.0
+
+
+def test_timeout_kills_process_group(tmp_path):
+    pid_file = tmp_path / 'child.pid'
+    [result] = run_syncs([SingerSync('hanging', tap_command=HANGING_TAP + [str(pid_file)], target_command=TARGET, timeout=1)],
+                         kill_timeout=1)
+
+    assert result.timed_out and not result.succeeded
+    assert _wait_until_stopped(int(pid_file.read_text()))
+
+
+def test_cancel_kills_process_group(tmp_path):
+    pid_file = tmp_path / 'child.pid'
+
+    async def cancel_sync():
+        task = asyncio.ensure_future(sync_tap_to_target(
+            SingerSync('hanging', tap_command=HANGING_TAP + [str(pid_file)], target_command=TARGET), kill_timeout=1))
+        while not pid_file.exists() or not pid_file.read_text():
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    _run_in_new_event_loop(cancel_sync())
+    assert _wait_until_stopped(int(pid_file.read_text()))
+
+
+def test_singer_tap_batch(tmp_path):
+    for directory in ['config', 'catalog', 'state']:
+        (tmp_path / directory).mkdir()
+    patch(config.config_dir)(lambda: tmp_path / 'config')
+    patch(config.catalog_dir)(lambda: tmp_path / 'catalog')
+    patch(config.state_dir)(lambda: tmp_path / 'state')
+    (tmp_path / 'catalog' / 'tap-test.json').write_text(json.dumps(CATALOG))
+    (tmp_path / 'config' / 'tap-test.json').write_text('{}')
+
+    tap_file_path = tmp_path / 'tap-test'
+    tap_file_path.write_text(f'#!{sys.executable}\n' + TAP[2].replace('float(sys.argv[1])', '0').replace('int(sys.argv[2])', '0'))
+    tap_file_path.chmod(0o755)
+
+    commands = [_TestCommand(str(tap_file_path), stream_selection=['events'], config_file_name='tap-test.json',
+                             catalog_file_name='tap-test.json', state_file_name=f'tap-test-{i}.json') for i in range(2)]
+    assert SingerTapBatch(commands, max_concurrency=2).run()
+    assert [command.ledger_run.record_count for command in commands] == [3, 3]
+
+    # the temp files of the commands are removed
+    assert sorted(path.name for path in (tmp_path / 'config').iterdir()) == ['tap-test.json']
+
+    with pytest.raises(ValueError):
+        SingerTapBatch([_TestCommand('tap-test', stream_selection=['a', 'b'], parallel_streams=2)])
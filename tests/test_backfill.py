@@ -0,0 +1,102 @@
+import datetime
+import json
+import sys
+
+import pytest
+from mara_app.monkey_patch import patch
+
+from mara_singer import config
+from mara_singer.commands.backfill import SingerTapBackfill, bookmark_windows, format_bookmark
+from mara_singer.commands.singer import _SingerTapReadCommand
+
+
+CATALOG = {
+    "streams": [{
+        "tap_stream_id": "events",
+        "stream": "events",
+        "schema": {"type": "object", "properties": {"id": {"type": "integer"},
+                                                    "created_at": {"type": "string", "format": "date-time"}}},
+        "metadata": [{"breadcrumb": [], "metadata": {"replication-method": "INCREMENTAL", "replication-key": "created_at"}}]
+    }]
+}
+
+TAP_SCRIPT = '''#!{python}
+import json, sys
+args = sys.argv[1:]
+tap_config = json.load(open(args[args.index('--config') + 1]))
+state = json.load(open(args[args.index('--state') + 1]))
+with open({log_file!r}, 'a') as log_file:
+    log_file.write(json.dumps([tap_config['start_date'], tap_config['end_date'], state['bookmarks']['events']['created_at']]) + '\\n')
+print(json.dumps({{"type": "STATE", "value": {{"bookmarks": {{"events": {{"created_at": tap_config['end_date']}}}}}}}}))
+if tap_config.get('fail_after') and tap_config['start_date'] >= tap_config['fail_after']:
+    sys.exit(1)
+'''
+
+
+class _TestCommand(_SingerTapReadCommand):
+    def _create_target_config(self, config: dict):
+        pass
+
+    def _target_name(self):
+        return 'target-test'
+
+    def _target_executable(self):
+        return [sys.executable, '-c', 'import sys; sys.stdin.read()']
+
+
+def test_bookmark_windows():
+    assert bookmark_windows(datetime.date(2020, 1, 1), datetime.date(2020, 1, 3), 2) == [
+        (datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc), datetime.datetime(2020, 1, 2, tzinfo=datetime.timezone.utc)),
+        (datetime.datetime(2020, 1, 2, tzinfo=datetime.timezone.utc), datetime.datetime(2020, 1, 3, tzinfo=datetime.timezone.utc))]
+    assert format_bookmark(datetime.date(2020, 1, 1)) == '2020-01-01T00:00:00Z'
+
+    with pytest.raises(ValueError):
+        bookmark_windows(datetime.date(2020, 1, 3), datetime.date(2020, 1, 1), 2)
+
+
+def _backfill_command(tmp_path, tap_config: dict = None) -> SingerTapBackfill:
+    for directory in ['config', 'catalog', 'state']:
+        (tmp_path / directory).mkdir(exist_ok=True)
+    patch(config.config_dir)(lambda: tmp_path / 'config')
+    patch(config.catalog_dir)(lambda: tmp_path / 'catalog')
+    patch(config.state_dir)(lambda: tmp_path / 'state')
+
+    (tmp_path / 'config' / 'tap-test.json').write_text(json.dumps(dict({'api_key': 'secret'}, **(tap_config or {}))))
+    (tmp_path / 'catalog' / 'tap-test.json').write_text(json.dumps(CATALOG))
+    (tmp_path / 'state' / 'tap-test.json').write_text(json.dumps({'bookmarks': {'other': {'id': 1}}}))
+
+    tap_file_path = tmp_path / 'tap-test'
+    tap_file_path.write_text(TAP_SCRIPT.format(python=sys.executable, log_file=str(tmp_path / 'windows.log')))
+    tap_file_path.chmod(0o755)
+
+    command = _TestCommand(str(tap_file_path), stream_selection=['events'], config_file_name='tap-test.json',
+                           catalog_file_name='tap-test.json', state_file_name='tap-test.json')
+    return SingerTapBackfill(command, 'events', start_date=datetime.date(2020, 1, 1), end_date=datetime.date(2020, 1, 5),
+                             window_count=4, max_parallel_windows=2)
+
+
+def test_backfill(tmp_path):
+    assert _backfill_command(tmp_path).run()
+
+    windows = sorted(json.loads(line) for line in (tmp_path / 'windows.log').read_text().splitlines())
+    assert windows == [[f'2020-01-0{day}T00:00:00Z', f'2020-01-0{day + 1}T00:00:00Z', f'2020-01-0{day}T00:00:00Z'] for day in range(1, 5)]
+    assert json.loads((tmp_path / 'state' / 'tap-test.json').read_text()) == {
+        'bookmarks': {'other': {'id': 1}, 'events': {'created_at': '2020-01-05T00:00:00Z'}}}
+
+    # the temp config and state files are removed
+    assert sorted(path.name for path in (tmp_path / 'config').iterdir()) == ['tap-test.json']
+    assert sorted(path.name for path in (tmp_path / 'state').iterdir()) == ['tap-test.json']
+
+
+def test_backfill_keeps_bookmark_on_failure(tmp_path):
+    assert not _backfill_command(tmp_path, tap_config={'fail_after': '2020-01-03'}).run()
+    assert json.loads((tmp_path / 'state' / 'tap-test.json').read_text()) == {'bookmarks': {'other': {'id': 1}}}
+
+
+@pytest.mark.parametrize('bookmark', ['last week', '2021-01-01T00:00:00.1234567+0000'])
+def test_backfill_keeps_bookmark(tmp_path, bookmark):
+    command = _backfill_command(tmp_path)
+    state = {'bookmarks': {'events': {'created_at': bookmark}}}
+    (tmp_path / 'state' / 'tap-test.json').write_text(json.dumps(state))
+    assert command.run()
+    assert json.loads((tmp_path / 'state' / 'tap-test.json').read_text()) == state
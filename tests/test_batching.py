@@ -0,0 +1,113 @@
+import io
+import json
+import sqlite3
+
+from mara_app.monkey_patch import patch
+
+from mara_singer import config
+from mara_singer.batching import BatchSizer, tuned_batch_config
+from mara_singer.ledger import RunLedger, SingerRun
+from mara_singer.targets.sqlite import SQLiteTarget
+
+from test_targets import SCHEMA
+
+
+def test_batch_sizer():
+    batch_sizer = BatchSizer(max_rows=10000, min_rows=100, max_bytes=100 * 1000, load_seconds=1.0, smoothing=1.0)
+    assert batch_sizer.batch_rows == 100
+
+    # fast loads: the batch size grows by factor 2 at most
+    batch_sizer.observe_load(100, 100 * 10, 0.01)
+    assert batch_sizer.batch_rows == 200
+
+    # slow loads: the batch size shrinks to the rows loaded in load_seconds
+    batch_sizer.observe_load(200, 200 * 10, 1.0)
+    assert batch_sizer.batch_rows == 200
+    batch_sizer.observe_load(200, 200 * 10, 4.0)
+    assert batch_sizer.batch_rows == 100
+
+    # wide rows: the batch size is limited by max_bytes
+    batch_sizer.observe_load(100, 100 * 2000, 0.01)
+    assert batch_sizer.batch_rows == 50
+    assert batch_sizer.is_full(10, 100 * 1000)
+    assert not batch_sizer.is_full(49, 49 * 2000)
+
+
+def test_target_flushes_full_streams(tmp_path):
+    database = tmp_path / 'test.db'
+    output = io.StringIO()
+
+    messages = [{"type": "SCHEMA", "stream": "users", "schema": SCHEMA, "key_properties": ["id"]},
+                {"type": "SCHEMA", "stream": "orders", "schema": SCHEMA, "key_properties": ["id"]}]
+    messages += [{"type": "RECORD", "stream": "users", "record": {"id": i}} for i in range(5)]
+    messages += [{"type": "RECORD", "stream": "orders", "record": {"id": 1}},
+                 {"type": "STATE", "value": {"bookmarks": {"users": {"id": 4}}}}]
+
+    target = SQLiteTarget({'database': str(database), 'min_batch_rows': 2}, output=output)
+    loads = []
+    load_records = target.load_records
+    target.load_records = lambda table, records: loads.append((table.table_name, len(records))) or load_records(table, records)
+    target.process(io.StringIO(''.join(json.dumps(message) + '\n' for message in messages)))
+
+    # users is loaded when its batch is full, the batch size doubles after the fast first load
+    assert loads == [('users', 2), ('users', 3), ('orders', 1)]
+    assert sqlite3.connect(str(database)).execute('SELECT count(*) FROM users').fetchone() == (5,)
+    assert [json.loads(line) for line in output.getvalue().splitlines()] == [{"bookmarks": {"users": {"id": 4}}}]
+
+
+def test_target_flush_interval(tmp_path):
+    def loaded_batches(flush_interval: float):
+        target = SQLiteTarget({'database': str(tmp_path / 'test.db'), 'flush_interval': flush_interval}, output=io.StringIO())
+        loads = []
+        load_records = target.load_records
+        target.load_records = lambda table, records: loads.append(len(records)) or load_records(table, records)
+        target.process(io.StringIO(''.join(json.dumps(message) + '\n' for message in [
+            {"type": "SCHEMA", "stream": "users", "schema": SCHEMA, "key_properties": ["id"]},
+            {"type": "RECORD", "stream": "users", "record": {"id": 1}},
+            {"type": "STATE", "value": {"bookmarks": {"users": {"id": 1}}}},
+            {"type": "RECORD", "stream": "users", "record": {"id": 2}}])))
+        return loads
+
+    assert loaded_batches(60) == [2]
+    assert loaded_batches(0) == [1, 1]
+
+
+def test_tuned_batch_config(tmp_path):
+    patch(config.run_ledger_file)(lambda: tmp_path / 'ledger.sqlite3')
+    assert tuned_batch_config('tap-test', ['users']) == {}
+
+    ledger = RunLedger(file_path=tmp_path / 'ledger.sqlite3')
+    for records_per_second in [1000, 2000, 3000]:
+        run = SingerRun('tap-test', command='SingerTapToDB', target='target-postgres')
+        stream = run.stream('users')
+        stream.record_count, stream.byte_count, stream.records_per_second = 10000, 10000 * 100, records_per_second
+        run.finish(succeeded=True)
+        ledger.write(run)
+
+    assert tuned_batch_config('tap-test', ['users'], batch_load_seconds=5) == {'batch_size_rows': 10000, 'max_batch_rows': 10000}
+    # limited by the row width of 100 bytes
+    assert tuned_batch_config('tap-test', ['users'], batch_load_seconds=5, max_batch_bytes=500 * 1000) == {
+        'batch_size_rows': 5000, 'max_batch_rows': 5000}
+    # streams without history are ignored
+    assert tuned_batch_config('tap-test', ['users', 'orders'], batch_load_seconds=5)['batch_size_rows'] == 10000
+
+
+def test_command_batch_config(tmp_path):
+    from test_backfill import _TestCommand
+
+    patch(config.run_ledger_file)(lambda: tmp_path / 'ledger.sqlite3')
+    ledger = RunLedger(file_path=tmp_path / 'ledger.sqlite3')
+    run = SingerRun('tap-test', command='SingerTapToDB', target='target-postgres')
+    run.stream('users').record_count, run.stream('users').records_per_second = 10000, 1000
+    run.finish(succeeded=True)
+    ledger.write(run)
+
+    command = _TestCommand('tap-test', stream_selection=['users'])
+    target_config = {'max_batch_rows': 10}
+    command._create_batch_config(target_config)
+    assert target_config == {'max_batch_rows': 10}
+
+    patch(config.tune_target_batch_size)(lambda: True)
+    command._create_batch_config(target_config)
+    assert target_config == {'max_batch_rows': 10, 'batch_size_rows': 5000}
+    patch(config.tune_target_batch_size)(lambda: False)
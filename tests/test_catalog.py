@@ -0,0 +1,114 @@
+import copy
+import json
+
+from mara_app.monkey_patch import patch
+
+from mara_singer import config
+from mara_singer.catalog import SingerCatalog, SingerStream
+from mara_singer.schema import DataType
+from mara_singer.singer import catalog as singer_catalog
+
+
+SAMPLE_CATALOG = {
+    "streams": [
+        {
+            "tap_stream_id": "users",
+            "stream": "users",
+            "key_properties": ["id"],
+            "schema": {
+                "type": ["null", "object"],
+                "properties": {
+                    "id": {"type": "integer"},
+                    "name": {"type": ["null", "string"]},
+                    "updated_at": {"type": ["null", "string"], "format": "date-time"}
+                }
+            },
+            "metadata": [
+                {"breadcrumb": [], "metadata": {"inclusion": "available", "replication-key": "updated_at"}},
+                {"breadcrumb": ["properties", "id"], "metadata": {"inclusion": "automatic"}},
+                {"breadcrumb": ["properties", "name"], "metadata": {"inclusion": "available", "selected-by-default": True}},
+                {"breadcrumb": ["properties", "updated_at"], "metadata": {"inclusion": "available"}}
+            ]
+        },
+        {
+            "tap_stream_id": "orders",
+            "stream": "orders",
+            "schema": {"type": "object", "properties": {"id": {"type": "integer"}}},
+            "metadata": [{"breadcrumb": [], "metadata": {"selected": True}}]
+        }
+    ]
+}
+
+
+def _catalog() -> singer_catalog.Catalog:
+    return singer_catalog.Catalog.from_dict(copy.deepcopy(SAMPLE_CATALOG))
+
+
+def test_catalog_get_stream():
+    catalog = _catalog()
+    assert catalog.get_stream('orders').tap_stream_id == 'orders'
+    assert catalog.get_stream('does_not_exist') is None
+
+    catalog.streams.append(singer_catalog.CatalogEntry(tap_stream_id='new'))
+    assert catalog.get_stream('new').tap_stream_id == 'new'
+
+
+def test_stream_selection():
+    stream = SingerStream('users', _catalog().get_stream('users'))
+    assert not stream.is_selected
+    assert stream.replication_key == 'updated_at'
+
+    # default selection
+    assert [column.name for column in stream.to_table().columns] == ['id', 'name']
+
+    stream.mark_as_selected(properties=['updated_at'])
+    assert stream.is_selected
+    assert stream.property_is_selected('id')
+    assert not stream.property_is_selected('name')
+    table = stream.to_table()
+    assert [column.name for column in table.columns] == ['id', 'updated_at']
+    assert table.columns[1].type == DataType.TIMESTAMPTZ
+    assert [column.name for column in table.primary_key_columns] == ['id']
+
+    stream.unmark_as_selected()
+    assert not stream.is_selected
+    assert not stream.property_is_selected('id')
+
+
+def test_stream_unmark_legacy_selection():
+    stream = SingerStream('users', _catalog().get_stream('users'))
+    stream.mark_as_selected()
+    assert stream.schema['selected'] == True
+
+    stream.unmark_as_selected()
+    assert stream.schema['selected'] == False
+    assert not stream.is_selected
+
+
+def test_stream_schema_is_a_copy():
+    stream = SingerStream('users', _catalog().get_stream('users'))
+    column_names = [column.name for column in stream.to_table().columns]
+    stream.schema['properties'].clear()
+    assert stream.schema_dict['properties']
+    assert [column.name for column in stream.to_table().columns] == column_names
+
+
+def test_catalog_lazy_schema(tmp_path):
+    patch(config.catalog_dir)(lambda: tmp_path)
+    (tmp_path / 'tap-test.json').write_text(json.dumps(SAMPLE_CATALOG))
+
+    catalog = SingerCatalog('tap-test.json')
+    catalog.streams['users'].mark_as_selected()
+    catalog.save(tmp_path / 'tap-test-selected.json')
+
+    # no Schema objects are created when selecting streams
+    assert all(stream.stream._schema is None for stream in catalog.streams.values())
+
+    saved_catalog = json.loads((tmp_path / 'tap-test-selected.json').read_text())
+    assert saved_catalog['streams'][0]['schema'] == dict(SAMPLE_CATALOG['streams'][0]['schema'], selected=True)
+    assert saved_catalog['streams'][1] == SAMPLE_CATALOG['streams'][1]
+
+    # the schema object is created on access
+    entry = catalog._catalog.get_stream('orders')
+    assert entry.schema.properties['id'].type == 'integer'
+    assert entry.to_dict()['schema'] == SAMPLE_CATALOG['streams'][1]['schema']
@@ -0,0 +1,71 @@
+import json
+import os
+
+from mara_app.monkey_patch import patch
+
+from mara_singer import catalog_cache, config
+from mara_singer.catalog import SingerCatalog
+
+from test_catalog import SAMPLE_CATALOG
+
+
+def _write_selection(stream_selection: list, calls: list):
+    def write_catalog(file_path) -> bool:
+        calls.append(file_path)
+        catalog = SingerCatalog('tap-test.json')
+        for stream_name in stream_selection:
+            catalog.streams[stream_name].mark_as_selected()
+        catalog.save(file_path)
+        return True
+    return write_catalog
+
+
+def test_selection_hash():
+    assert catalog_cache.selection_hash(['users', 'orders']) == catalog_cache.selection_hash(['orders', 'users'])
+    assert (catalog_cache.selection_hash({'users': ['id', 'name']})
+            == catalog_cache.selection_hash({'users': ['name', 'id']}))
+    assert catalog_cache.selection_hash(['users']) != catalog_cache.selection_hash(['users'], exclusive=True)
+    assert catalog_cache.selection_hash(['users']) != catalog_cache.selection_hash({'users': ['id']})
+
+
+def test_selected_catalog(tmp_path):
+    patch(config.catalog_dir)(lambda: tmp_path)
+    (tmp_path / 'tap-test.json').write_text(json.dumps(SAMPLE_CATALOG))
+
+    calls = []
+    file_path = catalog_cache.selected_catalog('tap-test.json', ['users'], _write_selection(['users'], calls))
+    assert file_path == catalog_cache.selected_catalog_file_path('tap-test.json', ['users'])
+    assert file_path.parent == tmp_path / '.selected'
+    assert SingerCatalog('tap-test.json').streams['users'].is_selected is None
+    assert json.loads(file_path.read_text())['streams'][0]['schema']['selected'] is True
+
+    # cache hit
+    assert catalog_cache.selected_catalog('tap-test.json', ['users'], _write_selection(['users'], calls)) == file_path
+    assert len(calls) == 1
+
+    # the source catalog changed: the entry is replaced
+    (tmp_path / 'tap-test.json').write_text(json.dumps(dict(SAMPLE_CATALOG, streams=SAMPLE_CATALOG['streams'][:1])))
+    changed_file_path = catalog_cache.selected_catalog('tap-test.json', ['users'], _write_selection(['users'], calls))
+    assert changed_file_path != file_path
+    assert len(calls) == 2
+    assert os.listdir(tmp_path / '.selected') == [changed_file_path.name]
+
+
+def test_selected_catalog_eviction(tmp_path):
+    patch(config.catalog_dir)(lambda: tmp_path)
+    patch(config.selected_catalog_cache_size)(lambda: 2)
+    (tmp_path / 'tap-test.json').write_text(json.dumps(SAMPLE_CATALOG))
+
+    file_paths = []
+    for stream_selection in [['users'], ['orders'], ['users', 'orders']]:
+        file_paths.append(catalog_cache.selected_catalog('tap-test.json', stream_selection, _write_selection(stream_selection, [])))
+        os.utime(file_paths[-1], (len(file_paths), len(file_paths)))
+    assert sorted(os.listdir(tmp_path / '.selected')) == sorted(file_path.name for file_path in file_paths[1:])
+
+
+def test_selected_catalog_failure(tmp_path):
+    patch(config.catalog_dir)(lambda: tmp_path)
+    (tmp_path / 'tap-test.json').write_text(json.dumps(SAMPLE_CATALOG))
+
+    assert catalog_cache.selected_catalog('tap-test.json', ['unknown'], lambda file_path: False) is None
+    assert os.listdir(tmp_path / '.selected') == []
@@ -0,0 +1,83 @@
+import datetime
+import decimal
+
+import pytest
+
+from mara_singer.catalog import SingerStream
+from mara_singer.schema.coercion import compile_record_coercer, coerce_records, parse_datetime
+
+
+SCHEMA = {
+    "type": ["null", "object"],
+    "properties": {
+        "id": {"type": "integer"},
+        "price": {"type": ["null", "number"]},
+        "active": {"type": ["null", "boolean"]},
+        "name": {"type": ["null", "string"]},
+        "birthday": {"type": ["null", "string"], "format": "date"},
+        "updated_at": {"type": ["null", "string"], "format": "date-time"},
+        "tags": {"type": ["null", "array"], "items": {"type": "integer"}},
+        "address": {"type": ["null", "object"], "properties": {
+            "city": {"type": ["null", "string"]},
+            "moved_at": {"type": ["null", "string"], "format": "date-time"}}},
+        "extra": {"type": ["null", "object"], "additionalProperties": True}
+    }
+}
+
+
+def _table():
+    return SingerStream.from_schema('users', SCHEMA, key_properties=['id']).to_table()
+
+
+def test_coerce_record():
+    coerce = compile_record_coercer(_table())
+    assert coerce({
+        "id": "1", "price": "9.99", "active": "true", "name": 5, "birthday": "2000-01-02T00:00:00",
+        "updated_at": "2020-01-01T12:00:00.123456Z", "tags": ["1", 2, None],
+        "address": {"city": "Berlin", "moved_at": "2019-05-01T00:00:00+02:00", "unknown": 1},
+        "extra": {"a": 1}
+    }) == (
+        1, decimal.Decimal('9.99'), True, '5', datetime.date(2000, 1, 2),
+        datetime.datetime(2020, 1, 1, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc), [1, 2, None],
+        {"city": "Berlin", "moved_at": datetime.datetime(2019, 5, 1, tzinfo=datetime.timezone(datetime.timedelta(hours=2))), "unknown": 1},
+        {"a": 1})
+
+    assert coerce({"id": 2}) == (2, None, None, None, None, None, None, None, None)
+
+
+def test_coerce_options():
+    coerce = compile_record_coercer(_table(), exact_numbers=False, json_as_text=True)
+    assert coerce_records(coerce, [{"id": 1.0, "price": "1.5", "extra": {"a": 1}}]) == [
+        (1, 1.5, None, None, None, None, None, None, '{"a": 1}')]
+
+
+def test_coerce_errors():
+    coerce = compile_record_coercer(_table())
+    with pytest.raises(ValueError, match='column id: value is missing'):
+        coerce({"name": "a"})
+    with pytest.raises(ValueError, match='column id'):
+        coerce({"id": 1.5})
+    with pytest.raises(ValueError, match='column updated_at'):
+        coerce({"id": 1, "updated_at": "yesterday"})
+    with pytest.raises(ValueError, match='column active'):
+        coerce({"id": 1, "active": "maybe"})
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2020-01-01T00:00:00.1234567+00:00', datetime.datetime(2020, 1, 1, 0, 0, 0, 123456, tzinfo=datetime.timezone.utc)),
+    ('2020-01-01T00:00:00+0000', datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)),
+    ('2020-01-01T00:00:00.12+00:00', datetime.datetime(2020, 1, 1, 0, 0, 0, 120000, tzinfo=datetime.timezone.utc)),
+    ('2020-01-01t00:00:00z', datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)),
+    ('2020-01-01 12:30:00-05:30', datetime.datetime(2020, 1, 1, 12, 30, tzinfo=datetime.timezone(-datetime.timedelta(hours=5, minutes=30)))),
+    ('2020-01-01T12:30', datetime.datetime(2020, 1, 1, 12, 30)),
+    ('2020-01-01', datetime.datetime(2020, 1, 1)),
+])
+def test_parse_datetime(value, expected):
+    assert parse_datetime(value) == expected
+    assert parse_datetime(value).utcoffset() == expected.utcoffset()
+
+
+@pytest.mark.parametrize('value', ['yesterday', '2020-13-01T00:00:00Z', '2020-01-01T00:00:00+1', 20200101])
+def test_parse_datetime_errors(value):
+    with pytest.raises(ValueError):
+        parse_datetime(value)
@@ -0,0 +1,88 @@
+import sqlite3
+
+from mara_singer.schema import DataType, StructDataType, Table
+from mara_singer.schema import ddl
+
+
+def _table() -> Table:
+    address = StructDataType(name=None)
+    address.add_field('city', DataType.TEXT)
+    address.add_field('zip', DataType.INT)
+
+    table = Table(table_name='users', schema_name='crm')
+    table.add_column('id', DataType.INT, is_primary_key=True)
+    table.add_column('name', DataType.TEXT, nullable=True)
+    table.add_column('score', DataType.NUMBER, nullable=True)
+    table.add_column('tags', DataType.TEXT, nullable=True, is_array=True)
+    table.add_column('address', address, nullable=True)
+    return table
+
+
+def test_create_table_postgresql():
+    assert ddl.create_table_statement(_table(), ddl.Dialect.POSTGRESQL) == '\n'.join([
+        'CREATE TABLE IF NOT EXISTS "crm"."users" (',
+        '  "id" BIGINT NOT NULL,',
+        '  "name" TEXT,',
+        '  "score" NUMERIC,',
+        '  "tags" TEXT[],',
+        '  "address" JSONB,',
+        '  PRIMARY KEY ("id")',
+        ')'])
+
+
+def test_create_table_redshift():
+    statement = ddl.create_table_statement(_table(), ddl.Dialect.REDSHIFT, schema_name='dwh')
+    assert '"dwh"."users"' in statement
+    assert '"name" VARCHAR(65535)' in statement
+    assert '"tags" SUPER' in statement
+    assert '"address" SUPER' in statement
+
+
+def test_create_table_sqlite():
+    statement = ddl.create_table_statement(_table(), ddl.Dialect.SQLITE)
+    assert statement.startswith('CREATE TABLE IF NOT EXISTS "users" (')
+    assert '"score" NUMERIC' in statement
+    assert '"tags" TEXT' in statement
+
+
+def test_create_table_bigquery():
+    statement = ddl.create_table_statement(_table(), ddl.Dialect.BIGQUERY, if_not_exists=False)
+    assert statement.startswith('CREATE TABLE `crm`.`users` (')
+    assert '`id` INT64 NOT NULL' in statement
+    assert '`tags` ARRAY<STRING>' in statement
+    assert '`address` STRUCT<`city` STRING, `zip` INT64>' in statement
+    assert 'PRIMARY KEY (`id`) NOT ENFORCED' in statement
+
+
+def test_migration_statements():
+    live_columns = {'id': ddl.LiveColumn('id', 'bigint', False),
+                    'name': ddl.LiveColumn('name', 'text', False)}
+    assert ddl.migration_statements(_table(), ddl.Dialect.POSTGRESQL, live_columns) == [
+        'ALTER TABLE "crm"."users" ALTER COLUMN "name" DROP NOT NULL',
+        'ALTER TABLE "crm"."users" ADD COLUMN "score" NUMERIC',
+        'ALTER TABLE "crm"."users" ADD COLUMN "tags" TEXT[]',
+        'ALTER TABLE "crm"."users" ADD COLUMN "address" JSONB']
+
+    live_columns.update({column.name: ddl.LiveColumn(column.name, 'text', True) for column in _table().columns[1:]})
+    assert ddl.migration_statements(_table(), ddl.Dialect.POSTGRESQL, live_columns) == []
+
+
+def test_migrate_sqlite_table():
+    connection = sqlite3.connect(':memory:')
+    dialect = ddl.Dialect.SQLITE
+    table = _table()
+
+    assert ddl.live_table_columns(connection, dialect, 'users') is None
+    table.columns = table.columns[:2]
+    for statement in ddl.migration_statements(table, dialect, None):
+        connection.execute(statement)
+
+    live_columns = ddl.live_table_columns(connection, dialect, 'users')
+    assert list(live_columns) == ['id', 'name']
+    assert not live_columns['id'].nullable
+
+    statements = ddl.migration_statements(_table(), dialect, live_columns)
+    assert len(statements) == 3
+    for statement in statements:
+        connection.execute(statement)
+    assert list(ddl.live_table_columns(connection, dialect, 'users')) == ['id', 'name', 'score', 'tags', 'address']
@@ -0,0 +1,102 @@
+import copy
+import os
+
+from mara_singer import discovery, fastjson
+
+
+def _stream(tap_stream_id: str, properties: list) -> dict:
+    return {
+        'tap_stream_id': tap_stream_id,
+        'stream': tap_stream_id,
+        'schema': {'type': 'object', 'properties': {name: {'type': ['null', 'string']} for name in properties}},
+        'metadata': [{'breadcrumb': [], 'metadata': {'inclusion': 'available'}}]
+                    + [{'breadcrumb': ['properties', name], 'metadata': {'inclusion': 'available'}} for name in properties]
+    }
+
+
+def test_merge_catalog_keeps_selection():
+    existing_catalog = {'streams': [_stream('users', ['id', 'name']), _stream('orders', ['id'])]}
+    users = existing_catalog['streams'][0]
+    users['replication_method'] = 'INCREMENTAL'
+    users['metadata'][0]['metadata']['selected'] = True
+    users['metadata'][2]['metadata']['selected'] = True
+
+    discovered_catalog = {'streams': [_stream('users', ['id', 'name', 'email']), _stream('items', ['id'])]}
+    catalog, diffs = discovery.merge_catalog(existing_catalog, copy.deepcopy(discovered_catalog))
+
+    assert {tap_stream_id: diff.change for tap_stream_id, diff in diffs.items()} == {
+        'users': discovery.StreamChange.CHANGED,
+        'items': discovery.StreamChange.ADDED,
+        'orders': discovery.StreamChange.REMOVED}
+    assert diffs['users'].properties == {'email': discovery.PropertyChange.ADDED}
+    assert [stream['tap_stream_id'] for stream in catalog['streams']] == ['users', 'items']
+
+    users = catalog['streams'][0]
+    assert users['replication_method'] == 'INCREMENTAL'
+    assert list(users['schema']['properties']) == ['id', 'name', 'email']
+    assert {tuple(md['breadcrumb']): md['metadata'].get('selected') for md in users['metadata']} == {
+        (): True, ('properties', 'id'): None, ('properties', 'name'): True, ('properties', 'email'): None}
+
+
+def test_merge_catalog_prefers_user_settings():
+    existing_catalog = {'streams': [_stream('users', ['id'])]}
+    users = existing_catalog['streams'][0]
+    users['replication_key'] = 'id'
+    users['metadata'][0]['metadata'].update({'selected': True, 'replication-method': 'INCREMENTAL', 'replication-key': 'id'})
+
+    discovered_catalog = {'streams': [_stream('users', ['id'])]}
+    discovered_users = discovered_catalog['streams'][0]
+    discovered_users['replication_key'] = 'updated_at'
+    discovered_users['metadata'][0]['metadata'].update({'selected': False, 'replication-method': 'FULL_TABLE'})
+
+    catalog, diffs = discovery.merge_catalog(existing_catalog, discovered_catalog)
+    users = catalog['streams'][0]
+    assert users['replication_key'] == 'id'
+    assert users['metadata'][0]['metadata'] == {
+        'inclusion': 'available', 'selected': True, 'replication-method': 'INCREMENTAL', 'replication-key': 'id'}
+    assert diffs['users'].change == discovery.StreamChange.UNCHANGED
+
+
+def test_merge_catalog_unchanged():
+    existing_catalog = {'streams': [_stream('users', ['id', 'name'])]}
+    existing_catalog['streams'][0]['metadata'][0]['metadata']['selected'] = True
+
+    catalog, diffs = discovery.merge_catalog(existing_catalog, {'streams': [_stream('users', ['id', 'name'])]})
+    assert diffs['users'].change == discovery.StreamChange.UNCHANGED
+    assert catalog == existing_catalog
+
+
+def test_diff_schema():
+    existing_schema = {'type': 'object', 'properties': {
+        'id': {'type': 'integer'},
+        'name': {'type': 'string'},
+        'address': {'type': ['null', 'object'], 'properties': {'city': {'type': 'string'}, 'zip': {'type': 'integer'}}},
+        'tags': {'type': 'array', 'items': {'type': 'object', 'properties': {'key': {'type': 'string'}}}}}}
+    discovered_schema = copy.deepcopy(existing_schema)
+    discovered_schema['properties']['name'] = {'type': ['null', 'string']}
+    discovered_schema['properties']['address']['properties']['zip'] = {'type': 'string'}
+    discovered_schema['properties']['tags']['items']['properties']['value'] = {'type': 'string'}
+    del discovered_schema['properties']['id']
+
+    assert discovery.diff_schema(existing_schema, discovered_schema) == {
+        'address.zip': discovery.PropertyChange.RETYPED,
+        'tags[].value': discovery.PropertyChange.ADDED,
+        'id': discovery.PropertyChange.REMOVED}
+
+    diff = discovery.StreamDiff('users', discovery.StreamChange.CHANGED, discovery.diff_schema(existing_schema, discovered_schema))
+    assert str(diff) == 'stream users changed (added properties: tags[].value; removed properties: id; retyped properties: address.zip)'
+
+
+def test_write_catalog_if_changed(tmp_path):
+    file_path = tmp_path / 'tap-test.json'
+    catalog = {'streams': [_stream('users', ['id'])]}
+
+    assert discovery.write_catalog_if_changed(catalog, file_path)
+    modified_time = os.stat(file_path).st_mtime_ns
+    assert not discovery.write_catalog_if_changed(copy.deepcopy(catalog), file_path)
+    assert os.stat(file_path).st_mtime_ns == modified_time
+
+    catalog['streams'].append(_stream('orders', ['id']))
+    assert discovery.write_catalog_if_changed(catalog, file_path)
+    assert fastjson.load_file(file_path) == catalog
+    assert os.listdir(tmp_path) == ['tap-test.json']
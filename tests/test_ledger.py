@@ -0,0 +1,85 @@
+import io
+import json
+
+from mara_app.monkey_patch import patch
+
+from mara_singer import config
+from mara_singer.ledger import RunLedger, RunStatus, SingerRun
+from mara_singer.metrics import SingerMetricsCollector
+from mara_singer.router import SingerMessageRouter
+
+
+def test_run_from_router(tmp_path):
+    patch(config.state_dir)(lambda: tmp_path)
+    (tmp_path / 'tap-test.json').write_text(json.dumps({'bookmarks': {'users': {'id': 1}}}))
+
+    run = SingerRun('tap-test', command='SingerTapToDB', target='target-postgres', stream_names=['users', 'orders'],
+                    state_file_name='tap-test.json')
+    assert run.streams['users'].bookmark_before == {'id': 1}
+
+    messages = [{"type": "RECORD", "stream": "users", "record": {"id": 2}},
+                {"type": "RECORD", "stream": "users", "record": {"id": 3}}]
+    router = SingerMessageRouter()
+    router.pump(io.BytesIO(''.join(json.dumps(message) + '\n' for message in messages).encode()), io.BytesIO())
+    run.add_router(router)
+
+    (tmp_path / 'tap-test.json').write_text(json.dumps({'bookmarks': {'users': {'id': 3}}}))
+    run.finish(succeeded=True)
+
+    assert run.status == RunStatus.SUCCEEDED
+    assert run.record_count == 2
+    assert run.byte_count == router.bytes_routed
+    assert run.streams['users'].bookmark_after == {'id': 3}
+    assert run.streams['orders'].record_count == 0
+
+
+def test_run_from_metrics():
+    metrics = SingerMetricsCollector()
+    metrics.add({"type": "counter", "metric": "record_count", "value": 100, "tags": {"endpoint": "users"}})
+    for duration in [0.1, 0.2, 0.3]:
+        metrics.add({"type": "timer", "metric": "http_request_duration", "value": duration, "tags": {"endpoint": "users"}})
+
+    run = SingerRun('tap-test', command='SingerTapToFile', target='target-csv')
+    run.finish(succeeded=False, metrics=metrics)
+
+    assert run.status == RunStatus.FAILED
+    assert run.streams['users'].record_count == 100
+    assert run.streams['users'].http_request_count == 3
+    assert run.streams['users'].http_request_duration_p50 == 0.2
+    assert run.byte_count is None
+
+
+def test_ledger_stream_history(tmp_path):
+    ledger = RunLedger(file_path=tmp_path / 'ledger.sqlite3')
+
+    for record_count, succeeded in [(10, True), (20, False), (30, True)]:
+        run = SingerRun('tap-test', command='SingerTapToDB', target='target-postgres')
+        run.stream('users').record_count = record_count
+        run.finish(succeeded=succeeded)
+        ledger.write(run)
+
+    history = ledger.stream_history('tap-test', 'users')
+    assert [entry['record_count'] for entry in history] == [30, 10]
+    assert [entry['record_count'] for entry in ledger.stream_history('tap-test', 'users', succeeded_only=False, limit=2)] == [30, 20]
+
+    # the tables are only created once per file
+    assert len(RunLedger(file_path=tmp_path / 'ledger.sqlite3').stream_history('tap-test', 'users')) == 2
+
+
+def test_ledger_last_run(tmp_path):
+    ledger = RunLedger(file_path=tmp_path / 'ledger.sqlite3')
+    assert ledger.last_run('tap-test') is None
+
+    metrics = SingerMetricsCollector()
+    metrics.add({"type": "counter", "metric": "record_count", "value": 10, "tags": {"endpoint": "users"}})
+    metrics.add({"type": "timer", "metric": "http_request_duration", "value": 0.5, "tags": {"endpoint": "users"}})
+    for command in ['SingerTapToDB', 'SingerTapToFile']:
+        run = SingerRun('tap-test', command=command, target='target-postgres')
+        run.finish(succeeded=True, metrics=metrics)
+        ledger.write(run)
+
+    last_run = ledger.last_run('tap-test', command='SingerTapToDB')
+    assert last_run['status'] == RunStatus.SUCCEEDED
+    assert [(stream['stream'], stream['record_count'], stream['http_request_count'], stream['http_request_duration_p95'])
+            for stream in last_run['streams']] == [('users', 10, 1, 0.5)]
+    assert ledger.last_run('tap-test')['run_id'] == run.run_id
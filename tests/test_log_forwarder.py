@@ -0,0 +1,61 @@
+import time
+
+from mara_pipelines.logging import logger
+
+from mara_singer.logging import SingerLogHandler
+from mara_singer.logging.forwarder import SingerLogForwarder
+
+
+def _capture_log(monkeypatch) -> list:
+    calls = []
+    monkeypatch.setattr(logger, 'log', lambda message, format=logger.Format.STANDARD, is_error=False: calls.append((message, is_error)))
+    return calls
+
+
+def test_forwarder_batches_and_coalesces(monkeypatch):
+    calls = _capture_log(monkeypatch)
+    forwarder = SingerLogForwarder(batch_interval=60, batch_size=1000, rate_limits={})
+    for line in ['a\n', 'b\n', 'b\n', 'b\n', 'c\n']:
+        forwarder.log(line)
+    assert calls == []
+
+    forwarder.close()
+    assert calls == [('a\nb', False), ('(last line repeated 2 times)', False), ('c', False)]
+
+
+def test_forwarder_rate_limit(monkeypatch):
+    calls = _capture_log(monkeypatch)
+    forwarder = SingerLogForwarder(batch_interval=60, batch_size=1000, rate_limits={'INFO': 3})
+    for i in range(10):
+        forwarder.log(f'line {i}', level='INFO')
+    forwarder.log('warning', level='WARNING')
+    forwarder.close()
+    assert calls == [('line 0\nline 1\nline 2\nwarning', False), ('7 INFO lines suppressed', False)]
+
+
+def test_forwarder_flushes_on_error(monkeypatch):
+    calls = _capture_log(monkeypatch)
+    forwarder = SingerLogForwarder(batch_interval=60, batch_size=1000, rate_limits={'INFO': 1})
+    handler = SingerLogHandler(forwarder=forwarder)
+    for line in ['INFO starting\n', 'INFO syncing\n', 'ERROR failed\n', 'CRITICAL aborted\n']:
+        handler.handle_line(line)
+
+    assert handler.has_error
+    assert calls == [('starting', False), ('1 INFO lines suppressed', False), ('failed', True), ('aborted', True)]
+
+
+def test_forwarder_batch_size(monkeypatch):
+    calls = _capture_log(monkeypatch)
+    forwarder = SingerLogForwarder(batch_interval=60, batch_size=2, rate_limits={})
+    for i in range(5):
+        forwarder.log(f'line {i}')
+    assert calls == [('line 0\nline 1', False), ('line 2\nline 3', False)]
+    forwarder.close()
+
+
+def test_forwarder_flushes_after_interval(monkeypatch):
+    calls = _capture_log(monkeypatch)
+    forwarder = SingerLogForwarder(batch_interval=0.01, batch_size=1000, rate_limits={})
+    forwarder.log('line')
+    time.sleep(0.2)
+    assert calls == [('line', False)]
@@ -0,0 +1,40 @@
+import pytest
+
+from mara_singer.logging import SingerLogHandler
+from mara_singer.metrics import SingerMetricsCollector, percentile
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0, 5.0], 100) == 5.0
+
+
+def test_metrics_collector():
+    metrics = SingerMetricsCollector()
+    handler = SingerLogHandler(metrics=metrics)
+    for line in [
+        'INFO METRIC: {"type": "counter", "metric": "record_count", "value": 100, "tags": {"endpoint": "users"}}\n',
+        'INFO METRIC: {"type": "counter", "metric": "record_count", "value": 50, "tags": {"endpoint": "users"}}\n',
+        'INFO METRIC: {"type": "counter", "metric": "record_count", "value": 10, "tags": {"endpoint": "orders"}}\n',
+        'INFO METRIC: {"type": "timer", "metric": "http_request_duration", "value": 0.2, "tags": {"endpoint": "users", "status": "succeeded"}}\n',
+        'INFO METRIC: {"type": "timer", "metric": "http_request_duration", "value": 0.4, "tags": {"endpoint": "users", "status": "failed"}}\n',
+        'INFO METRIC: {"type": "timer", "metric": "job_duration", "value": 12.5, "tags": {"job_type": "export"}}\n',
+        'INFO METRIC: no json\n',
+        'INFO Syncing stream users\n',
+    ]:
+        handler.handle_line(line)
+
+    assert not handler.has_error
+    assert metrics.metric_count == 6
+    assert metrics.record_count == 160
+    assert metrics.job_durations == {'export': [12.5]}
+
+    summaries = metrics.stream_summaries()
+    assert [summary['stream'] for summary in summaries] == ['users', 'orders']
+    assert summaries[0]['records'] == 150
+    assert summaries[0]['http requests'] == 2
+    assert summaries[0]['http request errors'] == 1
+    assert summaries[0]['http request duration p50'] == pytest.approx(0.3)
+    assert summaries[1]['http request duration p95'] is None
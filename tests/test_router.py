@@ -0,0 +1,109 @@
+import io
+import json
+import subprocess
+import sys
+
+import pytest
+
+from mara_app.monkey_patch import patch
+
+from mara_singer import config
+from mara_singer.router import SingerMessageRouter, parse_message_header
+from mara_singer.shell import singer_run_tap_to_target
+from mara_singer.state import SingerTapState, SingerStateCheckpointer
+
+
+SAMPLE_MESSAGES = [
+    {"type": "SCHEMA", "stream": "users", "schema": {"type": "object"}, "key_properties": ["id"]},
+    {"type": "RECORD", "stream": "users", "record": {"id": 1}},
+    {"type": "RECORD", "stream": "users", "record": {"id": 2}},
+    {"type": "RECORD", "stream": "orders", "record": {"id": 1}},
+    {"type": "STATE", "value": {"bookmarks": {"users": {"id": 2}}}},
+]
+
+
+def test_parse_message_header():
+    assert parse_message_header(b'{"type": "RECORD", "stream": "users", "record": {}}') == ('RECORD', 'users')
+    assert parse_message_header(b'{"type": "STATE", "value": {}}') == ('STATE', None)
+    # other key order
+    assert parse_message_header(b'{"stream": "users", "type": "RECORD", "record": {}}') == ('RECORD', 'users')
+    # escaped stream name
+    assert parse_message_header(b'{"type": "RECORD", "stream": "a\\"b", "record": {}}') == ('RECORD', 'a"b')
+    assert parse_message_header(b'no json') == (None, None)
+
+
+def test_router_pump():
+    data = ''.join(json.dumps(message) + '\n' for message in SAMPLE_MESSAGES).encode()
+    source = io.BytesIO(data)
+    destination = io.BytesIO()
+
+    router = SingerMessageRouter(buffer_size=16)
+    assert router.pump(source, destination)
+
+    assert destination.getvalue() == data
+    assert router.bytes_routed == len(data)
+    assert router.record_counts == {'users': 2, 'orders': 1}
+    assert router.record_bytes == {'users': len(data.split(b'\n')[1]) + len(data.split(b'\n')[2]) + 2,
+                                   'orders': len(data.split(b'\n')[3]) + 1}
+    assert router.message_counts == {'SCHEMA': 1, 'RECORD': 3, 'STATE': 1}
+    assert router.tap_state == {"bookmarks": {"users": {"id": 2}}}
+
+
+def test_run_tap_to_target(tmp_path):
+    tap_script = ('import json\n'
+                  + f'for message in {SAMPLE_MESSAGES!r}:\n'
+                  + '    print(json.dumps(message))\n')
+    target_script = ('import json, sys\n'
+                     + 'for line in sys.stdin:\n'
+                     + '    message = json.loads(line)\n'
+                     + '    if message["type"] == "STATE":\n'
+                     + '        print(json.dumps(message["value"]))\n')
+    patch(config.state_dir)(lambda: tmp_path)
+    state_file_path = tmp_path / 'tap-test.json'
+
+    router = singer_run_tap_to_target(tap_command=[sys.executable, '-c', tap_script],
+                                      target_command=[sys.executable, '-c', target_script],
+                                      state_checkpointer=SingerStateCheckpointer(SingerTapState('tap-test'), interval=0))
+    assert router
+    assert router.record_counts == {'users': 2, 'orders': 1}
+    assert json.loads(state_file_path.read_text()) == {"bookmarks": {"users": {"id": 2}}}
+
+
+def test_run_tap_to_target_tap_fails():
+    assert singer_run_tap_to_target(tap_command=[sys.executable, '-c', 'import sys; sys.exit(1)'],
+                                    target_command=[sys.executable, '-c', 'import sys; sys.stdin.read()']) == False
+
+
+def test_router_passes_malformed_state():
+    data = b'{"type": "STATE", "value": {"bookmarks"\n{"type": "STATE", "value": 1}\n'
+    destination = io.BytesIO()
+    router = SingerMessageRouter()
+    assert router.pump(io.BytesIO(data), destination)
+    assert destination.getvalue() == data
+    assert router.message_counts == {'STATE': 2}
+    assert router.tap_state == 1
+
+
+def test_run_tap_to_target_stops_tap_when_target_fails(monkeypatch):
+    processes = []
+
+    class RecordingPopen(subprocess.Popen):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            processes.append(self)
+
+    monkeypatch.setattr(subprocess, 'Popen', RecordingPopen)
+    with pytest.raises(FileNotFoundError):
+        singer_run_tap_to_target(tap_command=[sys.executable, '-c', 'import time; time.sleep(60)'],
+                                 target_command=['target-does-not-exist'])
+    assert len(processes) == 1 and processes[0].returncode is not None
+
+
+def test_router_ignores_non_state_target_output():
+    states = []
+    router = SingerMessageRouter(on_target_state=states.append)
+    for line in ['target-foo 1.2.3\n', '\n', '[1, 2]\n', '{"bookmarks": {"users": {"id": 2}}}\n', 'Done.\n']:
+        router.handle_target_output(line)
+
+    assert states == [{"bookmarks": {"users": {"id": 2}}}]
+    assert router.target_state == {"bookmarks": {"users": {"id": 2}}}
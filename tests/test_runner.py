@@ -0,0 +1,55 @@
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from mara_singer.runner import SingerProcessMultiplexer, shared_multiplexer
+from mara_singer.shell import singer_run_shell_command
+
+
+def test_multiplexer_many_processes():
+    multiplexer = SingerProcessMultiplexer()
+    processes, outputs, readers = [], [], []
+    for i in range(20):
+        process = subprocess.Popen([sys.executable, '-c', f'for j in range(1000): print({i}, j)'], stdout=subprocess.PIPE)
+        lines = []
+        processes.append(process)
+        outputs.append(lines)
+        readers.append(multiplexer.add_stream(process.stdout, lines.append))
+
+    for process, reader in zip(processes, readers):
+        process.wait()
+        reader.wait()
+
+    for i, lines in enumerate(outputs):
+        assert lines == [f'{i} {j}\n' for j in range(1000)]
+    # all pipes are read by a single thread
+    assert len([thread for thread in threading.enumerate() if thread.name == 'singer-process-multiplexer']) >= 1
+
+
+def test_multiplexer_handler_error():
+    def fail(line):
+        raise ValueError(line)
+
+    process = subprocess.Popen([sys.executable, '-c', 'print("a"); print("b")'], stdout=subprocess.PIPE)
+    reader = shared_multiplexer().add_stream(process.stdout, fail)
+    process.wait()
+    with pytest.raises(ValueError):
+        reader.wait()
+
+
+def test_run_shell_command():
+    assert singer_run_shell_command('echo a; echo b', log_command=False) == True
+    with singer_run_shell_command('echo a; echo b', log_command=False, capture_output=True) as output:
+        assert output.readlines() == ['a\n', 'b\n']
+    assert singer_run_shell_command('echo "ERROR failed" >&2', log_command=False) == False
+    assert singer_run_shell_command('exit 3', log_command=False) == False
+
+
+def test_run_shell_command_capture_spills_to_disk():
+    output = singer_run_shell_command('seq 1 100000', log_command=False, stdout_consumer=lambda line: None,
+                                      capture_output=True, capture_max_memory=1024)
+    assert output._rolled # the output was written to a temp file
+    assert sum(1 for _ in output) == 100000
+    output.close()
@@ -0,0 +1,59 @@
+from mara_singer.singer.schema import Schema
+
+
+SAMPLE_SCHEMA = {
+    "type": ["null", "object"],
+    "properties": {
+        "id": {"type": "integer", "minimum": 0},
+        "name": {"type": ["null", "string"], "maxLength": 255, "description": "The name"},
+        "tags": {"type": ["null", "array"], "items": {"type": "string"}},
+        "price": {"anyOf": [{"type": "number"}, {"type": "null"}]},
+        "updated_at": {"type": ["null", "string"], "format": "date-time", "inclusion": "automatic"}
+    },
+    "selected": True
+}
+
+
+def test_schema_round_trip():
+    schema = Schema.from_dict(SAMPLE_SCHEMA)
+    assert schema.to_dict() == SAMPLE_SCHEMA
+    assert schema.properties['name'].maxLength == 255
+    assert schema.properties['id'].description is None
+    assert Schema.from_dict(SAMPLE_SCHEMA) == schema
+
+    # constructor and schema defaults
+    assert Schema(type='string', maxLength=10).to_dict() == {'type': 'string', 'maxLength': 10}
+    assert Schema.from_dict({'type': 'string'}, inclusion='available').to_dict() == {'type': 'string', 'inclusion': 'available'}
+
+
+def test_schema_modify():
+    schema = Schema.from_dict(SAMPLE_SCHEMA)
+    schema.properties['id'].minimum = None
+    schema.properties['id'].description = 'The key'
+    schema.selected = False
+    assert schema.properties['id'].to_dict() == {'type': 'integer', 'description': 'The key'}
+    assert schema.to_dict()['selected'] == False
+    assert schema != Schema.from_dict(SAMPLE_SCHEMA)
+
+
+def _synthetic_schema(property_count: int) -> dict:
+    properties = {}
+    for i in range(property_count):
+        if i % 10 == 0:
+            properties[f'property_{i}'] = {
+                "type": ["null", "object"],
+                "properties": {
+                    "id": {"type": "integer"},
+                    "value": {"type": ["null", "number"], "description": "A nested value"}
+                }
+            }
+        else:
+            properties[f'property_{i}'] = {"type": ["null", "string"], "format": "date-time"}
+    return {"type": ["null", "object"], "properties": properties}
+
+
+def test_schema_round_trip_nested():
+    data = _synthetic_schema(100)
+    schema = Schema.from_dict(data)
+    assert schema.to_dict() == data
+    assert schema.properties['property_10'].properties['value'].description == 'A nested value'
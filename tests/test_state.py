@@ -1,8 +1,11 @@
+import json
+import threading
+
 import pytest
 
 from mara_app.monkey_patch import patch
 
-from mara_singer.state import SingerTapState
+from mara_singer.state import SingerTapState, SingerStateCheckpointer, SingerStateSink
 from mara_singer import config
 
 def test_state_read_not_existing_file():
@@ -23,9 +26,74 @@ def test_state_read_sample_state_file():
     bk_value = state.get_bookmark(tap_stream_id='STREAM_NAME', key='date')
     assert bk_value == '2020-01-01T00:00:00.000000Z'
 
+def test_state_set_stream_bookmarks(tmp_path):
+    patch(config.state_dir)(lambda: tmp_path)
+    state = SingerTapState(tap_name='tap-test')
+    state.set_stream_bookmarks('STREAM_NAME', {'date': '2020-01-01'})
+    state.set_stream_bookmarks('OTHER_STREAM', {'id': 5})
+    state.set_stream_bookmarks('STREAM_NAME', {'date': '2020-02-01'})
+    state.save()
+
+    state = SingerTapState(tap_name='tap-test')
+    assert state.get_bookmark(tap_stream_id='STREAM_NAME', key='date') == '2020-02-01'
+    assert state.get_stream_bookmarks('OTHER_STREAM') == {'id': 5}
+    assert [path.name for path in tmp_path.iterdir()] == ['tap-test.json']
+
+def test_state_checkpointer(tmp_path):
+    patch(config.state_dir)(lambda: tmp_path)
+    state = SingerTapState(tap_name='tap-test')
+    state.set_stream_bookmarks('OTHER_STREAM', {'id': 5})
+
+    checkpointer = SingerStateCheckpointer(state, interval=3600, tap_stream_id='STREAM_NAME')
+    checkpointer.checkpoint({'bookmarks': {'STREAM_NAME': {'date': '2020-01-01'}, 'OTHER_STREAM': {'id': 1}}})
+    assert not (tmp_path / 'tap-test.json').exists() # throttled
+
+    checkpointer.flush()
+    state = SingerTapState(tap_name='tap-test')
+    assert state.get_bookmark(tap_stream_id='STREAM_NAME', key='date') == '2020-01-01'
+    assert state.get_bookmark(tap_stream_id='OTHER_STREAM', key='id') == 5
+
+def test_state_sink_history(tmp_path):
+    sink = SingerStateSink(tmp_path / 'tap-test.json', history_size=2)
+    for i in range(5):
+        sink.write({'bookmarks': {'STREAM_NAME': {'id': i}}})
+    sink.flush()
+
+    assert [state['bookmarks']['STREAM_NAME']['id'] for state in sink.history] == [2, 3]
+    assert SingerStateSink(tmp_path / 'tap-test.json').read() == {'bookmarks': {'STREAM_NAME': {'id': 4}}}
+
 
 if __name__ == '__main__':
     test_state_read_not_existing_file()
     test_state_read_empty_file()
     test_state_read_sample_state_file()
     print("Done.")
+
+def test_state_save_empty_state(tmp_path):
+    patch(config.state_dir)(lambda: tmp_path)
+    (tmp_path / 'tap-test.json').write_text(json.dumps({'bookmarks': {'STREAM_NAME': {'id': 1}}}))
+    state = SingerTapState(tap_name='tap-test')
+    state.set_state({})
+    state.save()
+    assert json.loads((tmp_path / 'tap-test.json').read_text()) == {}
+
+def test_state_sink_concurrent_flush(tmp_path):
+    errors = []
+
+    def flush(i: int):
+        try:
+            for _ in range(50):
+                sink = SingerStateSink(tmp_path / 'tap-test.json')
+                sink.write({'bookmarks': {'STREAM_NAME': {'id': i}}})
+                sink.flush()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=flush, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert SingerStateSink(tmp_path / 'tap-test.json').read()['bookmarks']['STREAM_NAME']['id'] in range(4)
+    assert [path.name for path in tmp_path.iterdir()] == ['tap-test.json']
@@ -0,0 +1,52 @@
+import copy
+
+from mara_singer.catalog import SingerStream
+from mara_singer.schema.table_cache import TableCache, table_cache_key
+from mara_singer.singer import catalog as singer_catalog
+
+from test_catalog import SAMPLE_CATALOG
+
+
+def _stream() -> SingerStream:
+    catalog = singer_catalog.Catalog.from_dict(copy.deepcopy(SAMPLE_CATALOG))
+    return SingerStream('users', catalog.get_stream('users'))
+
+
+def test_table_cache_key():
+    stream = _stream()
+    key = table_cache_key(stream.name, stream.schema, stream.stream.metadata, stream.stream.key_properties)
+    assert key == table_cache_key(stream.name, stream.schema, stream.stream.metadata, stream.stream.key_properties)
+
+    stream.mark_as_selected(properties=['updated_at'])
+    assert key != table_cache_key(stream.name, stream.schema, stream.stream.metadata, stream.stream.key_properties)
+
+
+def test_to_table_selection_changes_are_not_cached():
+    stream = _stream()
+    assert [column.name for column in stream.to_table().columns] == ['id', 'name']
+    stream.mark_as_selected(properties=['updated_at'])
+    assert [column.name for column in stream.to_table().columns] == ['id', 'updated_at']
+
+
+def test_table_cache(tmp_path):
+    stream = _stream()
+    created_tables = []
+
+    def create_table():
+        created_tables.append(stream._create_table())
+        return created_tables[-1]
+
+    cache = TableCache(max_size=1, cache_dir=tmp_path)
+    table = cache.get_or_create('a', create_table)
+    table.columns.pop()
+    assert len(cache.get_or_create('a', create_table).columns) == 2 # returns a copy
+    assert (cache.hits, cache.misses, len(created_tables)) == (1, 1, 1)
+
+    # a new cache reads the entry from disk
+    assert [column.name for column in TableCache(max_size=1, cache_dir=tmp_path).get_or_create('a', create_table).columns] == ['id', 'name']
+    assert len(created_tables) == 1
+
+    # LRU eviction in memory and on disk
+    cache.get_or_create('b', create_table)
+    assert list(cache._entries.keys()) == ['b']
+    assert [file_path.name for file_path in tmp_path.glob('*.pickle')] == ['b.pickle']
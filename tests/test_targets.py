@@ -0,0 +1,216 @@
+import datetime
+import gzip
+import io
+import json
+import sqlite3
+
+import pytest
+
+from mara_singer.schema import Column, DataType, StructDataType
+from mara_singer.targets.postgres import encode_csv_value, postgres_type
+from mara_singer.targets.sqlite import SQLiteTarget
+
+
+SCHEMA = {
+    "type": ["null", "object"],
+    "properties": {
+        "id": {"type": "integer"},
+        "name": {"type": ["null", "string"]},
+        "tags": {"type": ["null", "array"], "items": {"type": "string"}}
+    }
+}
+
+
+def _messages(*messages) -> io.StringIO:
+    return io.StringIO(''.join(json.dumps(message) + '\n' for message in messages))
+
+
+def test_sqlite_target_merge(tmp_path):
+    database = tmp_path / 'test.db'
+    output = io.StringIO()
+
+    target = SQLiteTarget({'database': str(database), 'batch_size_rows': 2}, output=output)
+    target.process(_messages(
+        {"type": "SCHEMA", "stream": "users", "schema": SCHEMA, "key_properties": ["id"]},
+        {"type": "RECORD", "stream": "users", "record": {"id": 1, "name": "a", "tags": ["x"]}},
+        {"type": "STATE", "value": {"bookmarks": {"users": {"id": 1}}}},
+        {"type": "RECORD", "stream": "users", "record": {"id": 2, "name": "b"}},
+        {"type": "RECORD", "stream": "users", "record": {"id": 1, "name": "c"}},
+        {"type": "STATE", "value": {"bookmarks": {"users": {"id": 2}}}}))
+
+    connection = sqlite3.connect(str(database))
+    assert connection.execute('SELECT id, name, tags FROM users ORDER BY id').fetchall() == [(1, 'c', None), (2, 'b', None)]
+
+    # the state is emitted only after the preceding records are loaded
+    assert [json.loads(line) for line in output.getvalue().splitlines()] == [
+        {"bookmarks": {"users": {"id": 1}}},
+        {"bookmarks": {"users": {"id": 2}}}]
+
+
+def test_postgres_encode_csv_value():
+    assert encode_csv_value(None, Column('c', DataType.TEXT)) == ''
+    assert encode_csv_value('', Column('c', DataType.TEXT)) == '""'
+    assert encode_csv_value('a "b"', Column('c', DataType.TEXT)) == '"a ""b"""'
+    assert encode_csv_value(True, Column('c', DataType.BOOL)) == '"true"'
+    assert encode_csv_value({'a': 1}, Column('c', DataType.JSON)) == '"{""a"": 1}"'
+    assert encode_csv_value(['a', None, 'b"'], Column('c', DataType.TEXT, is_array=True)) == '"{""a"",NULL,""b\\""""}"'
+
+
+def test_postgres_type():
+    assert postgres_type(Column('c', DataType.INT)) == 'BIGINT'
+    assert postgres_type(Column('c', DataType.TEXT, is_array=True)) == 'TEXT[]'
+    assert postgres_type(Column('c', StructDataType(name=None))) == 'JSONB'
+
+
+def test_parquet_target(tmp_path):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    from mara_singer.targets.parquet import ParquetTarget
+
+    schema = {
+        "type": ["null", "object"],
+        "properties": dict(SCHEMA['properties'], **{
+            "updated_at": {"type": ["null", "string"], "format": "date-time"},
+            "address": {"type": ["null", "object"], "properties": {"city": {"type": ["null", "string"]}}}
+        })
+    }
+    output = io.StringIO()
+    target = ParquetTarget({'destination_path': str(tmp_path), 'batch_size_rows': 2}, output=output)
+    target.process(_messages(
+        {"type": "SCHEMA", "stream": "users", "schema": schema, "key_properties": ["id"]},
+        {"type": "RECORD", "stream": "users", "record": {"id": 1, "name": "a", "tags": ["x"], "updated_at": "2020-01-01T10:00:00Z"}},
+        {"type": "RECORD", "stream": "users", "record": {"id": 2, "address": {"city": "Berlin"}}},
+        {"type": "RECORD", "stream": "users", "record": {"id": 3, "updated_at": "2020-01-01T12:00:00+02:00"}},
+        {"type": "STATE", "value": {"bookmarks": {"users": {"id": 3}}}}))
+
+    parquet_file = pyarrow_parquet.ParquetFile(str(tmp_path / 'users.part-00001.parquet'))
+    assert parquet_file.metadata.num_row_groups == 2
+    assert parquet_file.metadata.row_group(0).column(0).compression == 'ZSTD'
+
+    rows = parquet_file.read().to_pylist()
+    assert [row['id'] for row in rows] == [1, 2, 3]
+    assert rows[0]['tags'] == ['x']
+    assert rows[1]['address'] == {'city': 'Berlin'}
+    assert rows[0]['updated_at'] == datetime.datetime(2020, 1, 1, 10, tzinfo=datetime.timezone.utc)
+    assert rows[2]['updated_at'] == datetime.datetime(2020, 1, 1, 10, tzinfo=datetime.timezone.utc)
+    assert json.loads(output.getvalue()) == {"bookmarks": {"users": {"id": 3}}}
+
+
+def test_parquet_target_keeps_previous_runs(tmp_path):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    from mara_singer.targets.parquet import ParquetTarget
+
+    for ids in [[1, 2], [3]]:
+        ParquetTarget({'destination_path': str(tmp_path)}, output=io.StringIO()).process(_messages(
+            {"type": "SCHEMA", "stream": "users", "schema": SCHEMA, "key_properties": ["id"]},
+            *[{"type": "RECORD", "stream": "users", "record": {"id": id}} for id in ids]))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['users.part-00001.parquet', 'users.part-00002.parquet']
+    assert [row['id'] for file_name in ['users.part-00001.parquet', 'users.part-00002.parquet']
+            for row in pyarrow_parquet.read_table(str(tmp_path / file_name)).to_pylist()] == [1, 2, 3]
+
+
+def test_parquet_target_holds_states_until_parts_are_completed(tmp_path):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    from mara_singer.targets.parquet import ParquetTarget
+
+    messages = [{"type": "SCHEMA", "stream": "users", "schema": SCHEMA, "key_properties": ["id"]}]
+    for i in range(100):
+        messages += [{"type": "RECORD", "stream": "users", "record": {"id": i}},
+                     {"type": "STATE", "value": {"bookmarks": {"users": {"id": i}}}}]
+
+    output = io.StringIO()
+    ParquetTarget({'destination_path': str(tmp_path), 'batch_size_rows': 1, 'max_file_records': 40},
+                  output=output).process(_messages(*messages))
+
+    # a new part per 40 records instead of per state; the states are only emitted when the parts are completed
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'users.part-00001.parquet', 'users.part-00002.parquet', 'users.part-00003.parquet']
+    assert [pyarrow_parquet.ParquetFile(str(tmp_path / f'users.part-0000{i}.parquet')).metadata.num_rows for i in [1, 2, 3]] == [40, 40, 20]
+    assert [json.loads(line)['bookmarks']['users']['id'] for line in output.getvalue().splitlines()] == [38, 39, 78, 79, 99]
+
+    # by default, the part is completed at the end of the run
+    (tmp_path / 'default').mkdir()
+    output = io.StringIO()
+    ParquetTarget({'destination_path': str(tmp_path / 'default'), 'batch_size_rows': 1}, output=output).process(_messages(*messages))
+    assert [path.name for path in (tmp_path / 'default').iterdir()] == ['users.part-00001.parquet']
+    assert [json.loads(line)['bookmarks']['users']['id'] for line in output.getvalue().splitlines()] == [99]
+
+
+def test_file_target_rotation(tmp_path):
+    from mara_singer.targets.files import FileTarget
+
+    config = {'destination_path': str(tmp_path), 'format': 'jsonl', 'compression': 'gzip', 'max_file_records': 2}
+    records = [{"type": "RECORD", "stream": "users", "record": {"id": i, "name": f'n{i}'}} for i in range(5)]
+    FileTarget(config, output=io.StringIO()).process(_messages(
+        {"type": "SCHEMA", "stream": "users", "schema": SCHEMA, "key_properties": ["id"]}, *records))
+
+    manifest = json.loads((tmp_path / 'users.manifest.json').read_text())
+    assert [(part['file_name'], part['row_count']) for part in manifest['parts']] == [
+        ('users.part-00001.jsonl.gz', 2), ('users.part-00002.jsonl.gz', 2), ('users.part-00003.jsonl.gz', 1)]
+    assert manifest['parts'][0]['byte_size'] == (tmp_path / 'users.part-00001.jsonl.gz').stat().st_size
+    with gzip.open(tmp_path / 'users.part-00002.jsonl.gz', 'rt') as part_file:
+        assert [json.loads(line)['id'] for line in part_file] == [2, 3]
+
+    # a second run continues the numbering
+    FileTarget(config, output=io.StringIO()).process(_messages(
+        {"type": "SCHEMA", "stream": "users", "schema": SCHEMA, "key_properties": ["id"]}, *records[:1]))
+    manifest = json.loads((tmp_path / 'users.manifest.json').read_text())
+    assert manifest['parts'][-1]['file_name'] == 'users.part-00004.jsonl.gz'
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_file_target_commits_before_state(tmp_path, compression):
+    from mara_singer.targets.files import FileTarget
+
+    class StateOutput(io.StringIO):
+        """Records the manifest when a state is written"""
+        def write(self, data):
+            self.manifests.append(json.loads((tmp_path / 'users.manifest.json').read_text()))
+            return super().write(data)
+
+    StateOutput.manifests = []
+    # a compressed part is only completed for a state when the flush interval passed
+    FileTarget({'destination_path': str(tmp_path), 'compression': compression, 'min_batch_rows': 1, 'flush_interval': 0},
+               output=StateOutput()).process(_messages(
+        {"type": "SCHEMA", "stream": "users", "schema": SCHEMA, "key_properties": ["id"]},
+        {"type": "RECORD", "stream": "users", "record": {"id": 1}},
+        {"type": "STATE", "value": {"bookmarks": {"users": {"id": 1}}}},
+        {"type": "RECORD", "stream": "users", "record": {"id": 2}}))
+
+    # the records before the state are committed to disk and listed in the manifest
+    [part] = StateOutput.manifests[0]['parts']
+    assert part['row_count'] == 1
+    if compression:
+        assert part['byte_size'] == (tmp_path / part['file_name']).stat().st_size
+    else:
+        assert (tmp_path / part['file_name']).read_bytes()[:part['byte_size']].splitlines() == [b'{"id":1}']
+
+
+def test_file_target_holds_states_until_compressed_parts_are_completed(tmp_path):
+    from mara_singer.targets.files import FileTarget
+
+    messages = [{"type": "SCHEMA", "stream": "users", "schema": SCHEMA, "key_properties": ["id"]}]
+    for i in range(100):
+        messages += [{"type": "RECORD", "stream": "users", "record": {"id": i}},
+                     {"type": "STATE", "value": {"bookmarks": {"users": {"id": i}}}}]
+
+    output = io.StringIO()
+    FileTarget({'destination_path': str(tmp_path), 'compression': 'gzip', 'batch_size_rows': 1, 'max_file_records': 40},
+               output=output).process(_messages(*messages))
+
+    manifest = json.loads((tmp_path / 'users.manifest.json').read_text())
+    assert [part['row_count'] for part in manifest['parts']] == [40, 40, 20]
+    assert [json.loads(line)['bookmarks']['users']['id'] for line in output.getvalue().splitlines()] == [38, 39, 78, 79, 99]
+
+
+def test_file_target_csv_zstd(tmp_path):
+    zstandard = pytest.importorskip('zstandard')
+    from mara_singer.targets.files import FileTarget
+
+    FileTarget({'destination_path': str(tmp_path), 'format': 'csv', 'compression': 'zstd'}, output=io.StringIO()).process(_messages(
+        {"type": "SCHEMA", "stream": "users", "schema": SCHEMA, "key_properties": ["id"]},
+        {"type": "RECORD", "stream": "users", "record": {"id": 1, "name": "a,b", "tags": ["x"]}}))
+
+    with open(tmp_path / 'users.part-00001.csv.zst', 'rb') as part_file:
+        content = zstandard.ZstdDecompressor().stream_reader(part_file).read().decode()
+    assert content == 'id,name,tags\n1,"a,b","[""x""]"\n'